@@ -18,7 +18,10 @@ from typing import Callable, Awaitable
 from playwright.async_api import Browser as AsyncBrowser, Playwright as AsyncPlaywright
 
 # --- FIX: Replaced star import with explicit imports ---
-from config import NO_PROXY_ENV, EXCLUDED_MODELS_FILENAME, get_environment_variable
+from config import (
+    NO_PROXY_ENV, EXCLUDED_MODELS_FILENAME, PAGE_POOL_SIZE, ACCOUNT_SHARDING_ENABLED, SAVED_AUTH_DIR,
+    STREAM_TRANSPORT, STREAM_SHM_RING_SIZE, STREAM_WILDCARD_CERT, get_environment_variable
+)
 
 # --- models模块导入 ---
 from models import WebSocketConnectionManager
@@ -32,17 +35,23 @@ from browser_utils import (
     _close_page_logic,
     load_excluded_models,
     _handle_initial_model_state_and_storage,
-    enable_temporary_chat_mode
+    enable_temporary_chat_mode,
+    PagePool,
+    PageSlot,
+    AccountStats
 )
 
 import stream
-from asyncio import Queue, Lock
+from asyncio import Lock
+from .fair_queue import FairRequestQueue
+from .client_connection import DisconnectWatchMiddleware
 from . import auth_utils
 
 # 全局状态变量（这些将在server.py中被引用）
 playwright_manager: Optional[AsyncPlaywright] = None
 browser_instance: Optional[AsyncBrowser] = None
 page_instance = None
+page_pool = None
 is_playwright_ready = False
 is_browser_connected = False
 is_page_ready = False
@@ -68,6 +77,7 @@ log_ws_manager = None
 
 STREAM_QUEUE = None
 STREAM_PROCESS = None
+STREAM_BRIDGE = None
 
 # --- Lifespan Context Manager ---
 def _setup_logging():
@@ -84,7 +94,7 @@ def _setup_logging():
 
 def _initialize_globals():
     import server
-    server.request_queue = Queue()
+    server.request_queue = FairRequestQueue()
     server.processing_lock = Lock()
     server.model_switching_lock = Lock()
     server.params_cache_lock = Lock()
@@ -118,8 +128,16 @@ async def _start_stream_proxy():
             or get_environment_variable('HTTP_PROXY')
         )
         server.logger.info(f"Starting STREAM proxy on port {port} with upstream proxy: {STREAM_PROXY_SERVER_ENV}")
-        server.STREAM_QUEUE = multiprocessing.Queue()
-        server.STREAM_PROCESS = multiprocessing.Process(target=stream.start, args=(server.STREAM_QUEUE, port, STREAM_PROXY_SERVER_ENV))
+        if STREAM_TRANSPORT == 'shm':
+            # 共享内存环形缓冲区，接口与 multiprocessing.Queue 一致
+            from stream.shm_ring import ShmRingQueue
+            server.STREAM_QUEUE = ShmRingQueue(STREAM_SHM_RING_SIZE)
+            server.logger.info(f"STREAM transport: shared memory ring ({STREAM_SHM_RING_SIZE} bytes, {server.STREAM_QUEUE.name})")
+        else:
+            server.STREAM_QUEUE = multiprocessing.Queue()
+        server.STREAM_PROCESS = multiprocessing.Process(
+            target=stream.start, args=(server.STREAM_QUEUE, port, STREAM_PROXY_SERVER_ENV, STREAM_WILDCARD_CERT)
+        )
         server.STREAM_PROCESS.start()
         server.logger.info("STREAM proxy process started. Waiting for 'READY' signal...")
 
@@ -136,6 +154,11 @@ async def _start_stream_proxy():
             server.logger.error("❌ Timed out waiting for STREAM proxy to become ready. Startup will likely fail.")
             raise RuntimeError("STREAM proxy failed to start in time.")
 
+        # 启动转发线程，流数据到达时直接唤醒事件循环中的消费者
+        from .utils_ext.stream import start_stream_bridge
+        server.STREAM_BRIDGE = start_stream_bridge(server.STREAM_QUEUE)
+        server.logger.info("STREAM queue bridge thread started.")
+
 async def _initialize_browser_and_page():
     import server
     from playwright.async_api import async_playwright
@@ -162,21 +185,96 @@ async def _initialize_browser_and_page():
             await _handle_initial_model_state_and_storage(server.page_instance)
             await enable_temporary_chat_mode(server.page_instance)
             server.logger.info("Page initialized successfully.")
+            await _initialize_page_pool()
         else:
             server.logger.error("Page initialization failed.")
     
     if not server.model_list_fetch_event.is_set():
         server.model_list_fetch_event.set()
 
+def _list_shard_auth_files() -> list:
+    """列出多账号分片模式下需要额外加载的认证文件（排除当前激活的认证文件）"""
+    if not os.path.isdir(SAVED_AUTH_DIR):
+        return []
+    active_auth_path = get_environment_variable('ACTIVE_AUTH_JSON_PATH')
+    active_name = os.path.basename(active_auth_path) if active_auth_path else None
+    return [
+        os.path.join(SAVED_AUTH_DIR, name)
+        for name in sorted(os.listdir(SAVED_AUTH_DIR))
+        if name.endswith('.json') and name != active_name
+    ]
+
+async def _initialize_page_pool():
+    """以主页面为槽位 0 构建页面池，并按 PAGE_POOL_SIZE（或多账号分片配置）打开额外页面"""
+    import server
+    active_auth_path = get_environment_variable('ACTIVE_AUTH_JSON_PATH')
+    pool = PagePool()
+    pool.add_slot(PageSlot(
+        0,
+        server.page_instance,
+        params_cache=server.page_params_cache,
+        params_cache_lock=server.params_cache_lock,
+        model_switching_lock=server.model_switching_lock,
+        account=AccountStats(os.path.basename(active_auth_path) if active_auth_path else "active"),
+    ))
+    server.page_pool = pool
+
+    # 每项为 (认证文件路径, 账号名称)；非分片模式下额外页面复用当前认证状态
+    extra_pages = []
+    if ACCOUNT_SHARDING_ENABLED:
+        extra_pages = [(path, os.path.basename(path)) for path in _list_shard_auth_files()]
+        server.logger.info(f"Account sharding enabled: {len(extra_pages)} additional auth profile(s) found in {SAVED_AUTH_DIR}")
+        if not extra_pages:
+            server.logger.warning("Account sharding enabled but no additional auth profiles were found.")
+    else:
+        extra_pages = [(None, None) for _ in range(1, PAGE_POOL_SIZE)]
+
+    for index, (auth_path, account_name) in enumerate(extra_pages, start=1):
+        server.logger.info(f"Initializing pooled page #{index} ({index + 1}/{len(extra_pages) + 1})...")
+        primary_model_id = server.current_ai_studio_model_id
+        try:
+            page, ready = await _initialize_page_logic(server.browser_instance, storage_state_path=auth_path)
+            if not ready:
+                server.logger.warning(f"Pooled page #{index} is not ready, skipping.")
+                continue
+            # 初始模型状态处理会写入全局模型 ID，这里记录到该页面后再恢复主页面的值
+            await _handle_initial_model_state_and_storage(page)
+            await enable_temporary_chat_mode(page)
+            pool.add_slot(PageSlot(
+                index,
+                page,
+                current_model_id=server.current_ai_studio_model_id,
+                account=AccountStats(account_name) if account_name else pool.slots[0].account,
+            ))
+        except Exception as e:
+            server.logger.error(f"Failed to initialize pooled page #{index}: {e}")
+        finally:
+            server.current_ai_studio_model_id = primary_model_id
+
+    # 辅助流启用时为每个页面的 GenerateContent 请求附加请求 ID，辅助流据此按请求分发数据
+    if get_environment_variable('STREAM_PORT') != '0':
+        for slot in pool.slots:
+            await slot.enable_stream_channel_tagging()
+
+    server.logger.info(f"Page pool ready with {pool.size} page(s).")
+
 async def _shutdown_resources():
     import server
     logger = server.logger
     logger.info("Shutting down resources...")
     
+    if server.STREAM_BRIDGE:
+        server.STREAM_BRIDGE.stop()
+        server.STREAM_BRIDGE = None
+
     if server.STREAM_PROCESS:
         server.STREAM_PROCESS.terminate()
         logger.info("STREAM proxy terminated.")
 
+    if STREAM_TRANSPORT == 'shm' and server.STREAM_QUEUE is not None:
+        # 释放共享内存段
+        server.STREAM_QUEUE.close()
+
     if server.worker_task and not server.worker_task.done():
         server.worker_task.cancel()
         try:
@@ -185,6 +283,10 @@ async def _shutdown_resources():
             pass
         logger.info("Worker task stopped.")
 
+    if server.page_pool:
+        await server.page_pool.close_secondary_pages()
+        server.page_pool = None
+
     if server.page_instance:
         await _close_page_logic()
     
@@ -302,6 +404,8 @@ def create_app() -> FastAPI:
     
     # 添加中间件
     app.add_middleware(APIKeyAuthMiddleware)
+    # 最外层：统一监听客户端断开，各处理阶段等待同一个事件
+    app.add_middleware(DisconnectWatchMiddleware)
 
     # 注册路由
     # Import aggregated modular routers
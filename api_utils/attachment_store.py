@@ -0,0 +1,179 @@
+"""
+按内容寻址的附件存储
+
+请求中的 data: URL 与二进制附件按内容的 SHA-256 保存为 upload_files/store/<摘要><扩展名>，所有请求共用：
+  - 原始 data: URL 文本另有摘要索引，多轮对话历史中重复出现的附件只需一次哈希查找，不再解码与写盘；
+  - 请求使用附件时增加引用计数，请求结束后释放；只有未被引用的文件才会被淘汰；
+  - 文件总大小或数量超过上限时按最近使用时间（LRU）淘汰。
+命中率与节省的解码/写入字节数见 /v1/queue。
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config import UPLOAD_FILES_DIR, ATTACHMENT_STORE_MAX_MB, ATTACHMENT_STORE_MAX_FILES
+
+from .utils_ext.files import _extension_for_mime
+
+logger = logging.getLogger("AIStudioProxyServer")
+
+_DATA_URL_PATTERN = re.compile(r"^data:(?P<mime>[^;]+);base64,(?P<data>.*)$", re.DOTALL)
+
+
+class _StoredFile:
+    __slots__ = ("name", "path", "size", "refs", "last_used")
+
+    def __init__(self, name: str, path: str, size: int):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.refs = 0
+        self.last_used = time.time()
+
+
+class AttachmentStore:
+    def __init__(self, root_dir: str, max_bytes: int, max_files: int):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        # 文件名（内容摘要 + 扩展名）-> 文件（按最近使用排序）
+        self._files: "OrderedDict[str, _StoredFile]" = OrderedDict()
+        # data: URL 文本摘要 -> 文件名
+        self._sources: Dict[str, str] = {}
+        # 请求 ID -> 该请求引用的文件名
+        self._held: Dict[str, List[str]] = {}
+        self._total_bytes = 0
+        self._prepared = False
+        self.lookups = 0
+        self.hits = 0
+        self.bytes_avoided = 0
+        self.evictions = 0
+
+    def _prepare(self) -> None:
+        """首次使用时清除上次运行遗留的文件（索引不持久化）"""
+        if self._prepared:
+            return
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._prepared = True
+
+    def _use(self, stored: _StoredFile, req_id: Optional[str]) -> str:
+        stored.last_used = time.time()
+        self._files.move_to_end(stored.name)
+        if req_id is not None:
+            stored.refs += 1
+            self._held.setdefault(req_id, []).append(stored.name)
+        return stored.path
+
+    def _hit(self, name: str, req_id: Optional[str]) -> Optional[str]:
+        stored = self._files.get(name)
+        if stored is None or not os.path.exists(stored.path):
+            return None
+        self.hits += 1
+        self.bytes_avoided += stored.size
+        return self._use(stored, req_id)
+
+    def _store(self, raw_bytes: bytes, name: str, req_id: Optional[str]) -> Optional[str]:
+        path = self._hit(name, req_id)
+        if path is not None:
+            return path
+        self._prepare()
+        path = os.path.join(self.root_dir, name)
+        try:
+            with open(path, 'wb') as f:
+                f.write(raw_bytes)
+        except IOError as e:
+            logger.error(f"错误: 保存附件失败 - {e}")
+            return None
+        stale = self._files.pop(name, None)
+        if stale is not None:
+            self._total_bytes -= stale.size
+        stored = self._files[name] = _StoredFile(name, path, len(raw_bytes))
+        self._total_bytes += stored.size
+        path = self._use(stored, req_id)
+        self._evict()
+        return path
+
+    def put_data_url(self, data_url: str, req_id: Optional[str] = None) -> Optional[str]:
+        """保存 data: URL 内容并返回本地路径；相同的 data: URL 只做一次哈希查找"""
+        self.lookups += 1
+        source_key = hashlib.blake2b(data_url.encode('utf-8'), digest_size=20).hexdigest()
+        name = self._sources.get(source_key)
+        if name is not None:
+            path = self._hit(name, req_id)
+            if path is not None:
+                return path
+
+        match = _DATA_URL_PATTERN.match(data_url)
+        if not match:
+            logger.error("错误: data:URL 格式不正确或不包含 base64 数据。")
+            return None
+        try:
+            decoded_bytes = base64.b64decode(match.group('data'))
+        except binascii.Error as e:
+            logger.error(f"错误: Base64 解码失败 - {e}")
+            return None
+        name = f"{hashlib.sha256(decoded_bytes).hexdigest()}{_extension_for_mime(match.group('mime'))}"
+        path = self._store(decoded_bytes, name, req_id)
+        if path is not None:
+            self._sources[source_key] = name
+        return path
+
+    def put_bytes(self, raw_bytes: bytes, extension: str, req_id: Optional[str] = None) -> Optional[str]:
+        self.lookups += 1
+        return self._store(raw_bytes, f"{hashlib.sha256(raw_bytes).hexdigest()}{extension}", req_id)
+
+    def release(self, req_id: str) -> None:
+        """请求结束：释放其引用的附件，再按上限淘汰"""
+        for name in self._held.pop(req_id, ()):
+            stored = self._files.get(name)
+            if stored is not None and stored.refs > 0:
+                stored.refs -= 1
+        self._evict()
+
+    def _evict(self) -> None:
+        """超过上限时按 LRU 删除未被引用的文件"""
+        if self._total_bytes <= self.max_bytes and len(self._files) <= self.max_files:
+            return
+        for name in list(self._files):
+            if self._total_bytes <= self.max_bytes and len(self._files) <= self.max_files:
+                break
+            stored = self._files[name]
+            if stored.refs > 0:
+                continue
+            del self._files[name]
+            self._total_bytes -= stored.size
+            self.evictions += 1
+            try:
+                os.remove(stored.path)
+            except OSError:
+                pass
+        live = set(self._files)
+        self._sources = {source: name for source, name in self._sources.items() if name in live}
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "files": len(self._files),
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "max_files": self.max_files,
+            "referenced_files": sum(1 for stored in self._files.values() if stored.refs > 0),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            "bytes_avoided": self.bytes_avoided,
+            "evictions": self.evictions,
+        }
+
+
+attachment_store = AttachmentStore(
+    os.path.join(UPLOAD_FILES_DIR, 'store'), ATTACHMENT_STORE_MAX_MB * 1024 * 1024, ATTACHMENT_STORE_MAX_FILES
+)
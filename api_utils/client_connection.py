@@ -1,10 +1,89 @@
 import asyncio
-from typing import Callable, Tuple
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
 from asyncio import Event
 from fastapi import HTTPException, Request
 
+# 请求作用域中保存断开事件的键（由 DisconnectWatchMiddleware 写入）
+DISCONNECT_EVENT_SCOPE_KEY = "aistudio.disconnect_event"
+# 请求作用域中保存响应已完整发送事件的键
+RESPONSE_SENT_SCOPE_KEY = "aistudio.response_sent_event"
+# 未经过中间件的请求对象退回轮询检测的间隔（秒）
+_POLL_INTERVAL_SECONDS = 0.3
+
+
+class DisconnectWatchMiddleware:
+    """ASGI 中间件：包装 receive，收到 http.disconnect 时设置请求作用域中的断开事件。
+
+    请求体读取完毕后，由一个挂起的 receive 调用等待服务器的断开消息，不需要定时唤醒；
+    此后应用对 receive 的调用都等待同一个事件。各处理阶段等待或检查该事件，不再各自轮询连接。
+    响应体最后一段发出后停止监听：服务器此时对 receive 返回的 http.disconnect 不代表客户端断开。
+    """
+
+    def __init__(self, app: Callable[..., Awaitable[None]]):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        event = Event()
+        response_sent = Event()
+        scope[RESPONSE_SENT_SCOPE_KEY] = response_sent
+        listener: Optional[asyncio.Task] = None
+
+        def mark_disconnected() -> None:
+            if not response_sent.is_set():
+                event.set()
+
+        async def listen() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            mark_disconnected()
+
+        async def watched_send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # 先标记再发送：服务器在最后一段发出后即对 receive 返回 http.disconnect
+                response_sent.set()
+                if listener is not None:
+                    listener.cancel()
+            await send(message)
+
+        async def watched_receive() -> Dict[str, Any]:
+            nonlocal listener
+            if listener is not None or event.is_set():
+                await event.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                scope[DISCONNECT_EVENT_SCOPE_KEY] = event
+                mark_disconnected()
+            elif not message.get("more_body", False):
+                # 请求体已完整读取，之后只可能收到断开消息
+                scope[DISCONNECT_EVENT_SCOPE_KEY] = event
+                listener = asyncio.create_task(listen())
+            return message
+
+        try:
+            await self.app(scope, watched_receive, watched_send)
+        finally:
+            if listener is not None:
+                listener.cancel()
+
+
+def get_disconnect_event(http_request: Any) -> Optional[Event]:
+    """返回请求的断开事件；请求未经过中间件（或尚未读取请求体）时返回 None"""
+    event = getattr(http_request, "disconnect_event", None)
+    if event is None:
+        scope = getattr(http_request, "scope", None)
+        event = scope.get(DISCONNECT_EVENT_SCOPE_KEY) if isinstance(scope, dict) else None
+    return event
+
 
 async def test_client_connection(req_id: str, http_request: Request) -> bool:
+    event = get_disconnect_event(http_request)
+    if event is not None:
+        return not event.is_set()
     try:
         if hasattr(http_request, '_receive'):
             try:
@@ -27,45 +106,52 @@ async def test_client_connection(req_id: str, http_request: Request) -> bool:
         return False
 
 
+async def wait_for_disconnect(req_id: str, http_request: Request) -> None:
+    """等待客户端断开：优先等待中间件设置的断开事件，没有事件时退回轮询"""
+    event = get_disconnect_event(http_request)
+    if event is not None:
+        await event.wait()
+        return
+    while await test_client_connection(req_id, http_request):
+        if await http_request.is_disconnected():
+            return
+        await asyncio.sleep(_POLL_INTERVAL_SECONDS)
+
+
 async def setup_disconnect_monitoring(req_id: str, http_request: Request, result_future) -> Tuple[Event, asyncio.Task, Callable]:
     from server import logger
     client_disconnected_event = Event()
+    watch_event = get_disconnect_event(http_request)
+    scope = getattr(http_request, "scope", None)
+    response_sent = scope.get(RESPONSE_SENT_SCOPE_KEY) if isinstance(scope, dict) else None
 
-    async def check_disconnect_periodically():
-        while not client_disconnected_event.is_set():
-            try:
-                is_connected = await test_client_connection(req_id, http_request)
-                if not is_connected:
-                    logger.info(f"[{req_id}] 主动检测到客户端断开连接。")
-                    client_disconnected_event.set()
-                    if not result_future.done():
-                        result_future.set_exception(HTTPException(status_code=499, detail=f"[{req_id}] 客户端关闭了请求"))
-                    break
-
-                if await http_request.is_disconnected():
-                    logger.info(f"[{req_id}] 备用检测到客户端断开连接。")
-                    client_disconnected_event.set()
-                    if not result_future.done():
-                        result_future.set_exception(HTTPException(status_code=499, detail=f"[{req_id}] 客户端关闭了请求"))
-                    break
-                await asyncio.sleep(0.3)
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"[{req_id}] (Disco Check Task) 错误: {e}")
-                client_disconnected_event.set()
-                if not result_future.done():
-                    result_future.set_exception(HTTPException(status_code=500, detail=f"[{req_id}] Internal disconnect checker error: {e}"))
-                break
-
-    disconnect_check_task = asyncio.create_task(check_disconnect_periodically())
+    async def watch_disconnect():
+        try:
+            await wait_for_disconnect(req_id, http_request)
+        except Exception as e:
+            logger.error(f"[{req_id}] (Disco Check Task) 错误: {e}")
+            client_disconnected_event.set()
+            if not result_future.done():
+                result_future.set_exception(HTTPException(status_code=500, detail=f"[{req_id}] Internal disconnect checker error: {e}"))
+            return
+        logger.info(f"[{req_id}] 检测到客户端断开连接。")
+        client_disconnected_event.set()
+        if not result_future.done():
+            result_future.set_exception(HTTPException(status_code=499, detail=f"[{req_id}] 客户端关闭了请求"))
+
+    disconnect_check_task = asyncio.create_task(watch_disconnect())
 
     def check_client_disconnected(stage: str = ""):
-        if client_disconnected_event.is_set():
+        # 直接检查中间件的断开事件：监控任务结束后（如流式生成阶段）仍然有效；
+        # 响应已完整发送后不再检查（之后的清理操作不应因连接关闭而中止）
+        watch_disconnected = (
+            watch_event is not None and watch_event.is_set()
+            and (response_sent is None or not response_sent.is_set())
+        )
+        if client_disconnected_event.is_set() or watch_disconnected:
             logger.info(f"[{req_id}] 在 '{stage}' 检测到客户端断开连接。")
             from models import ClientDisconnectedError
             raise ClientDisconnectedError(f"[{req_id}] Client disconnected at stage: {stage}")
         return False
 
     return client_disconnected_event, disconnect_check_task, check_client_disconnected
-
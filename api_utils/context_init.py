@@ -3,7 +3,7 @@ from models import ChatCompletionRequest
 from .context_types import RequestContext
 
 
-async def initialize_request_context(req_id: str, request: ChatCompletionRequest) -> RequestContext:
+async def initialize_request_context(req_id: str, request: ChatCompletionRequest, page_slot: Any = None) -> RequestContext:
     from server import (
         logger, page_instance, is_page_ready, parsed_model_list,
         current_ai_studio_model_id, model_switching_lock, page_params_cache,
@@ -22,12 +22,23 @@ async def initialize_request_context(req_id: str, request: ChatCompletionRequest
         'model_switching_lock': model_switching_lock,
         'page_params_cache': page_params_cache,
         'params_cache_lock': params_cache_lock,
+        'page_params_state': None,
         'is_streaming': request.stream,
         'model_actually_switched': False,
         'requested_model': request.model,
         'model_id_to_use': None,
         'needs_model_switching': False,
+        'page_slot': page_slot,
     }
 
+    # 页面池模式：使用租用页面自身的页面实例、模型状态与参数缓存
+    if page_slot is not None:
+        context['page'] = page_slot.page
+        context['current_ai_studio_model_id'] = page_slot.current_model_id
+        context['model_switching_lock'] = page_slot.model_switching_lock
+        context['page_params_cache'] = page_slot.params_cache
+        context['params_cache_lock'] = page_slot.params_cache_lock
+        logger.info(f"[{req_id}]   使用页面池页面 #{page_slot.index} (当前模型: {page_slot.current_model_id})")
+
     return context
 
@@ -9,11 +9,14 @@ class RequestContext(TypedDict, total=False):
     parsed_model_list: List[dict]
     current_ai_studio_model_id: Optional[str]
     model_switching_lock: Any
-    page_params_cache: dict
+    page_params_cache: Any
+    page_params_state: Optional[dict]
     params_cache_lock: Any
     is_streaming: bool
     model_actually_switched: bool
     requested_model: Optional[str]
     model_id_to_use: Optional[str]
     needs_model_switching: bool
+    page_slot: Optional[Any]
+    response_cache_key: Optional[str]
 
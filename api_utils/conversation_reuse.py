@@ -0,0 +1,186 @@
+"""
+会话复用：页面保留上一轮对话时，只提交新增的消息
+
+每个页面槽位记录其聊天中已包含的对话指纹（按消息逐条链式哈希，包含模型回复）。新请求的消息前缀
+与页面记录一致时，只把前缀之后新增的 user/tool 消息组合成提示提交，不再清空聊天并重发完整历史；
+不一致时清空聊天并完整重建。
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from config import CONVERSATION_REUSE_ENABLED
+from models import ChatCompletionRequest, Message
+
+# 复用时允许追加的消息角色（system/assistant 出现在新增部分说明历史已被改写）
+_APPENDABLE_ROLES = ('user', 'tool')
+
+
+class ConversationState:
+    """页面聊天中已包含的对话：前 message_count 条消息（含模型回复）的指纹与已提交的提示字节数"""
+
+    def __init__(self, fingerprint: str, message_count: int, held_bytes: int):
+        self.fingerprint = fingerprint
+        self.message_count = message_count
+        self.held_bytes = held_bytes
+
+
+class PendingConversation(ConversationState):
+    """已提交提示、等待记录模型回复的对话"""
+
+    def __init__(self, req_id: str, fingerprint: str, message_count: int, held_bytes: int):
+        super().__init__(fingerprint, message_count, held_bytes)
+        self.req_id = req_id
+
+
+class ReusePlan:
+    def __init__(self, start_index: int, saved_bytes: int):
+        self.start_index = start_index
+        self.saved_bytes = saved_bytes
+
+
+class ReuseStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved_total = 0
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "enabled": CONVERSATION_REUSE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_saved_total": self.bytes_saved_total,
+        }
+
+
+reuse_stats = ReuseStats()
+
+
+def _canonical_arguments(arguments: Any) -> Any:
+    if isinstance(arguments, str):
+        try:
+            return json.loads(arguments)
+        except (json.JSONDecodeError, TypeError):
+            return arguments
+    return arguments
+
+
+def _canonical(role: str, content: Any, tool_calls: List[Dict[str, Any]], tool_call_id: Optional[str]) -> str:
+    if isinstance(content, str):
+        content = content.strip()
+    if tool_calls:
+        # 带函数调用的回复在流式/非流式下 content 的回传方式不同，只比较函数调用
+        content = ""
+    return json.dumps(
+        {"role": role, "content": content or "", "tool_calls": tool_calls, "tool_call_id": tool_call_id},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str,
+    )
+
+
+def _canonical_message(msg: Message) -> str:
+    content = msg.content
+    if isinstance(content, list):
+        content = [item.model_dump(exclude_none=True) if hasattr(item, 'model_dump') else item for item in content]
+    tool_calls = [
+        {"name": call.function.name, "arguments": _canonical_arguments(call.function.arguments)}
+        for call in (msg.tool_calls or [])
+    ]
+    return _canonical(msg.role, content, tool_calls, msg.tool_call_id)
+
+
+def _chain(previous: str, canonical: str) -> str:
+    return hashlib.sha256(f"{previous}\n{canonical}".encode('utf-8')).hexdigest()
+
+
+def prefix_fingerprints(request: ChatCompletionRequest) -> List[str]:
+    """返回长度为 len(messages)+1 的指纹列表，第 k 项对应前 k 条消息（含模型与工具声明）"""
+    seed = json.dumps(
+        {"model": request.model, "tools": request.tools, "tool_choice": request.tool_choice},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    fingerprints = [hashlib.sha256(seed.encode('utf-8')).hexdigest()]
+    for msg in request.messages:
+        fingerprints.append(_chain(fingerprints[-1], _canonical_message(msg)))
+    return fingerprints
+
+
+def match_state(state: Optional[ConversationState], request: ChatCompletionRequest,
+                fingerprints: List[str]) -> Optional[ReusePlan]:
+    """页面记录的对话是请求消息的前缀且新增部分只有 user/tool 消息时返回复用计划"""
+    if state is None:
+        return None
+    start = state.message_count
+    if start >= len(request.messages) or fingerprints[start] != state.fingerprint:
+        return None
+    if any(msg.role not in _APPENDABLE_ROLES for msg in request.messages[start:]):
+        return None
+    return ReusePlan(start, state.held_bytes)
+
+
+def plan_reuse(page_slot: Any, request: ChatCompletionRequest, fingerprints: List[str]) -> Optional[ReusePlan]:
+    """取出页面记录的对话并与请求比对；无论是否命中，页面状态都会在本次提交后改变，记录随即失效"""
+    state = page_slot.conversation
+    page_slot.conversation = None
+    plan = match_state(state, request, fingerprints)
+    if state is not None:
+        if plan is not None:
+            reuse_stats.hits += 1
+            reuse_stats.bytes_saved_total += plan.saved_bytes
+        else:
+            reuse_stats.misses += 1
+    return plan
+
+
+def begin_conversation(page_slot: Any, req_id: str, fingerprints: List[str],
+                       plan: Optional[ReusePlan], prompt: str) -> None:
+    """提示已提交，等待模型回复后再确认页面中的对话"""
+    held_bytes = (plan.saved_bytes if plan else 0) + len(prompt.encode('utf-8'))
+    page_slot.pending_conversation = PendingConversation(req_id, fingerprints[-1], len(fingerprints) - 1, held_bytes)
+
+
+def record_conversation_reply(req_id: str, content: Optional[str],
+                              functions: Optional[List[Dict[str, Any]]] = None) -> None:
+    """记录请求的完整模型回复，页面中的对话随即可被下一轮请求复用"""
+    if not CONVERSATION_REUSE_ENABLED:
+        return
+    from server import page_pool
+    if not page_pool:
+        return
+    page_slot = next((slot for slot in page_pool.slots if slot.current_req_id == req_id), None)
+    pending = page_slot.pending_conversation if page_slot is not None else None
+    if pending is None or pending.req_id != req_id:
+        return
+    tool_calls = [
+        {"name": function.get("name"), "arguments": _canonical_arguments(function.get("params"))}
+        for function in (functions or [])
+    ]
+    reply = _canonical("assistant", content or "", tool_calls, None)
+    page_slot.pending_conversation = None
+    page_slot.conversation = ConversationState(
+        _chain(pending.fingerprint, reply),
+        pending.message_count + 1,
+        pending.held_bytes + len((content or "").encode('utf-8')),
+    )
+
+
+def finish_request(page_slot: Any) -> bool:
+    """请求处理结束时调用，返回页面是否保留了可复用的对话（否则需要清空聊天）"""
+    if page_slot is None:
+        return False
+    if page_slot.pending_conversation is not None:
+        # 未能记录完整回复（出错、断开等），页面内容不可信
+        page_slot.pending_conversation = None
+        page_slot.conversation = None
+    return CONVERSATION_REUSE_ENABLED and page_slot.conversation is not None
+
+
+def preferred_slot_matcher(page_pool: Any, request: ChatCompletionRequest):
+    """返回用于页面池优先选择的判断函数：页面保留的对话是该请求的前缀（页面池只有一个页面时无需计算）"""
+    if not CONVERSATION_REUSE_ENABLED or page_pool.size <= 1:
+        return None
+    if not any(slot.conversation is not None for slot in page_pool.slots):
+        return None
+    fingerprints = prefix_fingerprints(request)
+    return lambda slot: match_state(slot.conversation, request, fingerprints) is not None
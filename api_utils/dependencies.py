@@ -2,11 +2,13 @@
 FastAPI 依赖项模块
 """
 import logging
-from asyncio import Queue, Lock, Event
+from asyncio import Lock, Event
 from typing import Dict, Any, List, Set
 
 from fastapi import Request
 
+from .fair_queue import FairRequestQueue
+
 def get_logger() -> logging.Logger:
     from server import logger
     return logger
@@ -15,7 +17,7 @@ def get_log_ws_manager():
     from server import log_ws_manager
     return log_ws_manager
 
-def get_request_queue() -> Queue:
+def get_request_queue() -> FairRequestQueue:
     from server import request_queue
     return request_queue
 
@@ -41,6 +43,14 @@ def get_page_instance():
     from server import page_instance
     return page_instance
 
+def get_page_pool():
+    from server import page_pool
+    return page_pool
+
+def get_stream_bridge():
+    from server import STREAM_BRIDGE
+    return STREAM_BRIDGE
+
 def get_model_list_fetch_event() -> Event:
     from server import model_list_fetch_event
     return model_list_fetch_event
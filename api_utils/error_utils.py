@@ -32,6 +32,10 @@ def upstream_error(req_id: str, message: str) -> HTTPException:
     return http_error(502, f"[{req_id}] {message}")
 
 
+def too_many_requests(req_id: str, message: str, retry_after_seconds: int = 1) -> HTTPException:
+    return http_error(429, f"[{req_id}] {message}", headers={"Retry-After": str(retry_after_seconds)})
+
+
 def service_unavailable(req_id: str, retry_after_seconds: int = 30) -> HTTPException:
     return http_error(503, f"[{req_id}] 服务当前不可用。请稍后重试。", headers={"Retry-After": str(retry_after_seconds)})
 
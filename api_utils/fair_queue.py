@@ -0,0 +1,361 @@
+"""
+请求队列调度：按优先级与租户（API 密钥）公平分配
+
+替代先进先出的 asyncio.Queue，接口保持兼容（put/get/get_nowait/qsize/empty/task_done）：
+  - 优先级高的请求先出队；
+  - 同一优先级内按租户做赤字轮询（DRR），每轮每个租户按权重获得出队额度，
+    批量提交大量请求的租户不会饿死其他租户的交互请求；
+  - 每个租户排队中的请求数可设上限，超过时入队直接失败（由路由返回 429）。
+
+排队中的请求按 req_id 建立索引，取消时只在原位置留下墓碑标记（O(1)），出队时跳过；
+其余请求的顺序不受影响。断开连接的检测由单个后台清扫任务完成。
+
+模型亲和：按 DRR 应出队的请求需要切换模型时，在同一优先级最早入队的若干请求（公平窗口）中
+优先选择页面已加载模型的请求；每个请求被这样越过的次数有上限，超过后必须按原顺序出队。
+"""
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import math
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set
+
+from fastapi import Request
+
+from config import QUEUE_MAX_DEPTH_PER_KEY, QUEUE_TENANT_WEIGHTS, MODEL_AFFINITY_WINDOW, MODEL_AFFINITY_MAX_SKIPS
+
+from .model_affinity import loaded_models, model_switch_stats
+
+ANONYMOUS_TENANT = "anonymous"
+PRIORITY_HEADER = "X-Priority"
+# 平均服务时间（指数移动平均）的平滑系数与初始值（秒）
+_SERVICE_TIME_ALPHA = 0.2
+_INITIAL_SERVICE_SECONDS = 30.0
+# 已取消（或因模型亲和提前出队）的请求在租户队列中的墓碑标记
+_TOMBSTONE = "_tombstone"
+# 后台清扫排队请求断开连接的间隔（秒）
+_SWEEP_INTERVAL_SECONDS = 1.0
+
+
+class TenantQueueFull(Exception):
+    def __init__(self, tenant: str, depth: int):
+        super().__init__(f"租户 {tenant} 排队请求数已达上限 {depth}")
+        self.tenant = tenant
+        self.depth = depth
+
+
+def request_api_key(http_request: Request) -> Optional[str]:
+    """与 APIKeyAuthMiddleware 相同的密钥来源：Authorization: Bearer 优先，其次 X-API-Key"""
+    auth_header = http_request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        return auth_header[7:]
+    return http_request.headers.get("X-API-Key")
+
+
+def tenant_for_request(http_request: Request) -> str:
+    """租户标识：API 密钥的短哈希（状态接口中不暴露密钥本身）"""
+    api_key = request_api_key(http_request)
+    if not api_key:
+        return ANONYMOUS_TENANT
+    return f"key-{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]}"
+
+
+def tenant_weight(http_request: Request) -> float:
+    api_key = request_api_key(http_request)
+    return QUEUE_TENANT_WEIGHTS.get(api_key, 1.0) if api_key else 1.0
+
+
+def request_priority(http_request: Request, body_priority: Optional[int]) -> int:
+    """请求体的 priority 字段优先，其次 X-Priority 请求头；数值越大越先处理"""
+    if body_priority is not None:
+        return body_priority
+    try:
+        return int(http_request.headers.get(PRIORITY_HEADER, 0))
+    except ValueError:
+        return 0
+
+
+class _PriorityLevel:
+    """同一优先级内各租户的队列与 DRR 状态"""
+
+    def __init__(self):
+        self.queues: Dict[str, Deque[Dict[str, Any]]] = {}
+        self.active: Deque[str] = deque()
+        self.deficit: Dict[str, float] = {}
+        # 未被取消的请求数
+        self.live = 0
+
+    def push(self, tenant: str, item: Dict[str, Any]) -> None:
+        queue = self.queues.get(tenant)
+        if queue is None:
+            queue = self.queues[tenant] = deque()
+            self.active.append(tenant)
+            self.deficit[tenant] = 0.0
+        queue.append(item)
+        self.live += 1
+
+    def _drop_tenant(self, tenant: str) -> None:
+        del self.queues[tenant]
+        del self.deficit[tenant]
+        self.active.popleft()
+
+    def next_tenant(self, weights: Dict[str, float]) -> str:
+        """推进 DRR 状态，返回下一个应出队的租户（其队首为有效请求）"""
+        while True:
+            tenant = self.active[0]
+            queue = self.queues[tenant]
+            while queue and queue[0].get(_TOMBSTONE):
+                queue.popleft()
+            if not queue:
+                # 只剩墓碑的租户直接移出
+                self._drop_tenant(tenant)
+                continue
+            if self.deficit[tenant] < 1:
+                self.deficit[tenant] += weights.get(tenant, 1.0)
+                if self.deficit[tenant] < 1:
+                    self.active.rotate(-1)
+                    continue
+            return tenant
+
+    def pop(self, weights: Dict[str, float]) -> Dict[str, Any]:
+        tenant = self.next_tenant(weights)
+        queue = self.queues[tenant]
+        item = queue.popleft()
+        self.live -= 1
+        self.deficit[tenant] -= 1
+        if not queue:
+            # 队列清空的租户退出本轮，额度不累积
+            self._drop_tenant(tenant)
+        elif self.deficit[tenant] < 1:
+            self.active.rotate(-1)
+        return item
+
+    def oldest(self, limit: int) -> List[Dict[str, Any]]:
+        """按入队顺序返回最早的 limit 个有效请求"""
+        live = ((item for item in queue if not item.get(_TOMBSTONE)) for queue in self.queues.values())
+        return list(itertools.islice(heapq.merge(*live, key=lambda item: item["_seq"]), limit))
+
+
+class FairRequestQueue:
+    def __init__(
+        self,
+        max_depth_per_tenant: int = QUEUE_MAX_DEPTH_PER_KEY,
+        affinity_window: int = MODEL_AFFINITY_WINDOW,
+        affinity_max_skips: int = MODEL_AFFINITY_MAX_SKIPS,
+    ):
+        self.max_depth_per_tenant = max_depth_per_tenant
+        self.affinity_window = affinity_window
+        self.affinity_max_skips = affinity_max_skips
+        self._seq = itertools.count()
+        self._levels: Dict[int, _PriorityLevel] = {}
+        self._depth: Dict[str, int] = {}
+        self._weights: Dict[str, float] = {}
+        self._size = 0
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._getters: Deque[asyncio.Future] = deque()
+        self._unfinished = 0
+        self.service_seconds = _INITIAL_SERVICE_SECONDS
+        self.rejected_total = 0
+
+    # --- asyncio.Queue 兼容接口 ---
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def put_nowait(self, item: Dict[str, Any]) -> None:
+        """入队；item 的 tenant/priority/weight/model 字段决定调度，缺省为匿名租户、优先级 0、不指定模型"""
+        tenant = item.setdefault("tenant", ANONYMOUS_TENANT)
+        priority = item.setdefault("priority", 0)
+        item.setdefault("model", None)
+        depth = self._depth.get(tenant, 0)
+        if self.max_depth_per_tenant > 0 and depth >= self.max_depth_per_tenant:
+            self.rejected_total += 1
+            raise TenantQueueFull(tenant, self.max_depth_per_tenant)
+        self._weights[tenant] = item.get("weight", self._weights.get(tenant, 1.0))
+        level = self._levels.get(priority)
+        if level is None:
+            level = self._levels[priority] = _PriorityLevel()
+        item["_seq"] = next(self._seq)
+        level.push(tenant, item)
+        if "req_id" in item:
+            self._index[item["req_id"]] = item
+        self._depth[tenant] = depth + 1
+        self._size += 1
+        self._unfinished += 1
+        self._wakeup_next()
+
+    async def put(self, item: Dict[str, Any]) -> None:
+        self.put_nowait(item)
+
+    def get_nowait(self) -> Dict[str, Any]:
+        if self._size == 0:
+            raise asyncio.QueueEmpty
+        priority = max(p for p, level in self._levels.items() if level.live)
+        level = self._levels[priority]
+        item = self._pick_same_model(priority, level) if self.affinity_window > 0 else None
+        if item is None:
+            item = level.pop(self._weights)
+        self._index.pop(item.get("req_id"), None)
+        self._discard(priority, item["tenant"])
+        return item
+
+    def _pick_same_model(self, priority: int, level: _PriorityLevel) -> Optional[Dict[str, Any]]:
+        """DRR 的下一个请求需要切换模型时，在公平窗口内找页面已加载模型的请求提前出队"""
+        head = level.queues[level.next_tenant(self._weights)][0]
+        if head["model"] is None or head.get("affinity_skips", 0) >= self.affinity_max_skips:
+            return None
+        targets: Set[str] = loaded_models()
+        if not targets or head["model"] in targets:
+            return None
+        candidate = next(
+            (item for item in level.oldest(self.affinity_window) if item["model"] in targets), None
+        )
+        if candidate is None:
+            return None
+        head["affinity_skips"] = head.get("affinity_skips", 0) + 1
+        model_switch_stats.record_avoided(candidate["model"], head["model"])
+        # 在原位置留下墓碑，并按 DRR 扣除其租户的额度
+        candidate[_TOMBSTONE] = True
+        level.live -= 1
+        level.deficit[candidate["tenant"]] -= 1
+        return candidate
+
+    def _discard(self, priority: int, tenant: str) -> None:
+        """请求出队或被取消后更新计数"""
+        level = self._levels.get(priority)
+        if level is not None and not level.live:
+            del self._levels[priority]
+        self._depth[tenant] -= 1
+        if not self._depth[tenant]:
+            del self._depth[tenant]
+            self._weights.pop(tenant, None)
+        self._size -= 1
+
+    def cancel(self, req_id: str) -> Optional[Dict[str, Any]]:
+        """取消排队中的请求：在原位置留下墓碑（O(1)），返回被取消的请求；不在队列中时返回 None"""
+        item = self._index.pop(req_id, None)
+        if item is None:
+            return None
+        item["cancelled"] = True
+        item[_TOMBSTONE] = True
+        self._levels[item["priority"]].live -= 1
+        self._discard(item["priority"], item["tenant"])
+        return item
+
+    def __contains__(self, req_id: str) -> bool:
+        return req_id in self._index
+
+    async def get(self) -> Dict[str, Any]:
+        while self.empty():
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except BaseException:
+                getter.cancel()
+                try:
+                    self._getters.remove(getter)
+                except ValueError:
+                    pass
+                if not self.empty() and not getter.cancelled():
+                    self._wakeup_next()
+                raise
+        return self.get_nowait()
+
+    def task_done(self) -> None:
+        self._unfinished = max(0, self._unfinished - 1)
+
+    def _wakeup_next(self) -> None:
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                break
+
+    # --- 状态与估算 ---
+
+    def record_service_time(self, seconds: float) -> None:
+        """Worker 处理完一个请求后调用，用于估算等待时间"""
+        self.service_seconds += _SERVICE_TIME_ALPHA * (seconds - self.service_seconds)
+
+    def items(self) -> Iterator[Dict[str, Any]]:
+        """按优先级遍历排队中的请求（同一租户内保持先后顺序）"""
+        for priority in sorted(self._levels, reverse=True):
+            for queue in self._levels[priority].queues.values():
+                yield from (item for item in queue if not item.get(_TOMBSTONE))
+
+    def estimated_wait_seconds(self, tenant: str, concurrency: int = 1) -> float:
+        """租户当前最后一个排队请求的预计等待时间：按 DRR 份额估算在它之前出队的请求数"""
+        depth = self._depth.get(tenant, 0)
+        if depth == 0:
+            return 0.0
+        weight = self._weights.get(tenant, 1.0)
+        ahead = 0.0
+        for other, other_depth in self._depth.items():
+            if other == tenant:
+                ahead += depth
+            else:
+                ahead += min(other_depth, math.ceil(depth * self._weights.get(other, 1.0) / weight))
+        return round(ahead * self.service_seconds / max(1, concurrency), 1)
+
+    def retry_after_seconds(self, tenant: str, concurrency: int = 1) -> int:
+        """租户队列已满时建议的重试间隔：约为其下一个请求出队所需时间"""
+        depth = self._depth.get(tenant, 0)
+        if depth == 0:
+            return 1
+        return max(1, math.ceil(self.estimated_wait_seconds(tenant, concurrency) / depth))
+
+    def tenant_status(self, concurrency: int = 1) -> List[Dict[str, Any]]:
+        priorities: Dict[str, set] = {}
+        for priority, level in self._levels.items():
+            for tenant in level.queues:
+                priorities.setdefault(tenant, set()).add(priority)
+        return sorted([
+            {
+                "tenant": tenant,
+                "depth": depth,
+                "weight": self._weights.get(tenant, 1.0),
+                "priorities": sorted(priorities.get(tenant, ()), reverse=True),
+                "estimated_wait_seconds": self.estimated_wait_seconds(tenant, concurrency),
+            }
+            for tenant, depth in self._depth.items()
+        ], key=lambda entry: entry["depth"], reverse=True)
+
+    def status(self, concurrency: int = 1) -> Dict[str, Any]:
+        return {
+            "max_depth_per_tenant": self.max_depth_per_tenant,
+            "affinity_window": self.affinity_window,
+            "affinity_max_skips": self.affinity_max_skips,
+            "avg_service_seconds": round(self.service_seconds, 1),
+            "rejected_total": self.rejected_total,
+            "tenants": self.tenant_status(concurrency),
+        }
+
+
+async def sweep_disconnected_requests(request_queue: FairRequestQueue, logger: Any) -> None:
+    """后台清扫：检查所有排队请求的断开事件，已断开的请求就地取消，不改变其余请求的顺序"""
+    from .client_connection import test_client_connection
+    from .error_utils import client_disconnected
+
+    while True:
+        await asyncio.sleep(_SWEEP_INTERVAL_SECONDS)
+        for item in list(request_queue.items()):
+            http_request = item.get("http_request")
+            if http_request is None:
+                continue
+            req_id = item.get("req_id", "unknown")
+            try:
+                disconnected = not await test_client_connection(req_id, http_request)
+            except Exception as check_err:
+                logger.error(f"[{req_id}] (Queue Sweeper) Error checking disconnect: {check_err}")
+                continue
+            if disconnected and request_queue.cancel(req_id) is not None:
+                logger.info(f"[{req_id}] (Queue Sweeper) 检测到客户端已断开，取消排队中的请求。")
+                future = item.get("result_future")
+                if future and not future.done():
+                    future.set_exception(client_disconnected(req_id, "Client disconnected while queued."))
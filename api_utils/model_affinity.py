@@ -0,0 +1,108 @@
+"""
+模型亲和调度：减少相邻请求之间的模型切换
+
+切换模型需要改写 localStorage 并重新加载新聊天页面，交替请求不同模型（pro, flash, pro, flash）
+时每个请求都要付出这一开销。请求队列出队时在有限的公平窗口内优先选择与页面当前模型相同的请求，
+使同一模型的请求连续执行；页面池租用页面时优先选择已加载该模型的页面。
+这里记录各模型对之间的切换耗时以及因重排而避免的切换次数，汇总见 /v1/queue。
+"""
+
+from typing import Any, Dict, Optional, Set, Tuple
+
+from config import MODEL_NAME
+
+
+def request_model_id(request: Any) -> Optional[str]:
+    """请求指定的 AI Studio 模型 ID；未指定或使用代理默认模型名时返回 None（使用页面当前模型，无需切换）"""
+    model = getattr(request, "model", None)
+    if not model or model == MODEL_NAME:
+        return None
+    return model.split('/')[-1]
+
+
+def loaded_models() -> Set[str]:
+    """页面当前加载的模型：优先取空闲页面，所有页面都忙时取全部页面"""
+    import server
+    page_pool = server.page_pool
+    if page_pool and page_pool.slots:
+        slots = [slot for slot in page_pool.slots if not slot.busy] or page_pool.slots
+        return {slot.current_model_id for slot in slots if slot.current_model_id}
+    return {server.current_ai_studio_model_id} if server.current_ai_studio_model_id else set()
+
+
+def model_slot_matcher(page_pool: Any, model_id: Optional[str]):
+    """返回用于页面池优先选择的判断函数：页面已加载请求的模型（页面池只有一个页面时无需判断）"""
+    if not model_id or page_pool.size <= 1:
+        return None
+    return lambda slot: slot.current_model_id == model_id
+
+
+class ModelSwitchStats:
+    """模型切换次数与耗时（按模型对统计），以及调度重排避免的切换"""
+
+    def __init__(self):
+        self.switches = 0
+        self.failed_switches = 0
+        self.switches_avoided = 0
+        self.estimated_seconds_saved = 0.0
+        self._pairs: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._paths: Dict[str, Dict[str, float]] = {}
+        self._total_seconds = 0.0
+
+    def record_attempt(self, path: str, seconds: float, ok: bool) -> None:
+        """记录一次切换尝试（fast: 页面内模型选择器，navigation: 改写 localStorage 后重新加载页面）"""
+        stats = self._paths.setdefault(path, {"attempts": 0, "failures": 0, "total_seconds": 0.0})
+        stats["attempts"] += 1
+        stats["total_seconds"] += seconds
+        if not ok:
+            stats["failures"] += 1
+
+    def record_switch(self, from_model: Optional[str], to_model: str, seconds: float, ok: bool) -> None:
+        if not ok:
+            self.failed_switches += 1
+            return
+        self.switches += 1
+        self._total_seconds += seconds
+        pair = self._pairs.setdefault((str(from_model), to_model), {"count": 0, "total_seconds": 0.0})
+        pair["count"] += 1
+        pair["total_seconds"] += seconds
+
+    def switch_cost(self, from_model: Optional[str], to_model: str) -> Optional[float]:
+        """模型对的平均切换耗时；该模型对尚无记录时使用所有切换的平均值"""
+        pair = self._pairs.get((str(from_model), to_model))
+        if pair:
+            return pair["total_seconds"] / pair["count"]
+        return self._total_seconds / self.switches if self.switches else None
+
+    def record_avoided(self, from_model: str, to_model: str) -> None:
+        self.switches_avoided += 1
+        self.estimated_seconds_saved += self.switch_cost(from_model, to_model) or 0.0
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "switches": self.switches,
+            "failed_switches": self.failed_switches,
+            "switches_avoided": self.switches_avoided,
+            "estimated_seconds_saved": round(self.estimated_seconds_saved, 1),
+            "avg_switch_seconds": round(self._total_seconds / self.switches, 2) if self.switches else None,
+            "paths": {
+                path: {
+                    "attempts": stats["attempts"],
+                    "failures": stats["failures"],
+                    "avg_seconds": round(stats["total_seconds"] / stats["attempts"], 2),
+                }
+                for path, stats in sorted(self._paths.items())
+            },
+            "pairs": [
+                {
+                    "from": from_model,
+                    "to": to_model,
+                    "count": pair["count"],
+                    "avg_seconds": round(pair["total_seconds"] / pair["count"], 2),
+                }
+                for (from_model, to_model), pair in sorted(self._pairs.items())
+            ],
+        }
+
+
+model_switch_stats = ModelSwitchStats()
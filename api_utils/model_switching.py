@@ -1,8 +1,13 @@
+import time
 from typing import Tuple
 from fastapi import HTTPException
 from playwright.async_api import Page as AsyncPage
 
+from config import MODEL_FAST_SWITCH_ENABLED
+
 from .context_types import RequestContext
+from .model_affinity import model_switch_stats
+from .pacing import pacing
 
 
 async def analyze_model_requirements(req_id: str, context: RequestContext, requested_model: str, proxy_model_name: str) -> RequestContext:
@@ -36,42 +41,70 @@ async def handle_model_switching(req_id: str, context: RequestContext) -> Reques
     page = context['page']
     model_switching_lock = context['model_switching_lock']
     model_id_to_use = context['model_id_to_use']
+    page_slot = context.get('page_slot')
 
     import server
     async with model_switching_lock:
-        if server.current_ai_studio_model_id != model_id_to_use:
-            logger.info(f"[{req_id}] 准备切换模型: {server.current_ai_studio_model_id} -> {model_id_to_use}")
-            from browser_utils import switch_ai_studio_model
-            switch_success = await switch_ai_studio_model(page, model_id_to_use, req_id)
+        # 页面池模式下模型状态按页面维护（槽位 0 与全局状态同步）
+        current_model_id = page_slot.current_model_id if page_slot is not None else server.current_ai_studio_model_id
+        if current_model_id != model_id_to_use:
+            logger.info(f"[{req_id}] 准备切换模型: {current_model_id} -> {model_id_to_use}")
+            switch_started = time.monotonic()
+            switch_success = await _switch_model(req_id, page, model_id_to_use)
+            model_switch_stats.record_switch(current_model_id, model_id_to_use, time.monotonic() - switch_started, switch_success)
             if switch_success:
-                server.current_ai_studio_model_id = model_id_to_use
+                if page_slot is not None:
+                    page_slot.current_model_id = model_id_to_use
+                    # 页面中的对话已不再与记录的对话一致
+                    page_slot.conversation = None
+                else:
+                    server.current_ai_studio_model_id = model_id_to_use
                 context['model_actually_switched'] = True
                 context['current_ai_studio_model_id'] = model_id_to_use
-                logger.info(f"[{req_id}] ✅ 模型切换成功: {server.current_ai_studio_model_id}")
+                logger.info(f"[{req_id}] ✅ 模型切换成功: {model_id_to_use}")
             else:
-                await _handle_model_switch_failure(req_id, page, model_id_to_use, server.current_ai_studio_model_id, logger)
+                await _handle_model_switch_failure(req_id, page, model_id_to_use, current_model_id, logger, page_slot)
 
     return context
 
 
-async def _handle_model_switch_failure(req_id: str, page: AsyncPage, model_id_to_use: str, model_before_switch: str, logger) -> None:
+async def _switch_model(req_id: str, page: AsyncPage, model_id: str) -> bool:
+    """先尝试页面内快速切换，未通过验证时回退到导航切换；两种方式的耗时分别计入请求阶段耗时"""
+    from browser_utils import fast_switch_ai_studio_model, switch_ai_studio_model
+    timings = pacing.timings(req_id)
+    if MODEL_FAST_SWITCH_ENABLED:
+        started = time.monotonic()
+        with timings.measure("model_switch_fast"):
+            switched = await fast_switch_ai_studio_model(page, model_id, req_id)
+        model_switch_stats.record_attempt("fast", time.monotonic() - started, switched)
+        if switched:
+            return True
+    started = time.monotonic()
+    with timings.measure("model_switch_navigation"):
+        switched = await switch_ai_studio_model(page, model_id, req_id)
+    model_switch_stats.record_attempt("navigation", time.monotonic() - started, switched)
+    return switched
+
+
+async def _handle_model_switch_failure(req_id: str, page: AsyncPage, model_id_to_use: str, model_before_switch: str, logger, page_slot=None) -> None:
     import server
     logger.warning(f"[{req_id}] ❌ 模型切换至 {model_id_to_use} 失败。")
-    server.current_ai_studio_model_id = model_before_switch
+    if page_slot is not None:
+        page_slot.current_model_id = model_before_switch
+    else:
+        server.current_ai_studio_model_id = model_before_switch
     from .error_utils import http_error
     raise http_error(422, f"[{req_id}] 未能切换到模型 '{model_id_to_use}'。请确保模型可用。")
 
 
 async def handle_parameter_cache(req_id: str, context: RequestContext) -> None:
-    logger = context['logger']
+    """取出页面当前模型的参数状态；模型变化后先按页面当前值刷新，而不是整体清空"""
     params_cache_lock = context['params_cache_lock']
     page_params_cache = context['page_params_cache']
-    current_ai_studio_model_id = context['current_ai_studio_model_id']
-    model_actually_switched = context['model_actually_switched']
 
     async with params_cache_lock:
-        cached_model_for_params = page_params_cache.get("last_known_model_id_for_params")
-        if model_actually_switched or (current_ai_studio_model_id != cached_model_for_params):
-            logger.info(f"[{req_id}] 模型已更改，参数缓存失效。")
-            page_params_cache.clear()
-            page_params_cache["last_known_model_id_for_params"] = current_ai_studio_model_id
+        state = page_params_cache.activate(context['current_ai_studio_model_id'], context['model_actually_switched'])
+        if page_params_cache.needs_refresh:
+            context['logger'].info(f"[{req_id}] 模型已更改，按页面当前值刷新参数状态。")
+            await page_params_cache.refresh(context['page'], req_id)
+    context['page_params_state'] = state
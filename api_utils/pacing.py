@@ -0,0 +1,163 @@
+"""
+请求节奏控制：按页面实际状态决定何时提交下一个请求
+
+替代相邻流式请求之间固定的 0.5~1 秒等待：
+  - 上一请求的 GenerateContent 网络请求已结束、辅助流默认队列已排空时即可提交；
+  - 同一页面相邻请求的最小间隔按近期错误自适应：出错时加倍（不超过上限），
+    成功时按近期错误率逐步回落到下限，无错误时不额外等待；
+  - 记录每个请求各阶段的耗时（排队、租用页面、节奏等待、参数调整、提交等），汇总见 /v1/queue。
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from config import PACING_MIN_GAP_SECONDS, PACING_MAX_GAP_SECONDS, PACING_READY_TIMEOUT_SECONDS
+
+logger = logging.getLogger("AIStudioProxyServer")
+
+# 出错后最小间隔至少增加到下限加该值（秒），之后每次出错加倍
+_ERROR_GAP_STEP_SECONDS = 0.5
+# 无错误时每个成功请求使最小间隔减少的量（秒），按近期错误率折减
+_SUCCESS_GAP_DECREASE_SECONDS = 0.25
+# 计算近期错误率的请求数窗口
+_OUTCOME_WINDOW = 20
+# 状态接口中保留的最近请求耗时记录数
+_RECENT_TIMINGS = 20
+
+
+class RequestTimings:
+    """单个请求各阶段的耗时（秒）"""
+
+    def __init__(self, req_id: str):
+        self.req_id = req_id
+        self.started = time.monotonic()
+        self.phases: Dict[str, float] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(phase, time.monotonic() - start)
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "req_id": self.req_id,
+            "total_seconds": round(time.monotonic() - self.started, 3),
+            "phases": {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+        }
+
+
+class PacingController:
+    def __init__(self, min_gap_seconds: float, max_gap_seconds: float, ready_timeout_seconds: float):
+        self.min_gap_seconds = min_gap_seconds
+        self.max_gap_seconds = max_gap_seconds
+        self.ready_timeout_seconds = ready_timeout_seconds
+        self.gap_seconds = min_gap_seconds
+        self.ready_timeouts = 0
+        self._outcomes: Deque[bool] = deque(maxlen=_OUTCOME_WINDOW)
+        self._last_finished: Dict[int, float] = {}
+        self._active: Dict[str, RequestTimings] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=_RECENT_TIMINGS)
+        self._phase_totals: Dict[str, float] = {}
+        self._phase_counts: Dict[str, int] = {}
+
+    # --- 耗时记录 ---
+
+    def timings(self, req_id: str) -> RequestTimings:
+        """返回请求的耗时记录（不存在时创建）"""
+        timings = self._active.get(req_id)
+        if timings is None:
+            timings = self._active[req_id] = RequestTimings(req_id)
+        return timings
+
+    def finish_timings(self, req_id: str) -> None:
+        timings = self._active.pop(req_id, None)
+        if timings is None:
+            return
+        for phase, seconds in timings.phases.items():
+            self._phase_totals[phase] = self._phase_totals.get(phase, 0.0) + seconds
+            self._phase_counts[phase] = self._phase_counts.get(phase, 0) + 1
+        self._recent.append(timings.to_status())
+
+    # --- 节奏控制 ---
+
+    @property
+    def recent_error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for ok in self._outcomes if not ok) / len(self._outcomes)
+
+    async def wait_until_ready(self, req_id: str, page_slot: Optional[Any]) -> None:
+        """等待页面可以提交下一个请求：满足最小间隔、上一请求的 GenerateContent 已结束、辅助流默认队列已排空"""
+        with self.timings(req_id).measure("pacing_wait"):
+            page_key = page_slot.index if page_slot is not None else 0
+            last_finished = self._last_finished.get(page_key)
+            if last_finished is not None:
+                remaining = self.gap_seconds - (time.monotonic() - last_finished)
+                if remaining > 0:
+                    logger.info(f"[{req_id}] 请求节奏: 近期错误率 {self.recent_error_rate:.0%}，等待 {remaining:.2f}s")
+                    await asyncio.sleep(remaining)
+
+            if page_slot is not None and not page_slot.generate_idle.is_set():
+                try:
+                    await asyncio.wait_for(page_slot.generate_idle.wait(), timeout=self.ready_timeout_seconds)
+                except asyncio.TimeoutError:
+                    self.ready_timeouts += 1
+                    logger.warning(
+                        f"[{req_id}] 请求节奏: 页面 #{page_slot.index} 仍有 {page_slot.generate_inflight} 个 "
+                        f"GenerateContent 请求未结束，等待 {self.ready_timeout_seconds}s 超时，继续处理"
+                    )
+
+            from server import STREAM_BRIDGE
+            # 只有本请求的通道打开时，默认队列中的数据必然来自已结束的请求
+            if STREAM_BRIDGE is not None and set(STREAM_BRIDGE.channels) <= {req_id}:
+                dropped = STREAM_BRIDGE.drain()
+                if dropped:
+                    logger.info(f"[{req_id}] 请求节奏: 丢弃辅助流默认队列中 {dropped} 条残留数据")
+
+    def record_outcome(self, req_id: str, page_slot: Optional[Any], ok: Optional[bool]) -> None:
+        """请求在页面上处理结束后调用；ok 为 None 表示结果与页面状态无关（如客户端断开），不参与学习"""
+        self._last_finished[page_slot.index if page_slot is not None else 0] = time.monotonic()
+        if ok is None:
+            return
+        self._outcomes.append(ok)
+        previous = self.gap_seconds
+        if ok:
+            decrease = _SUCCESS_GAP_DECREASE_SECONDS * (1 - self.recent_error_rate)
+            self.gap_seconds = max(self.min_gap_seconds, self.gap_seconds - decrease)
+        else:
+            self.gap_seconds = min(
+                self.max_gap_seconds,
+                max(self.gap_seconds * 2, self.min_gap_seconds + _ERROR_GAP_STEP_SECONDS),
+            )
+        if self.gap_seconds != previous and not ok:
+            logger.warning(f"[{req_id}] 请求节奏: 请求出错，相邻请求最小间隔调整为 {self.gap_seconds:.2f}s")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "gap_seconds": round(self.gap_seconds, 3),
+            "min_gap_seconds": self.min_gap_seconds,
+            "max_gap_seconds": self.max_gap_seconds,
+            "recent_error_rate": round(self.recent_error_rate, 3),
+            "ready_timeouts": self.ready_timeouts,
+            "phase_avg_seconds": {
+                phase: round(total / self._phase_counts[phase], 3)
+                for phase, total in sorted(self._phase_totals.items())
+            },
+            "phase_total_seconds": {
+                phase: round(total, 3) for phase, total in sorted(self._phase_totals.items())
+            },
+            "recent_requests": list(self._recent),
+        }
+
+
+pacing = PacingController(PACING_MIN_GAP_SECONDS, PACING_MAX_GAP_SECONDS, PACING_READY_TIMEOUT_SECONDS)
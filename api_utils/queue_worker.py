@@ -8,7 +8,6 @@ import time
 from fastapi import HTTPException
 from typing import Any, Dict, Optional, Tuple
 from .error_utils import (
-    client_disconnected,
     client_cancelled,
     processing_timeout,
     server_error,
@@ -29,8 +28,8 @@ async def queue_worker() -> None:
     # 检查并初始化全局变量
     if request_queue is None:
         logger.info("初始化 request_queue...")
-        from asyncio import Queue
-        request_queue = Queue()
+        from api_utils.fair_queue import FairRequestQueue
+        request_queue = FairRequestQueue()
     
     if processing_lock is None:
         logger.info("初始化 processing_lock...")
@@ -47,55 +46,74 @@ async def queue_worker() -> None:
         from asyncio import Lock
         params_cache_lock = Lock()
     
-    was_last_request_streaming = False
-    last_request_completion_time = 0
-    
+    # 单个后台任务检测所有排队请求的客户端连接
+    from api_utils.fair_queue import sweep_disconnected_requests
+    sweeper_task = asyncio.create_task(sweep_disconnected_requests(request_queue, logger))
+
+    # 页面池模式：每个页面对应一个 Worker，并行消费同一请求队列
+    from server import page_pool
+    worker_count = page_pool.size if page_pool else 1
+    try:
+        if worker_count <= 1:
+            await _queue_worker_loop(0, request_queue, processing_lock)
+        else:
+            if not _is_parallel_processing_enabled():
+                logger.warning(f"页面池包含 {worker_count} 个页面，但辅助流数据无法按请求分发，请求生成阶段仍将串行执行。")
+            logger.info(f"--- 页面池模式：启动 {worker_count} 个并行 Worker ---")
+            await asyncio.gather(*(
+                _queue_worker_loop(worker_index, request_queue, processing_lock)
+                for worker_index in range(worker_count)
+            ))
+    finally:
+        sweeper_task.cancel()
+
+
+def _is_parallel_processing_enabled() -> bool:
+    """页面池包含多个页面，且未启用辅助流或辅助流可按请求分发数据时，各页面可并行处理请求"""
+    from server import page_pool, STREAM_BRIDGE
+    from config import get_environment_variable
+    if not page_pool or page_pool.size <= 1:
+        return False
+    if get_environment_variable('STREAM_PORT') == '0':
+        return True
+    return STREAM_BRIDGE is not None and page_pool.stream_channels_ready
+
+
+def _select_processing_lock(page_slot, processing_lock):
+    """串行模式下使用全局处理锁，并行模式下使用租用页面自身的锁"""
+    if page_slot is None or not _is_parallel_processing_enabled():
+        return processing_lock
+    return page_slot.processing_lock
+
+
+def _request_outcome(result_future, page_error: Optional[str]) -> Optional[bool]:
+    """页面报错或服务端错误视为失败；客户端断开、取消等与页面状态无关的结果返回 None"""
+    if page_error:
+        return False
+    if not result_future.done() or result_future.cancelled():
+        return None
+    error = result_future.exception()
+    if error is None:
+        return True
+    return False if getattr(error, "status_code", 500) >= 500 else None
+
+
+async def _queue_worker_loop(worker_index: int, request_queue, processing_lock) -> None:
+    """单个 Worker 的主循环"""
+    from server import logger
+
+    if worker_index > 0:
+        logger.info(f"--- 队列 Worker #{worker_index} 已启动 ---")
+
     while True:
         request_item = None
         result_future = None
         req_id = "UNKNOWN"
         completion_event = None
+        page_slot = None
+        stream_channel_key = None
         
         try:
-            # 检查队列中的项目，清理已断开连接的请求
-            queue_size = request_queue.qsize()
-            if queue_size > 0:
-                checked_count = 0
-                items_to_requeue = []
-                processed_ids = set()
-                
-                while checked_count < queue_size and checked_count < 10:
-                    try:
-                        item = request_queue.get_nowait()
-                        item_req_id = item.get("req_id", "unknown")
-                        
-                        if item_req_id in processed_ids:
-                            items_to_requeue.append(item)
-                            continue
-                            
-                        processed_ids.add(item_req_id)
-                        
-                        if not item.get("cancelled", False):
-                            item_http_request = item.get("http_request")
-                            if item_http_request:
-                                try:
-                                    if await item_http_request.is_disconnected():
-                                        logger.info(f"[{item_req_id}] (Worker Queue Check) 检测到客户端已断开，标记为取消。")
-                                        item["cancelled"] = True
-                                        item_future = item.get("result_future")
-                                        if item_future and not item_future.done():
-                                            item_future.set_exception(client_disconnected(item_req_id, "Client disconnected while queued."))
-                                except Exception as check_err:
-                                    logger.error(f"[{item_req_id}] (Worker Queue Check) Error checking disconnect: {check_err}")
-                        
-                        items_to_requeue.append(item)
-                        checked_count += 1
-                    except asyncio.QueueEmpty:
-                        break
-                
-                for item in items_to_requeue:
-                    await request_queue.put(item)
-            
             # 获取下一个请求
             try:
                 request_item = await asyncio.wait_for(request_queue.get(), timeout=5.0)
@@ -120,6 +138,7 @@ async def queue_worker() -> None:
 
             # 优化：在开始处理前主动检测客户端连接状态，避免不必要的处理
             from api_utils.request_processor import _test_client_connection
+            from api_utils.client_connection import wait_for_disconnect
             is_connected = await _test_client_connection(req_id, http_request)
             if not is_connected:
                 logger.info(f"[{req_id}] (Worker) ✅ 主动检测到客户端已断开，跳过处理节省资源")
@@ -128,13 +147,6 @@ async def queue_worker() -> None:
                 request_queue.task_done()
                 continue
             
-            # 流式请求间隔控制
-            current_time = time.time()
-            if was_last_request_streaming and is_streaming_request and (current_time - last_request_completion_time < 1.0):
-                delay_time = max(0.5, 1.0 - (current_time - last_request_completion_time))
-                logger.info(f"[{req_id}] (Worker) 连续流式请求，添加 {delay_time:.2f}s 延迟...")
-                await asyncio.sleep(delay_time)
-            
             # 等待锁前再次主动检测客户端连接
             is_connected = await _test_client_connection(req_id, http_request)
             if not is_connected:
@@ -144,9 +156,31 @@ async def queue_worker() -> None:
                 request_queue.task_done()
                 continue
             
+            # 记录各阶段耗时；相邻请求的间隔由请求节奏控制按页面状态决定，不再固定等待
+            from api_utils.pacing import pacing
+            timings = pacing.timings(req_id)
+            timings.add("queue_wait", time.time() - request_item.get("enqueue_time", time.time()))
+
+            from server import page_pool
+            if page_pool:
+                from api_utils.conversation_reuse import preferred_slot_matcher
+                from api_utils.model_affinity import model_slot_matcher
+                # 优先保留了该请求对话的页面，其次已加载请求模型的页面
+                prefer = preferred_slot_matcher(page_pool, request_data) or model_slot_matcher(page_pool, request_item.get("model"))
+                with timings.measure("page_acquire"):
+                    page_slot = await page_pool.acquire(req_id, prefer=prefer)
+            # 在页面发出请求前打开该请求的辅助流通道
+            from api_utils.utils_ext import open_stream_channel
+            open_stream_channel(req_id)
+            stream_channel_key = req_id
+            active_lock = _select_processing_lock(page_slot, processing_lock)
+
             logger.info(f"[{req_id}] (Worker) 等待处理锁...")
-            async with processing_lock:
+            lock_wait_started = time.monotonic()
+            async with active_lock:
                 logger.info(f"[{req_id}] (Worker) 已获取处理锁。开始核心处理...")
+                timings.add("lock_wait", time.monotonic() - lock_wait_started)
+                service_started = time.time()
                 
                 # 获取锁后最终主动检测客户端连接
                 is_connected = await _test_client_connection(req_id, http_request)
@@ -159,10 +193,12 @@ async def queue_worker() -> None:
                 else:
                     # 调用实际的请求处理函数
                     try:
+                        await pacing.wait_until_ready(req_id, page_slot)
                         from api_utils import _process_request_refactored
-                        returned_value = await _process_request_refactored(
-                            req_id, request_data, http_request, result_future
-                        )
+                        with timings.measure("processing"):
+                            returned_value = await _process_request_refactored(
+                                req_id, request_data, http_request, result_future, page_slot
+                            )
                         
                         completion_event, submit_btn_loc, client_disco_checker = None, None, None
                         current_request_was_streaming = False
@@ -187,26 +223,20 @@ async def queue_worker() -> None:
                             # 流式模式：等待流式生成器完成信号
                             logger.info(f"[{req_id}] (Worker) 等待流式生成器完成信号...")
 
-                            # 创建一个增强的客户端断开检测器，支持提前done信号触发
+                            # 客户端断开时提前触发done信号（等待中间件的断开事件，不轮询）
                             client_disconnected_early = False
 
                             async def enhanced_disconnect_monitor():
                                 nonlocal client_disconnected_early
-                                while not completion_event.is_set():
-                                    try:
-                                        # 主动检查客户端是否断开连接
-                                        is_connected = await _test_client_connection(req_id, http_request)
-                                        if not is_connected:
-                                            logger.info(f"[{req_id}] (Worker) ✅ 流式处理中检测到客户端断开，提前触发done信号")
-                                            client_disconnected_early = True
-                                            # 立即设置completion_event以提前结束等待
-                                            if not completion_event.is_set():
-                                                completion_event.set()
-                                            break
-                                        await asyncio.sleep(0.3)  # 更频繁的检查间隔
-                                    except Exception as e:
-                                        logger.error(f"[{req_id}] (Worker) 增强断开检测器错误: {e}")
-                                        break
+                                try:
+                                    await wait_for_disconnect(req_id, http_request)
+                                except Exception as e:
+                                    logger.error(f"[{req_id}] (Worker) 增强断开检测器错误: {e}")
+                                    return
+                                if not completion_event.is_set():
+                                    logger.info(f"[{req_id}] (Worker) ✅ 流式处理中检测到客户端断开，提前触发done信号")
+                                    client_disconnected_early = True
+                                    completion_event.set()
 
                             # 启动增强的断开连接监控
                             disconnect_monitor_task = asyncio.create_task(enhanced_disconnect_monitor())
@@ -218,26 +248,21 @@ async def queue_worker() -> None:
 
                             async def non_streaming_disconnect_monitor():
                                 nonlocal client_disconnected_early
-                                while not result_future.done():
-                                    try:
-                                        # 主动检查客户端是否断开连接
-                                        is_connected = await _test_client_connection(req_id, http_request)
-                                        if not is_connected:
-                                            logger.info(f"[{req_id}] (Worker) ✅ 非流式处理中检测到客户端断开，取消处理")
-                                            client_disconnected_early = True
-                                            # 取消result_future
-                                            if not result_future.done():
-                                                result_future.set_exception(HTTPException(status_code=499, detail=f"[{req_id}] 客户端在非流式处理中断开连接"))
-                                            break
-                                        await asyncio.sleep(0.3)  # 更频繁的检查间隔
-                                    except Exception as e:
-                                        logger.error(f"[{req_id}] (Worker) 非流式断开检测器错误: {e}")
-                                        break
+                                try:
+                                    await wait_for_disconnect(req_id, http_request)
+                                except Exception as e:
+                                    logger.error(f"[{req_id}] (Worker) 非流式断开检测器错误: {e}")
+                                    return
+                                if not result_future.done():
+                                    logger.info(f"[{req_id}] (Worker) ✅ 非流式处理中检测到客户端断开，取消处理")
+                                    client_disconnected_early = True
+                                    result_future.set_exception(HTTPException(status_code=499, detail=f"[{req_id}] 客户端在非流式处理中断开连接"))
 
                             # 启动非流式断开连接监控
                             disconnect_monitor_task = asyncio.create_task(non_streaming_disconnect_monitor())
 
                         # 等待处理完成（流式或非流式）
+                        completion_wait_started = time.monotonic()
                         try:
                             if completion_event:
                                 # 流式模式：等待completion_event
@@ -304,6 +329,7 @@ async def queue_worker() -> None:
                             if not result_future.done():
                                 result_future.set_exception(server_error(req_id, f"Error waiting for completion: {ev_wait_err}"))
                         finally:
+                            timings.add("completion_wait", time.monotonic() - completion_wait_started)
                             # 清理断开连接监控任务
                             if 'disconnect_monitor_task' in locals() and not disconnect_monitor_task.done():
                                 disconnect_monitor_task.cancel()
@@ -316,31 +342,42 @@ async def queue_worker() -> None:
                         logger.error(f"[{req_id}] (Worker) _process_request_refactored execution error: {process_err}")
                         if not result_future.done():
                             result_future.set_exception(server_error(req_id, f"Request processing error: {process_err}"))
-            
+
+                # 检查页面错误提示并记录到账号统计，供调度器绕开被限流的账号
+                page_error = None
+                if page_slot is not None and page_pool:
+                    page_error = await page_pool.inspect_page_errors(page_slot, req_id)
+                # 记录请求结果，供请求节奏控制学习相邻请求的安全间隔
+                pacing.record_outcome(req_id, page_slot, _request_outcome(result_future, page_error))
+
+                # 在释放处理锁前执行清空操作（页面池模式下需在归还页面前完成，避免其他请求使用未清空的页面）
+                cleanup_started = time.monotonic()
+                try:
+                    # 清空流式队列缓存
+                    from api_utils import clear_stream_queue
+                    await clear_stream_queue()
+
+                    # 清空聊天历史（对于所有模式：流式和非流式）；会话复用模式下保留已记录完整回复的对话
+                    from api_utils.conversation_reuse import finish_request
+                    if finish_request(page_slot):
+                        logger.info(f"[{req_id}] (Worker) 会话复用: 保留页面 #{page_slot.index} 的对话，跳过聊天历史清空。")
+                    elif submit_btn_loc and client_disco_checker:
+                        from server import page_instance, is_page_ready
+                        target_page = page_slot.page if page_slot is not None else page_instance
+                        if target_page and is_page_ready:
+                            from browser_utils.page_controller import PageController
+                            page_controller = PageController(target_page, logger, req_id)
+                            logger.info(f"[{req_id}] (Worker) 执行聊天历史清空（{'流式' if completion_event else '非流式'}模式）...")
+                            await page_controller.clear_chat_history(client_disco_checker)
+                            logger.info(f"[{req_id}] (Worker) ✅ 聊天历史清空完成。")
+                    else:
+                        logger.info(f"[{req_id}] (Worker) 跳过聊天历史清空：缺少必要参数（submit_btn_loc: {bool(submit_btn_loc)}, client_disco_checker: {bool(client_disco_checker)}）")
+                except Exception as clear_err:
+                    logger.error(f"[{req_id}] (Worker) 清空操作时发生错误: {clear_err}", exc_info=True)
+                timings.add("cleanup", time.monotonic() - cleanup_started)
+
             logger.info(f"[{req_id}] (Worker) 释放处理锁。")
-
-            # 在释放处理锁后立即执行清空操作
-            try:
-                # 清空流式队列缓存
-                from api_utils import clear_stream_queue
-                await clear_stream_queue()
-
-                # 清空聊天历史（对于所有模式：流式和非流式）
-                if submit_btn_loc and client_disco_checker:
-                    from server import page_instance, is_page_ready
-                    if page_instance and is_page_ready:
-                        from browser_utils.page_controller import PageController
-                        page_controller = PageController(page_instance, logger, req_id)
-                        logger.info(f"[{req_id}] (Worker) 执行聊天历史清空（{'流式' if completion_event else '非流式'}模式）...")
-                        await page_controller.clear_chat_history(client_disco_checker)
-                        logger.info(f"[{req_id}] (Worker) ✅ 聊天历史清空完成。")
-                else:
-                    logger.info(f"[{req_id}] (Worker) 跳过聊天历史清空：缺少必要参数（submit_btn_loc: {bool(submit_btn_loc)}, client_disco_checker: {bool(client_disco_checker)}）")
-            except Exception as clear_err:
-                logger.error(f"[{req_id}] (Worker) 清空操作时发生错误: {clear_err}", exc_info=True)
-
-            was_last_request_streaming = is_streaming_request
-            last_request_completion_time = time.time()
+            request_queue.record_service_time(time.time() - service_started)
             
         except asyncio.CancelledError:
             logger.info("--- 队列 Worker 被取消 ---")
@@ -352,7 +389,16 @@ async def queue_worker() -> None:
             if result_future and not result_future.done():
                 result_future.set_exception(server_error(req_id, f"服务器内部错误: {e}"))
         finally:
+            if stream_channel_key:
+                from api_utils.utils_ext import close_stream_channel
+                close_stream_channel(stream_channel_key)
+            if page_slot is not None:
+                from server import page_pool
+                if page_pool:
+                    page_pool.release(page_slot)
             if request_item:
+                from api_utils.pacing import pacing
+                pacing.finish_timings(req_id)
                 request_queue.task_done()
     
     logger.info("--- 队列 Worker 已停止 ---") 
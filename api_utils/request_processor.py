@@ -20,7 +20,7 @@ from config import (
     MODEL_NAME,
     SUBMIT_BUTTON_SELECTOR,
 )
-from config import ONLY_COLLECT_CURRENT_USER_ATTACHMENTS, UPLOAD_FILES_DIR
+from config import ONLY_COLLECT_CURRENT_USER_ATTACHMENTS, CONVERSATION_REUSE_ENABLED
 
 # --- models模块导入 ---
 from models import ChatCompletionRequest, ClientDisconnectedError
@@ -41,12 +41,15 @@ from .utils import (
 )
 from browser_utils.page_controller import PageController
 from .context_types import RequestContext
-from .response_generators import gen_sse_from_aux_stream, gen_sse_from_playwright
-from .response_payloads import build_chat_completion_response_json
+from .response_generators import gen_sse_from_aux_stream, gen_sse_from_playwright, gen_sse_from_cache
+from .response_payloads import build_chat_completion_response_json, build_assistant_message
 from .model_switching import analyze_model_requirements as ms_analyze, handle_model_switching as ms_switch, handle_parameter_cache as ms_param_cache
 from .page_response import locate_response_elements
+from .utils_ext import StreamDeltaAccumulator
+from . import conversation_reuse
+from .response_cache import request_cache_key, response_cache, store_response
+from .pacing import pacing
 
-from .common_utils import random_id as _random_id
 from .client_connection import (
     test_client_connection as _test_client_connection,
     setup_disconnect_monitoring as _setup_disconnect_monitoring,
@@ -113,14 +116,22 @@ async def _prepare_and_validate_request(
     req_id: str,
     request: ChatCompletionRequest,
     check_client_disconnected: Callable,
+    start_index: int = 0,
 ) -> Tuple[str, List[Optional[str]]]:
-    """准备和验证请求，返回 (组合提示, 图片路径列表)。"""
+    """准备和验证请求，返回 (组合提示, 图片路径列表)。
+
+    start_index > 0 时页面已包含前 start_index 条消息（会话复用），只组合之后的新消息，
+    工具目录也已在页面中，不再重复注入。
+    """
     try:
         validate_chat_request(request.messages, req_id)
     except ValueError as e:
         raise bad_request(req_id, f"无效请求: {e}")
     
-    prepared_prompt, images_list = prepare_combined_prompt(request.messages, req_id, getattr(request, 'tools', None), getattr(request, 'tool_choice', None))
+    if start_index > 0:
+        prepared_prompt, images_list = prepare_combined_prompt(request.messages[start_index:], req_id)
+    else:
+        prepared_prompt, images_list = prepare_combined_prompt(request.messages, req_id, getattr(request, 'tools', None), getattr(request, 'tool_choice', None))
     # 基于 tools/tool_choice 的主动函数执行（支持 per-request MCP 端点）
     try:
         # 将 mcp_endpoint 注入 utils.maybe_execute_tools 的注册逻辑
@@ -230,8 +241,6 @@ async def _handle_auxiliary_stream_response(
     
     is_streaming = request.stream
     current_ai_studio_model_id = context.get('current_ai_studio_model_id')
-    
-    # 兼容旧逻辑的随机ID函数移除，统一使用 _random_id()
 
     if is_streaming:
         try:
@@ -243,6 +252,7 @@ async def _handle_auxiliary_stream_response(
                 current_ai_studio_model_id or MODEL_NAME,
                 check_client_disconnected,
                 completion_event,
+                cache_key=context.get('response_cache_key'),
             )
             if not result_future.done():
                 result_future.set_result(StreamingResponse(stream_gen_func, media_type="text/event-stream"))
@@ -262,7 +272,7 @@ async def _handle_auxiliary_stream_response(
         content = None
         reasoning_content = None
         functions = None
-        final_data_from_aux_stream = None
+        accumulator = StreamDeltaAccumulator(req_id, logger)
 
         # 非流式：消费辅助队列的最终结果并组装 JSON 响应
         async for raw_data in use_stream_response(req_id):
@@ -286,49 +296,40 @@ async def _handle_auxiliary_stream_response(
                 logger.warning(f"[{req_id}] 非流式数据不是字典类型: {data}")
                 continue
                 
-            final_data_from_aux_stream = data
-            if data.get("done"):
-                content = data.get("body")
-                reasoning_content = data.get("reason")
-                functions = data.get("function")
+            # 辅助流推送的是增量数据，累积得到完整内容
+            accumulator.apply(data)
+            if accumulator.incomplete:
+                break
+            if accumulator.done:
+                content = accumulator.body
+                reasoning_content = accumulator.reason
+                functions = accumulator.functions
                 break
         
-        if final_data_from_aux_stream and final_data_from_aux_stream.get("reason") == "internal_timeout":
+        if accumulator.timed_out:
             logger.error(f"[{req_id}] 非流式请求通过辅助流失败: 内部超时")
             raise HTTPException(status_code=502, detail=f"[{req_id}] 辅助流处理错误 (内部超时)")
 
-        if final_data_from_aux_stream and final_data_from_aux_stream.get("done") is True and content is None:
+        if accumulator.incomplete:
+            logger.error(f"[{req_id}] 非流式请求通过辅助流失败: 增量数据丢失")
+            raise HTTPException(status_code=502, detail=f"[{req_id}] 辅助流处理错误 (数据不完整)")
+
+        if accumulator.done and not content and not functions:
              logger.error(f"[{req_id}] 非流式请求通过辅助流完成但未提供内容")
              raise HTTPException(status_code=502, detail=f"[{req_id}] 辅助流完成但未提供内容")
+        conversation_reuse.record_conversation_reply(req_id, content, functions)
 
         model_name_for_json = current_ai_studio_model_id or MODEL_NAME
-        message_payload = {"role": "assistant", "content": content}
-        finish_reason_val = "stop"
-
-        if functions and len(functions) > 0:
-            tool_calls_list = []
-            for func_idx, function_call_data in enumerate(functions):
-                tool_calls_list.append({
-                    "id": f"call_{_random_id()}",
-                    "index": func_idx,
-                    "type": "function",
-                    "function": {
-                        "name": function_call_data["name"],
-                        "arguments": json.dumps(function_call_data["params"]),
-                    },
-                })
-            message_payload["tool_calls"] = tool_calls_list
-            finish_reason_val = "tool_calls"
-            message_payload["content"] = None
-
-        if reasoning_content:
-            message_payload["reasoning_content"] = reasoning_content
+        message_payload, finish_reason_val = build_assistant_message(content, reasoning_content, functions)
 
         usage_stats = calculate_usage_stats(
             [msg.model_dump() for msg in request.messages],
             content or "",
             reasoning_content,
         )
+        await store_response(
+            context.get('response_cache_key'), model_name_for_json, content, reasoning_content, functions, usage_stats
+        )
 
         response_payload = build_chat_completion_response_json(
             req_id,
@@ -369,6 +370,7 @@ async def _handle_playwright_response(req_id: str, request: ChatCompletionReques
             request,
             check_client_disconnected,
             completion_event,
+            cache_key=context.get('response_cache_key'),
         )
         if not result_future.done():
             result_future.set_result(StreamingResponse(stream_gen_func, media_type="text/event-stream"))
@@ -378,6 +380,8 @@ async def _handle_playwright_response(req_id: str, request: ChatCompletionReques
         # 使用PageController获取响应
         page_controller = PageController(page, logger, req_id)
         final_content = await page_controller.get_response(check_client_disconnected)
+        if final_content:
+            conversation_reuse.record_conversation_reply(req_id, final_content)
         
         # 计算token使用统计
         usage_stats = calculate_usage_stats(
@@ -389,6 +393,9 @@ async def _handle_playwright_response(req_id: str, request: ChatCompletionReques
 
         # 统一使用构造器生成 OpenAI 兼容响应
         model_name_for_json = current_ai_studio_model_id or MODEL_NAME
+        await store_response(
+            context.get('response_cache_key'), model_name_for_json, final_content, None, None, usage_stats
+        )
         message_payload = {"role": "assistant", "content": final_content}
         finish_reason_val = "stop"
         response_payload = build_chat_completion_response_json(
@@ -408,13 +415,34 @@ async def _handle_playwright_response(req_id: str, request: ChatCompletionReques
         return None
 
 
+def _serve_cached_response(req_id: str, request: ChatCompletionRequest, entry: dict, result_future: Future) -> None:
+    """用缓存的回复完成请求：流式请求按 SSE 回放，非流式请求直接返回 JSON"""
+    if result_future.done():
+        return
+    if request.stream:
+        result_future.set_result(StreamingResponse(gen_sse_from_cache(req_id, entry), media_type="text/event-stream"))
+        return
+    message_payload, finish_reason_val = build_assistant_message(
+        entry["content"], entry["reasoning_content"], entry["functions"]
+    )
+    response_payload = build_chat_completion_response_json(
+        req_id,
+        entry["model"],
+        message_payload,
+        finish_reason_val,
+        entry["usage"],
+        system_fingerprint="camoufox-proxy",
+        seed=request.seed,
+        response_format=request.response_format,
+    )
+    result_future.set_result(JSONResponse(content=response_payload))
+
+
 async def _cleanup_request_resources(req_id: str, disconnect_check_task: Optional[asyncio.Task], 
                                    completion_event: Optional[Event], result_future: Future, 
                                    is_streaming: bool) -> None:
     """清理请求资源"""
     from server import logger
-    from config import UPLOAD_FILES_DIR
-    import os, shutil
     
     if disconnect_check_task and not disconnect_check_task.done():
         disconnect_check_task.cancel()
@@ -427,14 +455,12 @@ async def _cleanup_request_resources(req_id: str, disconnect_check_task: Optiona
     
     logger.info(f"[{req_id}] 处理完成。")
 
-    # 清理本次请求的上传子目录，避免磁盘累积
+    # 释放本次请求引用的附件，未被引用的文件由附件存储按上限淘汰
     try:
-        req_dir = os.path.join(UPLOAD_FILES_DIR, req_id)
-        if os.path.isdir(req_dir):
-            shutil.rmtree(req_dir, ignore_errors=True)
-            logger.info(f"[{req_id}] 已清理请求上传目录: {req_dir}")
+        from api_utils.attachment_store import attachment_store
+        attachment_store.release(req_id)
     except Exception as clean_err:
-        logger.warning(f"[{req_id}] 清理上传目录失败: {clean_err}")
+        logger.warning(f"[{req_id}] 释放请求附件失败: {clean_err}")
     
     if is_streaming and completion_event and not completion_event.is_set() and (result_future.done() and result_future.exception() is not None):
          logger.warning(f"[{req_id}] 流式请求异常，确保完成事件已设置。")
@@ -445,9 +471,13 @@ async def _process_request_refactored(
     req_id: str,
     request: ChatCompletionRequest,
     http_request: Request,
-    result_future: Future
+    result_future: Future,
+    page_slot: Optional[Any] = None,
 ) -> Optional[Tuple[Event, Locator, Callable[[str], bool]]]:
-    """核心请求处理函数 - 重构版本"""
+    """核心请求处理函数 - 重构版本
+
+    page_slot: 页面池中租用的页面槽位；为 None 时使用全局 page_instance。
+    """
 
     # 优化：在开始任何处理前主动检测客户端连接状态
     is_connected = await _test_client_connection(req_id, http_request)
@@ -458,7 +488,18 @@ async def _process_request_refactored(
             result_future.set_exception(HTTPException(status_code=499, detail=f"[{req_id}] 客户端在处理开始前已断开连接"))
         return None
 
-    context = await _initialize_request_context(req_id, request)
+    # 确定性请求优先查询响应缓存，命中时不进行任何页面操作
+    cache_key = await request_cache_key(request)
+    if cache_key is not None:
+        cached_entry = await response_cache.get(cache_key)
+        if cached_entry is not None:
+            from server import logger
+            logger.info(f"[{req_id}] 响应缓存命中 ({cache_key[:12]})，跳过页面交互")
+            _serve_cached_response(req_id, request, cached_entry, result_future)
+            return None
+
+    context = await _initialize_request_context(req_id, request, page_slot)
+    context['response_cache_key'] = cache_key
     context = await _analyze_model_requirements(req_id, context, request)
     
     client_disconnected_event, disconnect_check_task, check_client_disconnected = await _setup_disconnect_monitoring(
@@ -474,10 +515,30 @@ async def _process_request_refactored(
         
         page_controller = PageController(page, context['logger'], req_id)
 
-        await _handle_model_switching(req_id, context, check_client_disconnected)
-        await _handle_parameter_cache(req_id, context)
-        
-        prepared_prompt,image_list = await _prepare_and_validate_request(req_id, request, check_client_disconnected)
+        timings = pacing.timings(req_id)
+        with timings.measure("model_switch"):
+            await _handle_model_switching(req_id, context, check_client_disconnected)
+            await _handle_parameter_cache(req_id, context)
+
+        reuse_plan, fingerprints = None, None
+        page_slot = context.get('page_slot')
+        if CONVERSATION_REUSE_ENABLED and page_slot is not None:
+            held_conversation = page_slot.conversation
+            fingerprints = conversation_reuse.prefix_fingerprints(request)
+            reuse_plan = conversation_reuse.plan_reuse(page_slot, request, fingerprints)
+            if reuse_plan is not None:
+                context['logger'].info(
+                    f"[{req_id}] 会话复用: 页面已包含前 {reuse_plan.start_index} 条消息，"
+                    f"仅提交 {len(request.messages) - reuse_plan.start_index} 条新消息，节省提示 {reuse_plan.saved_bytes} 字节"
+                )
+            elif held_conversation is not None:
+                context['logger'].info(f"[{req_id}] 会话复用: 页面保留的对话与请求历史不一致，清空聊天后完整重建")
+                with timings.measure("clear_chat"):
+                    await page_controller.clear_chat_history(check_client_disconnected)
+
+        prepared_prompt,image_list = await _prepare_and_validate_request(
+            req_id, request, check_client_disconnected, reuse_plan.start_index if reuse_plan else 0
+        )
         # 额外合并顶层与消息级 attachments/files（兼容历史记录）已在下方处理；此处确保路径存在
         try:
             import os
@@ -520,8 +581,8 @@ async def _process_request_refactored(
                             image_list.append(lp)
                     elif os.path.isabs(url_value) and os.path.exists(url_value):
                         image_list.append(url_value)
-            # 消息级 attachments/images/files/media（全量收集，但仅保留有效本地/data）
-            for msg in (request.messages or []):
+            # 消息级 attachments/images/files/media（全量收集，但仅保留有效本地/data；会话复用时历史附件已在页面中）
+            for msg in (request.messages or [])[reuse_plan.start_index if reuse_plan else 0:]:
                 for key in ('attachments', 'images', 'files', 'media'):
                     arr = getattr(msg, key, None)
                     if not isinstance(arr, list):
@@ -552,19 +613,23 @@ async def _process_request_refactored(
         # 使用PageController处理页面交互
         # 注意：聊天历史清空已移至队列处理锁释放后执行
 
-        await page_controller.adjust_parameters(
-            request.model_dump(exclude_none=True), # 使用 exclude_none=True 避免传递None值
-            context['page_params_cache'],
-            context['params_cache_lock'],
-            context['model_id_to_use'],
-            context['parsed_model_list'],
-            check_client_disconnected
-        )
+        with timings.measure("adjust_parameters"):
+            await page_controller.adjust_parameters(
+                request.model_dump(exclude_none=True), # 使用 exclude_none=True 避免传递None值
+                context['page_params_state'],
+                context['params_cache_lock'],
+                context['model_id_to_use'],
+                context['parsed_model_list'],
+                check_client_disconnected
+            )
 
         # 优化：在提交提示前再次检查客户端连接，避免不必要的后台请求
         check_client_disconnected("提交提示前最终检查")
 
-        await page_controller.submit_prompt(prepared_prompt,image_list, check_client_disconnected)
+        with timings.measure("submit_prompt"):
+            await page_controller.submit_prompt(prepared_prompt,image_list, check_client_disconnected)
+        if fingerprints is not None:
+            conversation_reuse.begin_conversation(page_slot, req_id, fingerprints, reuse_plan, prepared_prompt)
         
         # 响应处理仍然需要在这里，因为它决定了是流式还是非流式，并设置future
         response_result = await _handle_response_processing(
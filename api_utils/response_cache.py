@@ -0,0 +1,241 @@
+"""
+确定性请求的响应缓存
+
+temperature 为 0 或指定了 seed 的请求，以消息、模型、参数、工具声明与附件内容摘要的规范化哈希为键，
+缓存完整的模型回复（正文、思考内容、函数调用与 usage）。命中时不经过页面直接返回，流式请求按 SSE 回放。
+
+两级存储：内存（LRU，按条目数限制）与磁盘（JSON 文件，按总字节数限制，按访问时间淘汰），均受 TTL 约束。
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+from config import (
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_DISK_MB,
+    RESPONSE_CACHE_DIR,
+)
+from models import ChatCompletionRequest
+
+# 参与缓存键的请求字段（stream 不影响回复内容，命中后按请求的模式输出）
+_KEY_FIELDS = (
+    'messages', 'model', 'temperature', 'max_output_tokens', 'stop', 'top_p',
+    'reasoning_effort', 'tools', 'tool_choice', 'seed', 'response_format', 'attachments',
+)
+_FILE_READ_BLOCK = 1 << 20
+
+
+def is_cacheable(request: ChatCompletionRequest) -> bool:
+    """只缓存确定性请求；指定 MCP 端点时工具执行结果可能变化，不缓存"""
+    if request.mcp_endpoint:
+        return False
+    return request.temperature == 0 or request.seed is not None
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_FILE_READ_BLOCK), b''):
+            digest.update(block)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def _digest_attachments(value: Any) -> Any:
+    """把 data: URL 与本地文件引用替换为内容摘要：相同路径内容变化时键随之变化"""
+    if isinstance(value, dict):
+        return {key: _digest_attachments(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_digest_attachments(item) for item in value]
+    if not isinstance(value, str):
+        return value
+    if value.startswith('data:'):
+        return f"sha256:{hashlib.sha256(value.encode('utf-8')).hexdigest()}"
+    path = unquote(urlparse(value).path) if value.startswith('file:') else value
+    if os.path.isabs(path) and os.path.isfile(path):
+        try:
+            return _file_digest(path)
+        except OSError:
+            return value
+    return value
+
+
+def compute_cache_key(request: ChatCompletionRequest) -> str:
+    payload = request.model_dump(include=set(_KEY_FIELDS), exclude_none=True)
+    canonical = json.dumps(_digest_attachments(payload), sort_keys=True, ensure_ascii=False,
+                           separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+async def request_cache_key(request: ChatCompletionRequest) -> Optional[str]:
+    """返回请求的缓存键；缓存未启用或请求不可缓存时返回 None（附件摘要在线程池中计算）"""
+    if not RESPONSE_CACHE_ENABLED or not is_cacheable(request):
+        return None
+    return await asyncio.to_thread(compute_cache_key, request)
+
+
+def make_entry(model: str, content: Optional[str], reasoning_content: Optional[str],
+               functions: Optional[List[Dict[str, Any]]], usage: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "created": time.time(),
+        "model": model,
+        "content": content or "",
+        "reasoning_content": reasoning_content or "",
+        "functions": functions or [],
+        "usage": usage,
+    }
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str, ttl_seconds: int, max_entries: int, max_disk_bytes: int):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._disk_bytes: Optional[int] = None
+        # 磁盘层读写在线程池中执行，串行化以保持字节计数一致
+        self._disk_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return self.ttl_seconds > 0 and time.time() - entry.get("created", 0) > self.ttl_seconds
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    def _locked(self, func, *args):
+        with self._disk_lock:
+            return func(*args)
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry):
+            self._remove_file(path)
+            return None
+        try:
+            # 按访问时间淘汰
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def _remove_file(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        if self._disk_bytes is not None:
+            self._disk_bytes -= size
+
+    def _scan_disk(self) -> List[os.DirEntry]:
+        try:
+            return [e for e in os.scandir(self.cache_dir) if e.is_file() and e.name.endswith('.json')]
+        except OSError:
+            return []
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(e.stat().st_size for e in self._scan_disk())
+        path = self._path(key)
+        if os.path.exists(path):
+            self._remove_file(path)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._disk_bytes += os.path.getsize(path)
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        for disk_entry in sorted(self._scan_disk(), key=lambda e: e.stat().st_mtime):
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            if disk_entry.path != path:
+                self._remove_file(disk_entry.path)
+                self.disk_evictions += 1
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._memory.get(key)
+        if entry is not None and self._expired(entry):
+            del self._memory[key]
+            entry = None
+        if entry is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry
+        if self.max_disk_bytes > 0:
+            entry = await asyncio.to_thread(self._locked, self._read_disk, key)
+            if entry is not None:
+                self._remember(key, entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, entry: Dict[str, Any]) -> None:
+        self._remember(key, entry)
+        self.stores += 1
+        if self.max_disk_bytes > 0:
+            try:
+                await asyncio.to_thread(self._locked, self._write_disk, key, entry)
+            except OSError:
+                # 磁盘层写入失败不影响内存层
+                pass
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "memory_evictions": self.memory_evictions,
+            "disk_evictions": self.disk_evictions,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+        }
+
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_DIR,
+    RESPONSE_CACHE_TTL_SECONDS,
+    max(1, RESPONSE_CACHE_MAX_ENTRIES),
+    max(0, RESPONSE_CACHE_MAX_DISK_MB) * 1024 * 1024,
+)
+
+
+async def store_response(cache_key: Optional[str], model: str, content: Optional[str],
+                         reasoning_content: Optional[str], functions: Optional[List[Dict[str, Any]]],
+                         usage: Dict[str, Any]) -> None:
+    """缓存一次完整的模型回复；没有正文也没有函数调用时不缓存"""
+    if cache_key is None or (not content and not functions):
+        return
+    await response_cache.put(cache_key, make_entry(model, content, reasoning_content, functions, usage))
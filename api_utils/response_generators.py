@@ -2,42 +2,140 @@ import asyncio
 import json
 import time
 import random
-from typing import Any, AsyncGenerator, Callable
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
 from asyncio import Event
 
 from playwright.async_api import Page as AsyncPage
 
 from models import ClientDisconnectedError, ChatCompletionRequest
-from config import CHAT_COMPLETION_ID_PREFIX
+from config import CHAT_COMPLETION_ID_PREFIX, PLAYWRIGHT_DOM_STREAMING
 from .utils import use_stream_response, calculate_usage_stats, generate_sse_chunk, generate_sse_stop_chunk
-from .common_utils import random_id
+from .utils_ext import StreamDeltaAccumulator
+from . import conversation_reuse
+from .response_cache import store_response
+from .response_payloads import build_tool_calls
+from .sse import SSEChunkTemplate, SSEWriter, content_chunk_template, iter_with_flush_ticks
 
 
 
+def _aux_stream_writer(chat_completion_id: str, model: str, created: int) -> SSEWriter:
+    """辅助流增量的 chunk 模板与合并输出"""
+    def template(delta: dict) -> SSEChunkTemplate:
+        return SSEChunkTemplate({
+            "id": chat_completion_id,
+            "object": "chat.completion.chunk",
+            "model": model,
+            "created": created,
+            "choices": [{
+                "index": 0,
+                "delta": delta,
+                "finish_reason": None,
+                "native_finish_reason": None,
+            }],
+        }, ensure_ascii=False, separators=(',', ':'))
+
+    return SSEWriter({
+        "content": template({"role": "assistant", "content": SSEChunkTemplate.PLACEHOLDER}),
+        "reasoning_content": template({
+            "role": "assistant",
+            "content": None,
+            "reasoning_content": SSEChunkTemplate.PLACEHOLDER,
+        }),
+    })
+
+
+def _aux_finish_chunk(chat_completion_id: str, model: str, created: int, functions: List[Dict[str, Any]]) -> str:
+    """回复结束块：有函数调用时携带 tool_calls"""
+    if functions:
+        choice_item = {
+            "index": 0,
+            "delta": {"role": "assistant", "content": None, "tool_calls": build_tool_calls(functions)},
+            "finish_reason": "tool_calls",
+            "native_finish_reason": "tool_calls",
+        }
+    else:
+        choice_item = {
+            "index": 0,
+            "delta": {"role": "assistant"},
+            "finish_reason": "stop",
+            "native_finish_reason": "stop",
+        }
+    output = {
+        "id": chat_completion_id,
+        "object": "chat.completion.chunk",
+        "model": model,
+        "created": created,
+        "choices": [choice_item],
+    }
+    return f"data: {json.dumps(output, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def _aux_usage_chunk(chat_completion_id: str, model: str, created: int, usage_stats: Dict[str, Any]) -> str:
+    final_chunk = {
+        "id": chat_completion_id,
+        "object": "chat.completion.chunk",
+        "model": model,
+        "created": created,
+        "choices": [{
+            "index": 0,
+            "delta": {},
+            "finish_reason": "stop",
+            "native_finish_reason": "stop",
+        }],
+        "usage": usage_stats,
+    }
+    return f"data: {json.dumps(final_chunk, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+async def gen_sse_from_cache(req_id: str, entry: Dict[str, Any]) -> AsyncGenerator[str, None]:
+    """按辅助流的 chunk 格式回放缓存的回复（思考内容、正文各一块，随后是结束块、usage 与 [DONE]）"""
+    chat_completion_id = f"{CHAT_COMPLETION_ID_PREFIX}{req_id}-{int(time.time())}-{random.randint(100, 999)}"
+    created_timestamp = int(time.time())
+    model = entry["model"]
+    writer = _aux_stream_writer(chat_completion_id, model, created_timestamp)
+    for field in ("reasoning_content", "content"):
+        # 以函数调用结束时正文不输出（与 tool_calls 块互斥）
+        if field == "content" and entry["functions"]:
+            continue
+        for chunk in writer.push(field, entry[field]):
+            yield chunk
+        for chunk in writer.flush():
+            yield chunk
+    yield writer.raw(_aux_finish_chunk(chat_completion_id, model, created_timestamp, entry["functions"]))
+    yield writer.raw(_aux_usage_chunk(chat_completion_id, model, created_timestamp, entry["usage"]))
+    yield "data: [DONE]\n\n"
+
+
 async def gen_sse_from_aux_stream(
     req_id: str,
     request: ChatCompletionRequest,
     model_name_for_stream: str,
     check_client_disconnected: Callable,
     event_to_set: Event,
+    cache_key: Optional[str] = None,
 ) -> AsyncGenerator[str, None]:
     """辅助流队列 -> OpenAI 兼容 SSE 生成器。
 
-    产出增量、tool_calls、最终 usage 与 [DONE]。
+    辅助流按 seq 推送增量文本，产出增量、tool_calls、最终 usage 与 [DONE]。
+    cache_key 不为 None 时，完整收到的回复写入响应缓存。
     """
     from server import logger
 
-    last_reason_pos = 0
-    last_body_pos = 0
+    accumulator = StreamDeltaAccumulator(req_id, logger)
     chat_completion_id = f"{CHAT_COMPLETION_ID_PREFIX}{req_id}-{int(time.time())}-{random.randint(100, 999)}"
     created_timestamp = int(time.time())
 
-    full_reasoning_content = ""
-    full_body_content = ""
     data_receiving = False
+    writer = _aux_stream_writer(chat_completion_id, model_name_for_stream, created_timestamp)
+    items = iter_with_flush_ticks(use_stream_response(req_id), writer)
 
     try:
-        async for raw_data in use_stream_response(req_id):
+        async for raw_data in items:
+            if raw_data is None:
+                # 合并窗口到期
+                for chunk in writer.flush():
+                    yield chunk
+                continue
             data_receiving = True
 
             try:
@@ -65,111 +163,24 @@ async def gen_sse_from_aux_stream(
                 logger.warning(f"[{req_id}] 数据不是字典类型: {data}")
                 continue
 
-            reason = data.get("reason", "")
-            body = data.get("body", "")
-            done = data.get("done", False)
-            function = data.get("function", [])
-
-            if reason:
-                full_reasoning_content = reason
-            if body:
-                full_body_content = body
-
-            if len(reason) > last_reason_pos:
-                output = {
-                    "id": chat_completion_id,
-                    "object": "chat.completion.chunk",
-                    "model": model_name_for_stream,
-                    "created": created_timestamp,
-                    "choices": [{
-                        "index": 0,
-                        "delta": {
-                            "role": "assistant",
-                            "content": None,
-                            "reasoning_content": reason[last_reason_pos:],
-                        },
-                        "finish_reason": None,
-                        "native_finish_reason": None,
-                    }],
-                }
-                last_reason_pos = len(reason)
-                yield f"data: {json.dumps(output, ensure_ascii=False, separators=(',', ':'))}\n\n"
-
-            if len(body) > last_body_pos:
-                finish_reason_val = None
-                if done:
-                    finish_reason_val = "stop"
-
-                delta_content = {"role": "assistant", "content": body[last_body_pos:]}
-                choice_item = {
-                    "index": 0,
-                    "delta": delta_content,
-                    "finish_reason": finish_reason_val,
-                    "native_finish_reason": finish_reason_val,
-                }
-
-                if done and function and len(function) > 0:
-                    tool_calls_list = []
-                    for func_idx, function_call_data in enumerate(function):
-                        tool_calls_list.append({
-                            "id": f"call_{random_id()}",
-                            "index": func_idx,
-                            "type": "function",
-                            "function": {
-                                "name": function_call_data["name"],
-                                "arguments": json.dumps(function_call_data["params"]),
-                            },
-                        })
-                    delta_content["tool_calls"] = tool_calls_list
-                    choice_item["finish_reason"] = "tool_calls"
-                    choice_item["native_finish_reason"] = "tool_calls"
-                    delta_content["content"] = None
+            reason_delta, body_delta = accumulator.apply(data)
+            if accumulator.incomplete:
+                # 有增量丢失，之后的文本无法拼接成正确的回复
+                raise RuntimeError("辅助流数据不完整（增量序号不连续）")
+            done = accumulator.done
+            function = accumulator.functions
 
-                output = {
-                    "id": chat_completion_id,
-                    "object": "chat.completion.chunk",
-                    "model": model_name_for_stream,
-                    "created": created_timestamp,
-                    "choices": [choice_item],
-                }
-                last_body_pos = len(body)
-                yield f"data: {json.dumps(output, ensure_ascii=False, separators=(',', ':'))}\n\n"
-            elif done:
-                if function and len(function) > 0:
-                    tool_calls_list = []
-                    for func_idx, function_call_data in enumerate(function):
-                        tool_calls_list.append({
-                            "id": f"call_{random_id()}",
-                            "index": func_idx,
-                            "type": "function",
-                            "function": {
-                                "name": function_call_data["name"],
-                                "arguments": json.dumps(function_call_data["params"]),
-                            },
-                        })
-                    delta_content = {"role": "assistant", "content": None, "tool_calls": tool_calls_list}
-                    choice_item = {
-                        "index": 0,
-                        "delta": delta_content,
-                        "finish_reason": "tool_calls",
-                        "native_finish_reason": "tool_calls",
-                    }
-                else:
-                    choice_item = {
-                        "index": 0,
-                        "delta": {"role": "assistant"},
-                        "finish_reason": "stop",
-                        "native_finish_reason": "stop",
-                    }
+            for chunk in writer.push("reasoning_content", reason_delta):
+                yield chunk
+            # 以函数调用结束时最后一段正文不输出（与 tool_calls 块互斥）
+            if not (done and function):
+                for chunk in writer.push("content", body_delta):
+                    yield chunk
 
-                output = {
-                    "id": chat_completion_id,
-                    "object": "chat.completion.chunk",
-                    "model": model_name_for_stream,
-                    "created": created_timestamp,
-                    "choices": [choice_item],
-                }
-                yield f"data: {json.dumps(output, ensure_ascii=False, separators=(',', ':'))}\n\n"
+            if done:
+                for chunk in writer.flush():
+                    yield chunk
+                yield writer.raw(_aux_finish_chunk(chat_completion_id, model_name_for_stream, created_timestamp, function))
 
     except ClientDisconnectedError:
         logger.info(f"[{req_id}] 流式生成器中检测到客户端断开连接")
@@ -179,6 +190,8 @@ async def gen_sse_from_aux_stream(
     except Exception as e:
         logger.error(f"[{req_id}] 流式生成器处理过程中发生错误: {e}", exc_info=True)
         try:
+            for chunk in writer.flush():
+                yield chunk
             error_chunk = {
                 "id": chat_completion_id,
                 "object": "chat.completion.chunk",
@@ -195,27 +208,23 @@ async def gen_sse_from_aux_stream(
         except Exception:
             pass
     finally:
+        await items.aclose()
         try:
+            for chunk in writer.flush():
+                yield chunk
             usage_stats = calculate_usage_stats(
                 [msg.model_dump() for msg in request.messages],
-                full_body_content,
-                full_reasoning_content,
+                accumulator.body,
+                accumulator.reason,
             )
             logger.info(f"[{req_id}] 计算的token使用统计: {usage_stats}")
-            final_chunk = {
-                "id": chat_completion_id,
-                "object": "chat.completion.chunk",
-                "model": model_name_for_stream,
-                "created": created_timestamp,
-                "choices": [{
-                    "index": 0,
-                    "delta": {},
-                    "finish_reason": "stop",
-                    "native_finish_reason": "stop",
-                }],
-                "usage": usage_stats,
-            }
-            yield f"data: {json.dumps(final_chunk, ensure_ascii=False, separators=(',', ':'))}\n\n"
+            if accumulator.done and not accumulator.timed_out and not accumulator.incomplete:
+                conversation_reuse.record_conversation_reply(req_id, accumulator.body, accumulator.functions)
+                await store_response(
+                    cache_key, model_name_for_stream, accumulator.body, accumulator.reason,
+                    accumulator.functions, usage_stats,
+                )
+            yield writer.raw(_aux_usage_chunk(chat_completion_id, model_name_for_stream, created_timestamp, usage_stats))
         except Exception as usage_err:
             logger.error(f"[{req_id}] 计算或发送usage统计时出错: {usage_err}")
         try:
@@ -236,41 +245,79 @@ async def gen_sse_from_playwright(
     request: ChatCompletionRequest,
     check_client_disconnected: Callable,
     completion_event: Event,
+    cache_key: Optional[str] = None,
 ) -> AsyncGenerator[str, None]:
-    """Playwright 最终响应 -> OpenAI 兼容 SSE 生成器。"""
+    """Playwright 响应 -> OpenAI 兼容 SSE 生成器。
+
+    PLAYWRIGHT_DOM_STREAMING 开启时，页面内监听响应文本并在生成过程中逐段推送增量；
+    关闭时等待完整响应后再按固定间隔切片输出（伪流式）。
+    cache_key 不为 None 时，完整的回复写入响应缓存；DOM 流式下缓存与会话复用只记录页面返回的原始 Markdown。
+    """
     # Reuse already-imported helpers from utils to avoid repeated imports
     from models import ClientDisconnectedError
     from browser_utils.page_controller import PageController
 
     data_receiving = False
+    writer = None
     try:
         page_controller = PageController(page, logger, req_id)
-        final_content = await page_controller.get_response(check_client_disconnected)
-        data_receiving = True
-        lines = final_content.split('\n')
-        for line_idx, line in enumerate(lines):
+        if PLAYWRIGHT_DOM_STREAMING:
+            streamed_parts = []
+            writer = SSEWriter({"content": content_chunk_template(req_id, model_name_for_stream)})
+            deltas = iter_with_flush_ticks(page_controller.stream_response(check_client_disconnected), writer)
             try:
-                check_client_disconnected(f"Playwright流式生成器循环 ({req_id}): ")
-            except ClientDisconnectedError:
-                logger.info(f"[{req_id}] Playwright流式生成器中检测到客户端断开连接")
-                if data_receiving and not completion_event.is_set():
-                    logger.info(f"[{req_id}] Playwright数据接收中客户端断开，立即设置done信号")
-                    completion_event.set()
-                break
-            if line:
-                chunk_size = 5
-                for i in range(0, len(line), chunk_size):
-                    chunk = line[i:i+chunk_size]
-                    yield generate_sse_chunk(chunk, req_id, model_name_for_stream)
-                    await asyncio.sleep(0.03)
-            if line_idx < len(lines) - 1:
-                yield generate_sse_chunk('\n', req_id, model_name_for_stream)
-                await asyncio.sleep(0.01)
+                async for delta in deltas:
+                    if delta is None:
+                        # 合并窗口到期
+                        for chunk in writer.flush():
+                            yield chunk
+                        continue
+                    data_receiving = True
+                    check_client_disconnected(f"Playwright流式生成器循环 ({req_id}): ")
+                    streamed_parts.append(delta)
+                    for chunk in writer.push("content", delta):
+                        yield chunk
+                for chunk in writer.flush():
+                    yield chunk
+            finally:
+                await deltas.aclose()
+            # 增量为渲染文本（丢失代码块等格式），仅用于无法取得原始 Markdown 时的 token 统计
+            final_content = page_controller.final_response_content or ""
+            usage_content = final_content or "".join(streamed_parts)
+        else:
+            # 伪流式本身按固定间隔切片输出，不做合并
+            writer = SSEWriter({"content": content_chunk_template(req_id, model_name_for_stream)}, window_ms=0)
+            final_content = await page_controller.get_response(check_client_disconnected)
+            usage_content = final_content
+            data_receiving = True
+            lines = final_content.split('\n')
+            for line_idx, line in enumerate(lines):
+                try:
+                    check_client_disconnected(f"Playwright流式生成器循环 ({req_id}): ")
+                except ClientDisconnectedError:
+                    logger.info(f"[{req_id}] Playwright流式生成器中检测到客户端断开连接")
+                    if data_receiving and not completion_event.is_set():
+                        logger.info(f"[{req_id}] Playwright数据接收中客户端断开，立即设置done信号")
+                        completion_event.set()
+                    break
+                if line:
+                    chunk_size = 5
+                    for i in range(0, len(line), chunk_size):
+                        for chunk in writer.push("content", line[i:i+chunk_size]):
+                            yield chunk
+                        await asyncio.sleep(0.03)
+                if line_idx < len(lines) - 1:
+                    for chunk in writer.push("content", '\n'):
+                        yield chunk
+                    await asyncio.sleep(0.01)
         usage_stats = calculate_usage_stats(
-            [msg.model_dump() for msg in request.messages], final_content, "",
+            [msg.model_dump() for msg in request.messages], usage_content, "",
         )
         logger.info(f"[{req_id}] Playwright非流式计算的token使用统计: {usage_stats}")
-        yield generate_sse_stop_chunk(req_id, model_name_for_stream, "stop", usage_stats)
+        if final_content:
+            conversation_reuse.record_conversation_reply(req_id, final_content)
+            await store_response(cache_key, model_name_for_stream, final_content, None, None, usage_stats)
+        yield writer.raw(generate_sse_stop_chunk(req_id, model_name_for_stream, "stop", usage_stats))
     except ClientDisconnectedError:
         logger.info(f"[{req_id}] Playwright流式生成器中检测到客户端断开连接")
         if data_receiving and not completion_event.is_set():
@@ -279,6 +326,10 @@ async def gen_sse_from_playwright(
     except Exception as e:
         logger.error(f"[{req_id}] Playwright流式生成器处理过程中发生错误: {e}", exc_info=True)
         try:
+            # 先发出已合并但未发送的增量，错误信息紧随其后（如 DOM 流式输出不完整）
+            if writer is not None:
+                for chunk in writer.flush():
+                    yield chunk
             yield generate_sse_chunk(f"\n\n[错误: {str(e)}]", req_id, model_name_for_stream)
             yield generate_sse_stop_chunk(req_id, model_name_for_stream)
         except Exception:
@@ -1,7 +1,42 @@
+import json
 import time
-from typing import Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 from config import CHAT_COMPLETION_ID_PREFIX
+from .common_utils import random_id
+
+
+def build_tool_calls(functions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """辅助流解析出的函数调用 -> OpenAI 兼容 tool_calls 列表"""
+    return [
+        {
+            "id": f"call_{random_id()}",
+            "index": func_idx,
+            "type": "function",
+            "function": {
+                "name": function_call_data["name"],
+                "arguments": json.dumps(function_call_data["params"]),
+            },
+        }
+        for func_idx, function_call_data in enumerate(functions)
+    ]
+
+
+def build_assistant_message(
+    content: Optional[str],
+    reasoning_content: Optional[str] = None,
+    functions: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[Dict, str]:
+    """构造非流式响应的 assistant 消息，返回 (message, finish_reason)。"""
+    message_payload: Dict = {"role": "assistant", "content": content}
+    finish_reason = "stop"
+    if functions:
+        message_payload["tool_calls"] = build_tool_calls(functions)
+        message_payload["content"] = None
+        finish_reason = "tool_calls"
+    if reasoning_content:
+        message_payload["reasoning_content"] = reasoning_content
+    return message_payload, finish_reason
 
 
 def build_chat_completion_response_json(
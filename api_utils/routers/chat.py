@@ -5,12 +5,15 @@ import logging
 from asyncio import Queue, Future
 from fastapi import Depends, HTTPException, Request
 from ..dependencies import get_logger, get_request_queue, get_server_state, get_worker_task
-from config import RESPONSE_COMPLETION_TIMEOUT
+from config import RESPONSE_COMPLETION_TIMEOUT, SINGLEFLIGHT_ENABLED
 from models import ChatCompletionRequest
 import asyncio
 from fastapi.responses import JSONResponse
 from config import get_environment_variable
-from ..error_utils import service_unavailable
+from ..error_utils import service_unavailable, too_many_requests
+from ..fair_queue import TenantQueueFull, request_priority, tenant_for_request, tenant_weight
+from ..model_affinity import request_model_id
+from ..singleflight import join_flight
 
 
 async def chat_completions(
@@ -35,15 +38,52 @@ async def chat_completions(
     if service_unavailable:
         raise service_unavailable(req_id)
 
-    result_future = Future()
-    await request_queue.put({
-        "req_id": req_id, "request_data": request, "http_request": http_request,
-        "result_future": result_future, "enqueue_time": time.time(), "cancelled": False
-    })
+    tenant = tenant_for_request(http_request)
+    scheduling = {
+        "tenant": tenant,
+        "priority": request_priority(http_request, request.priority),
+        "weight": tenant_weight(http_request),
+        "model": request_model_id(request),
+    }
+
+    def enqueue(item: dict) -> None:
+        try:
+            request_queue.put_nowait({**item, **scheduling, "enqueue_time": time.time(), "cancelled": False})
+        except TenantQueueFull as full:
+            from server import page_pool
+            logger.warning(f"[{req_id}] 租户 {tenant} 排队请求数已达上限 {full.depth}，拒绝请求")
+            raise too_many_requests(
+                req_id, f"排队中的请求数已达上限 ({full.depth})，请稍后重试。",
+                request_queue.retry_after_seconds(tenant, page_pool.size if page_pool else 1),
+            )
+
+    if SINGLEFLIGHT_ENABLED:
+        # 相同的并发请求只执行一次，结果分发给所有等待者
+        flight, is_leader = await join_flight(req_id, request)
+        waiter = flight.attach(req_id)
+        if is_leader:
+            try:
+                enqueue({
+                    "req_id": req_id, "request_data": request, "http_request": flight.http_request,
+                    "result_future": flight.result_future,
+                })
+            except HTTPException:
+                flight.detach(req_id)
+                raise
+        else:
+            logger.info(f"[{req_id}] 合并到进行中的相同请求 [{flight.req_id}]，等待其结果")
+        awaitable = flight.wait(req_id, http_request, waiter)
+    else:
+        result_future = Future()
+        enqueue({
+            "req_id": req_id, "request_data": request, "http_request": http_request,
+            "result_future": result_future,
+        })
+        awaitable = result_future
 
     try:
         timeout_seconds = RESPONSE_COMPLETION_TIMEOUT / 1000 + 120
-        return await asyncio.wait_for(result_future, timeout=timeout_seconds)
+        return await asyncio.wait_for(awaitable, timeout=timeout_seconds)
     except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail=f"[{req_id}] 请求处理超时。")
     except asyncio.CancelledError:
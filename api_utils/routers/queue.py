@@ -1,38 +1,43 @@
 import time
 import logging
-from asyncio import Queue, Lock
+from asyncio import Lock
 from fastapi import Depends
 from fastapi.responses import JSONResponse
-from ..dependencies import get_logger, get_request_queue, get_processing_lock
+from ..dependencies import get_logger, get_request_queue, get_processing_lock, get_page_pool, get_stream_bridge
 from fastapi import HTTPException
 from ..error_utils import client_cancelled
+from ..fair_queue import FairRequestQueue
+from ..attachment_store import attachment_store
+from ..conversation_reuse import reuse_stats
+from ..model_affinity import model_switch_stats
+from ..response_cache import response_cache
+from ..singleflight import cancel_waiter, singleflight_stats
+from ..pacing import pacing
+from ..sse import sse_metrics
 
 
-async def cancel_queued_request(req_id: str, request_queue: Queue, logger: logging.Logger) -> bool:
-    items_to_requeue = []
-    found = False
-    try:
-        while not request_queue.empty():
-            item = request_queue.get_nowait()
-            if item.get("req_id") == req_id:
-                logger.info(f"[{req_id}] 在队列中找到请求，标记为已取消。")
-                item["cancelled"] = True
-                if (future := item.get("result_future")) and not future.done():
-                    future.set_exception(client_cancelled(req_id))
-                found = True
-            items_to_requeue.append(item)
-    finally:
-        for item in items_to_requeue:
-            await request_queue.put(item)
-    return found
+async def cancel_queued_request(req_id: str, request_queue: FairRequestQueue, logger: logging.Logger) -> bool:
+    item = request_queue.cancel(req_id)
+    if item is None:
+        return False
+    logger.info(f"[{req_id}] 在队列中找到请求，已取消。")
+    if (future := item.get("result_future")) and not future.done():
+        future.set_exception(client_cancelled(req_id))
+    return True
 
 
 async def cancel_request(
     req_id: str,
     logger: logging.Logger = Depends(get_logger),
-    request_queue: Queue = Depends(get_request_queue)
+    request_queue: FairRequestQueue = Depends(get_request_queue)
 ):
     logger.info(f"[{req_id}] 收到取消请求。")
+    # 合并执行中的等待者只让自己退出；最后一个等待者离开时才取消队列中的执行
+    flight = cancel_waiter(req_id)
+    if flight is not None:
+        if flight.abandoned.is_set():
+            await cancel_queued_request(flight.req_id, request_queue, logger)
+        return JSONResponse(content={"success": True, "message": f"Request {req_id} marked as cancelled."})
     if await cancel_queued_request(req_id, request_queue, logger):
         return JSONResponse(content={"success": True, "message": f"Request {req_id} marked as cancelled."})
     else:
@@ -40,23 +45,35 @@ async def cancel_request(
 
 
 async def get_queue_status(
-    request_queue: Queue = Depends(get_request_queue),
-    processing_lock: Lock = Depends(get_processing_lock)
+    request_queue: FairRequestQueue = Depends(get_request_queue),
+    processing_lock: Lock = Depends(get_processing_lock),
+    page_pool = Depends(get_page_pool),
+    stream_bridge = Depends(get_stream_bridge)
 ):
-    try:
-        queue_items = list(request_queue._queue)
-    except Exception:
-        queue_items = []
+    queue_items = list(request_queue.items())
     return JSONResponse(content={
         "queue_length": len(queue_items),
+        "scheduler": request_queue.status(page_pool.size if page_pool else 1),
         "is_processing_locked": processing_lock.locked(),
+        "page_pool": page_pool.status() if page_pool else None,
+        "stream_channels": stream_bridge.status() if stream_bridge else None,
+        "sse": sse_metrics.snapshot(),
+        "conversation_reuse": reuse_stats.to_status(),
+        "response_cache": response_cache.to_status(),
+        "attachment_store": attachment_store.to_status(),
+        "singleflight": singleflight_stats.to_status(),
+        "pacing": pacing.status(),
+        "model_switching": model_switch_stats.to_status(),
         "items": sorted([
             {
                 "req_id": item.get("req_id", "unknown"),
                 "enqueue_time": item.get("enqueue_time", 0),
                 "wait_time_seconds": round(time.time() - item.get("enqueue_time", 0), 2),
                 "is_streaming": item.get("request_data").stream,
-                "cancelled": item.get("cancelled", False)
+                "cancelled": item.get("cancelled", False),
+                "tenant": item.get("tenant"),
+                "priority": item.get("priority", 0),
+                "model": item.get("model"),
             } for item in queue_items
         ], key=lambda x: x.get("enqueue_time", 0))
     })
@@ -0,0 +1,230 @@
+"""
+相同请求的合并执行（singleflight）
+
+规范化键相同（与响应缓存相同的键，另区分 stream）的并发请求只入队一次：首个请求作为执行者，
+其余请求挂到同一次执行上等待，结果分发给所有等待者。流式结果经广播缓冲区分发，
+每个等待者从头读取同一份 SSE 数据，中途加入的请求也能收到完整输出。
+
+取消语义：单个等待者断开或取消只会让它自己退出；所有等待者都离开后，
+交给队列 Worker 的请求对象才报告断开，执行随之按原有的断开流程中止。
+"""
+
+import asyncio
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from models import ChatCompletionRequest
+from .client_connection import wait_for_disconnect
+from .error_utils import client_cancelled, client_disconnected
+from .response_cache import compute_cache_key
+
+class _FlightRequest:
+    """交给队列 Worker 的请求对象：所有等待者都离开后才报告客户端断开"""
+
+    def __init__(self, flight: "Flight"):
+        self._flight = flight
+
+    @property
+    def disconnect_event(self) -> asyncio.Event:
+        return self._flight.abandoned
+
+    async def _receive(self) -> Dict[str, Any]:
+        await self._flight.abandoned.wait()
+        return {"type": "http.disconnect"}
+
+    async def is_disconnected(self) -> bool:
+        return self._flight.abandoned.is_set()
+
+
+class SSEBroadcast:
+    """读取一次上游 SSE 生成器并缓存全部 chunk，多个订阅者各自从头读取"""
+
+    def __init__(self, source: AsyncGenerator[Any, None]):
+        self.source = source
+        self.chunks: List[Any] = []
+        self.done = False
+        self._signal = asyncio.Event()
+        self._pump_task: Optional[asyncio.Task] = None
+
+    def start(self, on_done: Callable[[], None]) -> None:
+        self._pump_task = asyncio.create_task(self._pump())
+        self._pump_task.add_done_callback(lambda _: on_done())
+
+    def _notify(self) -> None:
+        signal, self._signal = self._signal, asyncio.Event()
+        signal.set()
+
+    async def _pump(self) -> None:
+        try:
+            async for chunk in self.source:
+                self.chunks.append(chunk)
+                self._notify()
+        finally:
+            # 被取消时上游生成器可能停在中途，显式关闭以执行其清理逻辑
+            await self.source.aclose()
+            self.done = True
+            self._notify()
+
+    def cancel(self) -> None:
+        """所有订阅者都已离开：与客户端断开时相同，取消对上游生成器的读取"""
+        if self._pump_task is not None and not self._pump_task.done():
+            self._pump_task.cancel()
+
+    async def subscribe(self) -> AsyncGenerator[Any, None]:
+        index = 0
+        while True:
+            if index < len(self.chunks):
+                chunk = self.chunks[index]
+                index += 1
+                yield chunk
+                continue
+            if self.done:
+                return
+            await self._signal.wait()
+
+
+class Flight:
+    """一次进行中的执行及其所有等待者"""
+
+    def __init__(self, key: str, req_id: str):
+        self.key = key
+        self.req_id = req_id
+        self.result_future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.http_request = _FlightRequest(self)
+        self.abandoned = asyncio.Event()
+        self.waiters: Dict[str, asyncio.Future] = {}
+        self.broadcast: Optional[SSEBroadcast] = None
+        self.stream_response: Optional[StreamingResponse] = None
+        self.result_future.add_done_callback(self._deliver)
+
+    @property
+    def joinable(self) -> bool:
+        if self.abandoned.is_set():
+            return False
+        if not self.result_future.done():
+            return True
+        # 流式结果仍在广播时可以加入，从缓冲区开头读取
+        return self.broadcast is not None and not self.broadcast.done
+
+    def attach(self, req_id: str) -> asyncio.Future:
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[req_id] = waiter
+        if self.result_future.done():
+            self._deliver_to(req_id, waiter)
+        return waiter
+
+    def detach(self, req_id: str) -> None:
+        if self.waiters.pop(req_id, None) is None or self.waiters:
+            return
+        if self.broadcast is not None and self.broadcast.done:
+            return
+        self.abandoned.set()
+        _forget(self)
+        if self.broadcast is not None:
+            self.broadcast.cancel()
+
+    def _deliver(self, result_future: asyncio.Future) -> None:
+        if not result_future.cancelled() and result_future.exception() is None:
+            response = result_future.result()
+            if isinstance(response, StreamingResponse):
+                self.stream_response = response
+                self.broadcast = SSEBroadcast(response.body_iterator)
+                self.broadcast.start(on_done=lambda: _forget(self))
+        if self.broadcast is None:
+            # 非流式结果（或错误）分发完毕后，后续相同请求重新执行
+            _forget(self)
+        for req_id, waiter in list(self.waiters.items()):
+            self._deliver_to(req_id, waiter)
+
+    def _deliver_to(self, req_id: str, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            return
+        if self.result_future.cancelled():
+            waiter.set_exception(client_cancelled(req_id, "合并执行的请求已被取消"))
+        elif self.result_future.exception() is not None:
+            waiter.set_exception(self.result_future.exception())
+        elif self.broadcast is not None:
+            waiter.set_result(StreamingResponse(
+                self._subscribe(req_id),
+                status_code=self.stream_response.status_code,
+                media_type=self.stream_response.media_type,
+            ))
+        else:
+            waiter.set_result(self.result_future.result())
+
+    async def _subscribe(self, req_id: str) -> AsyncGenerator[Any, None]:
+        try:
+            async for chunk in self.broadcast.subscribe():
+                yield chunk
+        finally:
+            self.detach(req_id)
+
+    async def wait(self, req_id: str, http_request: Request, waiter: asyncio.Future) -> Response:
+        """等待结果，期间等待该等待者自身的断开事件；断开时只让该等待者离开"""
+        disconnect_task = asyncio.create_task(wait_for_disconnect(req_id, http_request))
+        try:
+            await asyncio.wait({waiter, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+            if waiter.done():
+                return waiter.result()
+            raise client_disconnected(req_id, "合并等待")
+        finally:
+            disconnect_task.cancel()
+            # 已收到流式结果时由订阅结束负责离开
+            if not (waiter.done() and not waiter.cancelled() and waiter.exception() is None
+                    and isinstance(waiter.result(), StreamingResponse)):
+                self.detach(req_id)
+
+
+class SingleflightStats:
+    def __init__(self):
+        self.leaders = 0
+        self.joined = 0
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(_flights),
+            "waiters": sum(len(flight.waiters) for flight in _flights.values()),
+            "leaders_total": self.leaders,
+            "joined_total": self.joined,
+        }
+
+
+singleflight_stats = SingleflightStats()
+_flights: Dict[str, Flight] = {}
+
+
+def _forget(flight: Flight) -> None:
+    if _flights.get(flight.key) is flight:
+        del _flights[flight.key]
+
+
+def _flight_key(request: ChatCompletionRequest) -> str:
+    # 缓存键不含 mcp_endpoint（指定端点的请求不进入缓存），合并时需区分端点
+    return f"{compute_cache_key(request)}:{request.mcp_endpoint or ''}:{'stream' if request.stream else 'json'}"
+
+
+async def join_flight(req_id: str, request: ChatCompletionRequest) -> Tuple[Flight, bool]:
+    """返回 (flight, 是否为执行者)；执行者需要把请求入队，其余请求直接等待"""
+    key = await asyncio.to_thread(_flight_key, request)
+    flight = _flights.get(key)
+    if flight is not None and flight.joinable:
+        singleflight_stats.joined += 1
+        return flight, False
+    flight = _flights[key] = Flight(key, req_id)
+    singleflight_stats.leaders += 1
+    return flight, True
+
+
+def cancel_waiter(req_id: str) -> Optional[Flight]:
+    """取消一个等待者，返回其所在的 flight；不存在时返回 None"""
+    for flight in list(_flights.values()):
+        waiter = flight.waiters.get(req_id)
+        if waiter is None:
+            continue
+        if not waiter.done():
+            waiter.set_exception(client_cancelled(req_id))
+        flight.detach(req_id)
+        return flight
+    return None
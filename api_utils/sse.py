@@ -1,6 +1,12 @@
+import asyncio
 import json
 import time
-from typing import Optional, Dict
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from config import SSE_COALESCE_WINDOW_MS, SSE_COALESCE_MAX_BYTES
+
+T = TypeVar("T")
 
 
 def generate_sse_chunk(delta: str, req_id: str, model: str) -> str:
@@ -14,6 +20,17 @@ def generate_sse_chunk(delta: str, req_id: str, model: str) -> str:
     return f"data: {json.dumps(chunk_data)}\n\n"
 
 
+def content_chunk_template(req_id: str, model: str) -> "SSEChunkTemplate":
+    """与 generate_sse_chunk 输出一致的正文 chunk 模板"""
+    return SSEChunkTemplate({
+        "id": f"chatcmpl-{req_id}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"content": SSEChunkTemplate.PLACEHOLDER}, "finish_reason": None}]
+    })
+
+
 def generate_sse_stop_chunk(req_id: str, model: str, reason: str = "stop", usage: Optional[Dict] = None) -> str:
     stop_chunk_data = {
         "id": f"chatcmpl-{req_id}",
@@ -31,3 +48,148 @@ def generate_sse_error_chunk(message: str, req_id: str, error_type: str = "serve
     error_chunk = {"error": {"message": message, "type": error_type, "param": None, "code": req_id}}
     return f"data: {json.dumps(error_chunk)}\n\n"
 
+
+
+class SSEMetrics:
+    """SSE 输出统计：累计值与最近 window_seconds 秒内的每秒速率"""
+
+    def __init__(self, window_seconds: int = 10):
+        self.window_seconds = window_seconds
+        self.chunks_total = 0
+        self.bytes_total = 0
+        self.deltas_total = 0
+        # [整数秒, chunks, bytes]
+        self._buckets: Deque[List[int]] = deque()
+
+    def record(self, chunk_bytes: int, deltas: int = 0) -> None:
+        self.chunks_total += 1
+        self.bytes_total += chunk_bytes
+        self.deltas_total += deltas
+        second = int(time.monotonic())
+        if self._buckets and self._buckets[-1][0] == second:
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += chunk_bytes
+        else:
+            self._buckets.append([second, 1, chunk_bytes])
+            self._expire(second)
+
+    def _expire(self, now_second: int) -> None:
+        while self._buckets and self._buckets[0][0] <= now_second - self.window_seconds:
+            self._buckets.popleft()
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._expire(int(time.monotonic()))
+        chunks = sum(bucket[1] for bucket in self._buckets)
+        sent_bytes = sum(bucket[2] for bucket in self._buckets)
+        return {
+            "chunks_total": self.chunks_total,
+            "bytes_total": self.bytes_total,
+            "deltas_total": self.deltas_total,
+            "chunks_per_second": round(chunks / self.window_seconds, 2),
+            "bytes_per_second": round(sent_bytes / self.window_seconds, 2),
+            "coalesce_window_ms": SSE_COALESCE_WINDOW_MS,
+            "coalesce_max_bytes": SSE_COALESCE_MAX_BYTES,
+        }
+
+
+sse_metrics = SSEMetrics()
+
+
+class SSEChunkTemplate:
+    """预先序列化的 chunk 模板：增量位置用 PLACEHOLDER 占位，渲染时只对增量文本做 JSON 转义"""
+    PLACEHOLDER = "__sse_delta_placeholder__"
+
+    def __init__(self, chunk: Dict[str, Any], ensure_ascii: bool = True, separators: Optional[Tuple[str, str]] = None):
+        self.ensure_ascii = ensure_ascii
+        serialized = json.dumps(chunk, ensure_ascii=ensure_ascii, separators=separators)
+        self.prefix, marker, suffix = serialized.partition(f'"{self.PLACEHOLDER}"')
+        if not marker:
+            raise ValueError("chunk 模板中缺少增量占位符")
+        self.prefix = "data: " + self.prefix
+        self.suffix = suffix + "\n\n"
+
+    def render(self, delta: str) -> str:
+        return f"{self.prefix}{json.dumps(delta, ensure_ascii=self.ensure_ascii)}{self.suffix}"
+
+
+class SSEWriter:
+    """Nagle 式合并的 SSE 增量输出。
+
+    同一字段（如 content / reasoning_content）的相邻增量先缓存，超过 max_bytes 或距首个缓存增量
+    超过 window_ms 时合并为一个 chunk 输出；字段切换或调用 flush 时立即输出。window_ms 为 0 时不合并。
+    """
+
+    def __init__(self, templates: Dict[str, SSEChunkTemplate],
+                 window_ms: int = SSE_COALESCE_WINDOW_MS, max_bytes: int = SSE_COALESCE_MAX_BYTES,
+                 metrics: Optional[SSEMetrics] = None):
+        self.templates = templates
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self.metrics = metrics if metrics is not None else sse_metrics
+        self._field: Optional[str] = None
+        self._parts: List[str] = []
+        self._pending_bytes = 0
+        self._first_at = 0.0
+
+    def push(self, field: str, delta: str) -> List[str]:
+        """缓存一个增量，返回此时需要发送的 chunk"""
+        if not delta:
+            return []
+        chunks = self.flush() if self._field not in (None, field) else []
+        if not self._parts:
+            self._field = field
+            self._first_at = time.monotonic()
+        self._parts.append(delta)
+        self._pending_bytes += len(delta.encode('utf-8'))
+        if self.window <= 0 or self._pending_bytes >= self.max_bytes:
+            chunks.extend(self.flush())
+        return chunks
+
+    def flush(self) -> List[str]:
+        if not self._parts:
+            return []
+        chunk = self.templates[self._field].render("".join(self._parts))
+        self.metrics.record(len(chunk), len(self._parts))
+        self._parts = []
+        self._pending_bytes = 0
+        self._field = None
+        return [chunk]
+
+    def flush_due_in(self) -> Optional[float]:
+        """距合并窗口到期的秒数；没有缓存增量时返回 None"""
+        if not self._parts:
+            return None
+        return max(0.0, self._first_at + self.window - time.monotonic())
+
+    def raw(self, chunk: str) -> str:
+        """记录一个不经合并的 chunk（如结束块），原样返回"""
+        self.metrics.record(len(chunk))
+        return chunk
+
+
+async def iter_with_flush_ticks(source: AsyncIterator[T], writer: SSEWriter) -> AsyncGenerator[Optional[T], None]:
+    """逐项产出 source 的数据；等待下一项期间 writer 的合并窗口到期时产出 None，调用方应随即 flush"""
+    iterator = source.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            due_in = writer.flush_due_in()
+            done, _ = await asyncio.wait({pending}, timeout=due_in)
+            if not done:
+                yield None
+                continue
+            future, pending = pending, None
+            try:
+                item = future.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.wait({pending})
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
@@ -3,14 +3,18 @@ Extended utility submodules extracted from api_utils.utils.
 This package groups stream, helper, validation, files, and tokens utilities.
 """
 
-from .stream import use_stream_response, clear_stream_queue
+from .stream import (
+    use_stream_response, clear_stream_queue, StreamQueueBridge, StreamDeltaAccumulator, start_stream_bridge,
+    open_stream_channel, close_stream_channel,
+)
 from .helper import use_helper_get_response
 from .validation import validate_chat_request
 from .files import _extension_for_mime, extract_data_url_to_local, save_blob_to_local
 from .tokens import estimate_tokens, calculate_usage_stats
 
 __all__ = [
-    'use_stream_response', 'clear_stream_queue',
+    'use_stream_response', 'clear_stream_queue', 'StreamQueueBridge', 'StreamDeltaAccumulator', 'start_stream_bridge',
+    'open_stream_channel', 'close_stream_channel',
     'use_helper_get_response',
     'validate_chat_request',
     '_extension_for_mime', 'extract_data_url_to_local', 'save_blob_to_local',
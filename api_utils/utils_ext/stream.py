@@ -1,11 +1,221 @@
 import asyncio
 import json
-from typing import Any, AsyncGenerator
+import queue
+import threading
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from config import STREAM_IDLE_TIMEOUT_SECONDS
+
+# 等待流数据时输出日志的间隔（秒）
+_WAIT_LOG_INTERVAL_SECONDS = 5.0
+# 轮询模式（未启动转发线程时的回退路径）的轮询间隔（秒）
+_POLL_INTERVAL_SECONDS = 0.1
+
+# 空闲超时哨兵
+_IDLE_TIMEOUT = object()
+
+
+class StreamQueueBridge:
+    """将辅助流子进程的 multiprocessing.Queue 转发到 asyncio.Queue。
+
+    后台线程阻塞读取跨进程队列，数据到达后通过 call_soon_threadsafe 投递到事件循环，
+    消费者只在数据到达时被唤醒，无需定时轮询。
+
+    辅助流按请求 ID（channel 字段）标记每条消息，转发时按请求分发到各自的通道；
+    未标记的消息进入默认队列，已关闭通道的迟到消息直接丢弃。
+    """
+
+    def __init__(self, source: Any, loop: asyncio.AbstractEventLoop):
+        self.source = source
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.channels: Dict[str, asyncio.Queue] = {}
+        self.dropped_count = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="StreamQueueBridge", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                item = self.source.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError, ValueError):
+                # 跨进程队列已关闭
+                break
+            try:
+                self.loop.call_soon_threadsafe(self._dispatch, item)
+            except RuntimeError:
+                # 事件循环已关闭
+                break
+
+    def _dispatch(self, item: Any) -> None:
+        """在事件循环中按 channel 分发一条消息（JSON 只在此处解析一次）"""
+        if isinstance(item, str):
+            try:
+                item = json.loads(item)
+            except json.JSONDecodeError:
+                pass
+        channel = item.pop("channel", None) if isinstance(item, dict) else None
+        if channel is None:
+            if len(self.channels) == 1:
+                # 页面未能标记请求时，唯一打开的通道即为数据归属
+                next(iter(self.channels.values())).put_nowait(item)
+            else:
+                self.queue.put_nowait(item)
+            return
+        channel_queue = self.channels.get(channel)
+        if channel_queue is None:
+            self.dropped_count += 1
+            return
+        channel_queue.put_nowait(item)
+
+    def open_channel(self, key: str) -> asyncio.Queue:
+        channel_queue = self.channels.get(key)
+        if channel_queue is None:
+            channel_queue = self.channels[key] = asyncio.Queue()
+        return channel_queue
+
+    def close_channel(self, key: str) -> int:
+        """关闭通道，返回未被消费而丢弃的消息数"""
+        channel_queue = self.channels.pop(key, None)
+        return channel_queue.qsize() if channel_queue is not None else 0
+
+    def status(self) -> Dict[str, Any]:
+        status = {
+            "open_channels": len(self.channels),
+            "untagged_pending": self.queue.qsize(),
+            "dropped_late_messages": self.dropped_count,
+        }
+        # 共享内存环形缓冲区持续已满（等待超时）时代理进程丢弃的消息
+        if hasattr(self.source, "dropped"):
+            status["dropped_ring_full"] = self.source.dropped
+        return status
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+
+    def drain(self) -> int:
+        """丢弃默认队列中已转发但尚未消费的数据，返回丢弃数量"""
+        dropped = 0
+        while True:
+            try:
+                self.queue.get_nowait()
+                dropped += 1
+            except asyncio.QueueEmpty:
+                return dropped
+
+
+class StreamDeltaAccumulator:
+    """累积辅助流的增量消息，还原完整的正文、思考内容与函数调用。
+
+    辅助流每条消息只携带新增的 reason/body 文本与新解析出的函数调用，并带有递增的 seq 序号。
+    序号不连续说明有消息丢失，此时 incomplete 为 True，累积的内容不完整，不能当作正常回复使用。
+    """
+
+    def __init__(self, req_id: str, logger: Any):
+        self.req_id = req_id
+        self.logger = logger
+        self.body = ""
+        self.reason = ""
+        self.functions: List[Dict[str, Any]] = []
+        self.done = False
+        self.timed_out = False
+        self.incomplete = False
+        self._next_seq = 0
+
+    def apply(self, data: Dict[str, Any]) -> Tuple[str, str]:
+        """应用一条消息，返回 (新增思考内容, 新增正文)"""
+        if "seq" not in data and data.get("reason") == "internal_timeout":
+            self.timed_out = True
+            self.done = True
+            return "", ""
+
+        seq = data.get("seq")
+        if seq is not None:
+            if seq != self._next_seq:
+                self.logger.error(f"[{self.req_id}] 辅助流增量序号不连续: 期望 {self._next_seq}，收到 {seq}，内容不完整")
+                self.incomplete = True
+            self._next_seq = seq + 1
+
+        reason_delta = data.get("reason") or ""
+        body_delta = data.get("body") or ""
+        self.reason += reason_delta
+        self.body += body_delta
+        self.functions.extend(data.get("function") or [])
+        if data.get("done"):
+            self.done = True
+        return reason_delta, body_delta
+
+
+def start_stream_bridge(source: Any) -> StreamQueueBridge:
+    """为 STREAM_QUEUE 启动转发线程（需在事件循环中调用）"""
+    bridge = StreamQueueBridge(source, asyncio.get_running_loop())
+    bridge.start()
+    return bridge
+
+
+def open_stream_channel(req_id: str) -> None:
+    """为请求打开辅助流通道（需在页面发出请求前调用，否则早到的数据会被丢弃）"""
+    from server import STREAM_BRIDGE
+    if STREAM_BRIDGE is not None:
+        STREAM_BRIDGE.open_channel(req_id)
+
+
+def close_stream_channel(req_id: str) -> None:
+    from server import STREAM_BRIDGE, logger
+    if STREAM_BRIDGE is None:
+        return
+    dropped = STREAM_BRIDGE.close_channel(req_id)
+    if dropped:
+        logger.info(f"[{req_id}] 关闭辅助流通道，丢弃 {dropped} 条未消费数据")
+
+
+async def _iter_bridge_items(req_id: str, bridge: StreamQueueBridge, logger) -> AsyncGenerator[Any, None]:
+    idle_seconds = 0.0
+    # 未打开通道时回退到默认队列（接收未标记的数据）
+    source = bridge.channels.get(req_id, bridge.queue)
+    while True:
+        try:
+            item = await asyncio.wait_for(source.get(), timeout=_WAIT_LOG_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            idle_seconds += _WAIT_LOG_INTERVAL_SECONDS
+            logger.info(f"[{req_id}] 等待流数据... ({idle_seconds:.0f}s/{STREAM_IDLE_TIMEOUT_SECONDS:.0f}s)")
+            if idle_seconds >= STREAM_IDLE_TIMEOUT_SECONDS:
+                yield _IDLE_TIMEOUT
+                return
+            continue
+        idle_seconds = 0.0
+        yield item
+
+
+async def _iter_polled_items(req_id: str, stream_queue: Any, logger) -> AsyncGenerator[Any, None]:
+    empty_count = 0
+    max_empty_retries = max(1, int(STREAM_IDLE_TIMEOUT_SECONDS / _POLL_INTERVAL_SECONDS))
+    while True:
+        try:
+            item = stream_queue.get_nowait()
+        except (queue.Empty, asyncio.QueueEmpty):
+            empty_count += 1
+            if empty_count % 50 == 0:
+                logger.info(f"[{req_id}] 等待流数据... ({empty_count}/{max_empty_retries})")
+            if empty_count >= max_empty_retries:
+                yield _IDLE_TIMEOUT
+                return
+            await asyncio.sleep(_POLL_INTERVAL_SECONDS)
+            continue
+        empty_count = 0
+        yield item
 
 
 async def use_stream_response(req_id: str) -> AsyncGenerator[Any, None]:
-    from server import STREAM_QUEUE, logger
-    import queue
+    from server import STREAM_QUEUE, STREAM_BRIDGE, logger
 
     if STREAM_QUEUE is None:
         logger.warning(f"[{req_id}] STREAM_QUEUE is None, 无法使用流响应")
@@ -13,66 +223,64 @@ async def use_stream_response(req_id: str) -> AsyncGenerator[Any, None]:
 
     logger.info(f"[{req_id}] 开始使用流响应")
 
-    empty_count = 0
-    max_empty_retries = 300
     data_received = False
+    if STREAM_BRIDGE is not None:
+        items = _iter_bridge_items(req_id, STREAM_BRIDGE, logger)
+    else:
+        items = _iter_polled_items(req_id, STREAM_QUEUE, logger)
 
     try:
-        while True:
-            try:
-                data = STREAM_QUEUE.get_nowait()
-                if data is None:
-                    logger.info(f"[{req_id}] 接收到流结束标志")
-                    break
-                empty_count = 0
-                data_received = True
-                logger.debug(f"[{req_id}] 接收到流数据: {type(data)} - {str(data)[:200]}...")
-
-                if isinstance(data, str):
-                    try:
-                        parsed_data = json.loads(data)
-                        if parsed_data.get("done") is True:
-                            logger.info(f"[{req_id}] 接收到JSON格式的完成标志")
-                            yield parsed_data
-                            break
-                        else:
-                            yield parsed_data
-                    except json.JSONDecodeError:
-                        logger.debug(f"[{req_id}] 返回非JSON字符串数据")
-                        yield data
+        async for data in items:
+            if data is _IDLE_TIMEOUT:
+                if not data_received:
+                    logger.error(f"[{req_id}] 流响应队列等待超时且未收到任何数据，可能是辅助流未启动或出错")
                 else:
-                    yield data
-                    if isinstance(data, dict) and data.get("done") is True:
-                        logger.info(f"[{req_id}] 接收到字典格式的完成标志")
+                    logger.warning(f"[{req_id}] 流响应队列空闲超过 {STREAM_IDLE_TIMEOUT_SECONDS:.0f}s，结束读取")
+                yield {"done": True, "reason": "internal_timeout", "body": "", "function": []}
+                return
+            if data is None:
+                logger.info(f"[{req_id}] 接收到流结束标志")
+                break
+            data_received = True
+            logger.debug(f"[{req_id}] 接收到流数据: {type(data)} - {str(data)[:200]}...")
+
+            if isinstance(data, str):
+                try:
+                    parsed_data = json.loads(data)
+                    if parsed_data.get("done") is True:
+                        logger.info(f"[{req_id}] 接收到JSON格式的完成标志")
+                        yield parsed_data
                         break
-            except (queue.Empty, asyncio.QueueEmpty):
-                empty_count += 1
-                if empty_count % 50 == 0:
-                    logger.info(f"[{req_id}] 等待流数据... ({empty_count}/{max_empty_retries})")
-                if empty_count >= max_empty_retries:
-                    if not data_received:
-                        logger.error(f"[{req_id}] 流响应队列空读取次数达到上限且未收到任何数据，可能是辅助流未启动或出错")
                     else:
-                        logger.warning(f"[{req_id}] 流响应队列空读取次数达到上限 ({max_empty_retries})，结束读取")
-                    yield {"done": True, "reason": "internal_timeout", "body": "", "function": []}
-                    return
-                await asyncio.sleep(0.1)
-                continue
+                        yield parsed_data
+                except json.JSONDecodeError:
+                    logger.debug(f"[{req_id}] 返回非JSON字符串数据")
+                    yield data
+            else:
+                yield data
+                if isinstance(data, dict) and data.get("done") is True:
+                    logger.info(f"[{req_id}] 接收到字典格式的完成标志")
+                    break
     except Exception as e:
         logger.error(f"[{req_id}] 使用流响应时出错: {e}")
         raise
     finally:
+        await items.aclose()
         logger.info(f"[{req_id}] 流响应使用完成，数据接收状态: {data_received}")
 
 
 async def clear_stream_queue():
-    from server import STREAM_QUEUE, logger
-    import queue
+    from server import STREAM_QUEUE, STREAM_BRIDGE, logger
 
     if STREAM_QUEUE is None:
         logger.info("流队列未初始化或已被禁用，跳过清空操作。")
         return
 
+    if STREAM_BRIDGE is not None:
+        dropped = STREAM_BRIDGE.drain()
+        logger.info(f"流式队列缓存清空完毕 (丢弃 {dropped} 条)。")
+        return
+
     while True:
         try:
             data_chunk = await asyncio.to_thread(STREAM_QUEUE.get_nowait)
@@ -83,4 +291,3 @@ async def clear_stream_queue():
             logger.error(f"清空流式队列时发生意外错误: {e}", exc_info=True)
             break
     logger.info("流式队列缓存清空完毕。")
-
@@ -13,6 +13,7 @@ from .operations import (
 )
 from .model_management import (
     switch_ai_studio_model,
+    fast_switch_ai_studio_model,
     load_excluded_models,
     _handle_initial_model_state_and_storage,
     _set_model_from_page_display,
@@ -22,6 +23,9 @@ from .model_management import (
     _verify_and_apply_ui_state
 )
 from .script_manager import ScriptManager, script_manager
+from .page_pool import PagePool, PageSlot, AccountStats, is_quota_error
+from .params_cache import PageParamsCache, ParamsState
+from .dom_stream import DomTextStream
 
 __all__ = [
     # 初始化相关
@@ -42,6 +46,7 @@ __all__ = [
     
     # 模型管理相关
     'switch_ai_studio_model',
+    'fast_switch_ai_studio_model',
     'load_excluded_models',
     '_handle_initial_model_state_and_storage',
     '_set_model_from_page_display',
@@ -52,5 +57,18 @@ __all__ = [
 
     # 脚本管理相关
     'ScriptManager',
-    'script_manager'
+    'script_manager',
+
+    # 页面池相关
+    'PagePool',
+    'PageSlot',
+    'AccountStats',
+    'is_quota_error',
+
+    # 参数状态缓存相关
+    'PageParamsCache',
+    'ParamsState',
+
+    # 页面内流式输出相关
+    'DomTextStream'
 ]
\ No newline at end of file
@@ -0,0 +1,179 @@
+# --- browser_utils/dom_stream.py ---
+# Playwright 模式的真实流式输出：页面内监听响应文本变化，通过 expose_binding 推送增量
+
+import asyncio
+import logging
+import time
+import weakref
+from typing import AsyncGenerator, Dict, List, Optional
+
+from playwright.async_api import Page as AsyncPage, Error as PlaywrightAsyncError
+
+from config import RESPONSE_CONTAINER_SELECTOR, RESPONSE_TEXT_SELECTOR
+
+logger = logging.getLogger("AIStudioProxyServer")
+
+DOM_STREAM_BINDING = "__aistudioStreamDelta"
+# 页面内合并多次 DOM 变化后再读取文本的间隔（毫秒）
+_FLUSH_INTERVAL_MS = 30
+
+# 页面内监听脚本：只推送在已推送文本之后追加的部分。
+# 当前行存在未闭合的行内 Markdown 标记时（如 **bold 尚未结束），渲染结果随后会变化，
+# 先保留该标记之后的内容，直到该行结束。
+_OBSERVER_JS = """
+([binding, token, containerSelector, textSelector, intervalMs]) => {
+    const registry = window.__aistudioDomStream = window.__aistudioDomStream || {};
+    let sent = '';
+    let timer = null;
+
+    const readText = () => {
+        const containers = document.querySelectorAll(containerSelector);
+        const container = containers[containers.length - 1];
+        if (!container) return '';
+        return Array.from(container.querySelectorAll(textSelector))
+            .filter((node) => !node.parentElement || !node.parentElement.closest(textSelector))
+            .map((node) => node.innerText)
+            .join('\\n');
+    };
+    const stableLength = (text) => {
+        const lineStart = text.lastIndexOf('\\n') + 1;
+        const marker = text.slice(lineStart).search(/[*_`~\\[]/);
+        return marker === -1 ? text.length : lineStart + marker;
+    };
+    const flush = () => {
+        timer = null;
+        const text = readText();
+        if (!text.startsWith(sent)) return;
+        const end = stableLength(text);
+        if (end > sent.length) {
+            const delta = text.slice(sent.length, end);
+            sent = text.slice(0, end);
+            window[binding](token, delta);
+        }
+    };
+    const schedule = () => {
+        if (timer === null) timer = setTimeout(flush, intervalMs);
+    };
+
+    const observer = new MutationObserver(schedule);
+    observer.observe(document.body, {subtree: true, childList: true, characterData: true});
+    registry[token] = () => {
+        observer.disconnect();
+        if (timer !== null) clearTimeout(timer);
+        delete registry[token];
+        return {sent, text: readText()};
+    };
+    schedule();
+}
+"""
+
+_STOP_JS = """
+(token) => {
+    const registry = window.__aistudioDomStream;
+    return registry && registry[token] ? registry[token]() : null;
+}
+"""
+
+class DomStreamDivergedError(RuntimeError):
+    """最终内容与已推送的渲染文本不一致（如代码块、列表重新渲染），已推送的输出无法补齐为完整回复"""
+
+
+# 每个页面只能注册一次 binding，按 token 把增量分发到各自的队列
+_page_routes: "weakref.WeakKeyDictionary[AsyncPage, Dict[str, asyncio.Queue]]" = weakref.WeakKeyDictionary()
+
+
+async def _ensure_binding(page: AsyncPage) -> Dict[str, asyncio.Queue]:
+    routes = _page_routes.get(page)
+    if routes is not None:
+        return routes
+    routes = _page_routes[page] = {}
+
+    def on_delta(source, token: str, delta: str) -> None:
+        queue = routes.get(token)
+        if queue is not None:
+            queue.put_nowait(delta)
+
+    try:
+        await page.expose_binding(DOM_STREAM_BINDING, on_delta)
+    except Exception:
+        _page_routes.pop(page, None)
+        raise
+    return routes
+
+
+class DomTextStream:
+    """监听页面最后一个响应容器的渲染文本，按追加顺序产出增量。
+
+    推送的是渲染后的文本（innerText），与编辑按钮获取的原始 Markdown 可能不同；
+    生成结束后由 completion_tail 按最终内容补齐未推送的部分，无法补齐时抛出 DomStreamDivergedError。
+    """
+
+    def __init__(self, page: AsyncPage, req_id: str):
+        self.page = page
+        self.req_id = req_id
+        self.token = f"{req_id}-{time.monotonic_ns()}"
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.streamed = ""
+        self.rendered_text: Optional[str] = None
+        self._routes: Optional[Dict[str, asyncio.Queue]] = None
+        self._stopped = False
+
+    async def start(self) -> None:
+        self._routes = await _ensure_binding(self.page)
+        self._routes[self.token] = self.queue
+        await self.page.evaluate(
+            _OBSERVER_JS,
+            [DOM_STREAM_BINDING, self.token, RESPONSE_CONTAINER_SELECTOR, RESPONSE_TEXT_SELECTOR, _FLUSH_INTERVAL_MS],
+        )
+
+    def _accept(self, delta: str) -> str:
+        self.streamed += delta
+        return delta
+
+    async def deltas_until(self, done_task: asyncio.Future) -> AsyncGenerator[str, None]:
+        """产出增量，直到 done_task 完成"""
+        while not done_task.done():
+            get_task = asyncio.ensure_future(self.queue.get())
+            await asyncio.wait({get_task, done_task}, return_when=asyncio.FIRST_COMPLETED)
+            if get_task.done():
+                yield self._accept(get_task.result())
+            else:
+                get_task.cancel()
+
+    async def stop(self) -> List[str]:
+        """停止页面内监听，返回已推送但尚未产出的增量"""
+        if self._stopped:
+            return []
+        self._stopped = True
+        state = None
+        try:
+            state = await self.page.evaluate(_STOP_JS, self.token)
+        except PlaywrightAsyncError as e:
+            logger.debug(f"[{self.req_id}] 停止页面内响应文本监听失败: {e}")
+        finally:
+            if self._routes is not None:
+                self._routes.pop(self.token, None)
+
+        pending = []
+        while not self.queue.empty():
+            pending.append(self._accept(self.queue.get_nowait()))
+        if state:
+            self.rendered_text = state.get("text")
+            # binding 回调可能晚于 evaluate 返回，以页面记录的已推送文本为准补齐
+            page_sent = state.get("sent") or ""
+            if len(page_sent) > len(self.streamed) and page_sent.startswith(self.streamed):
+                pending.append(self._accept(page_sent[len(self.streamed):]))
+        return pending
+
+    def completion_tail(self, final_content: Optional[str]) -> str:
+        """按最终内容返回尚未推送的部分；原始 Markdown 与已推送的渲染文本不一致时改用渲染文本补齐。
+
+        两者都不以已推送的文本开头时（渲染文本在生成过程中被改写，页面内推送随之停止），
+        已推送的输出不完整，抛出 DomStreamDivergedError，不作为正常回复结束。
+        """
+        for candidate in (final_content, self.rendered_text):
+            if candidate and candidate.startswith(self.streamed):
+                return self._accept(candidate[len(self.streamed):])
+        raise DomStreamDivergedError(
+            f"页面渲染文本与已推送的 {len(self.streamed)} 个字符不一致，流式输出不完整"
+        )
@@ -221,7 +221,14 @@ def _find_template_model(models_array):
 
 
 async def _add_init_scripts_to_context(context: AsyncBrowserContext):
-    """在浏览器上下文中添加初始化脚本（备用方案）"""
+    """在浏览器上下文中添加初始化脚本：参数辅助脚本，以及油猴脚本（备用方案）"""
+    try:
+        from .param_helper import PARAM_HELPER_JS
+        await context.add_init_script(PARAM_HELPER_JS)
+        logger.info("✅ 已将参数辅助脚本添加到浏览器上下文初始化脚本")
+    except Exception as e:
+        logger.error(f"添加参数辅助脚本时发生错误: {e}")
+
     try:
         from config.settings import USERSCRIPT_PATH
 
@@ -266,8 +273,11 @@ def _clean_userscript_headers(script_content: str) -> str:
     return '\n'.join(cleaned_lines)
 
 
-async def _initialize_page_logic(browser: AsyncBrowser):
-    """初始化页面逻辑，连接到现有浏览器"""
+async def _initialize_page_logic(browser: AsyncBrowser, storage_state_path: Optional[str] = None):
+    """初始化页面逻辑，连接到现有浏览器
+
+    storage_state_path: 指定认证文件（多账号分片模式使用），为空时按启动模式从环境变量读取。
+    """
     logger.info("--- 初始化页面逻辑 (连接到现有浏览器) ---")
     temp_context: Optional[AsyncBrowserContext] = None
     storage_state_path_to_use: Optional[str] = None
@@ -275,7 +285,13 @@ async def _initialize_page_logic(browser: AsyncBrowser):
     logger.info(f"   检测到启动模式: {launch_mode}")
     loop = asyncio.get_running_loop()
 
-    if launch_mode == 'headless' or launch_mode == 'virtual_headless':
+    if storage_state_path:
+        if not os.path.exists(storage_state_path):
+            logger.error(f"指定的认证文件不存在: '{storage_state_path}'")
+            raise RuntimeError(f"指定的认证文件不存在: '{storage_state_path}'")
+        storage_state_path_to_use = storage_state_path
+        logger.info(f"   使用指定的认证文件: {storage_state_path}")
+    elif launch_mode == 'headless' or launch_mode == 'virtual_headless':
         auth_filename = os.environ.get('ACTIVE_AUTH_JSON_PATH')
         if auth_filename:
             constructed_path = auth_filename
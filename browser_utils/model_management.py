@@ -5,6 +5,7 @@ import asyncio
 import json
 import os
 import logging
+import re
 import time
 from typing import Optional, Set
 
@@ -14,6 +15,9 @@ from playwright.async_api import Page as AsyncPage, expect as expect_async, Erro
 from config import (
     INPUT_SELECTOR,
     AI_STUDIO_URL_PATTERN,
+    MODEL_NAME_SELECTOR,
+    MODEL_SELECTOR_BUTTON_SELECTOR,
+    MODEL_OPTION_SELECTOR,
 )
 from models import ClientDisconnectedError
 
@@ -193,6 +197,48 @@ async def _verify_and_apply_ui_state(page: AsyncPage, req_id: str = "unknown") -
         logger.error(f"[{req_id}] 验证并应用UI状态设置时发生错误: {e}")
         return False
 
+async def fast_switch_ai_studio_model(page: AsyncPage, model_id: str, req_id: str) -> bool:
+    """不重新加载页面，通过页面内的模型选择器切换模型；页面显示的模型 ID 与目标一致才算成功"""
+    import server
+    display_name = next(
+        (m.get("display_name") for m in getattr(server, 'parsed_model_list', []) if m.get("id") == model_id),
+        None,
+    )
+    names = [re.escape(model_id)] + ([re.escape(display_name)] if display_name else [])
+    option_text = re.compile(rf"^\s*({'|'.join(names)})\s*$")
+    try:
+        selector_button = page.locator(MODEL_SELECTOR_BUTTON_SELECTOR).first
+        # 先做不等待的探测：选择器不匹配时立即回退导航切换，不消耗点击超时
+        if not await selector_button.is_visible():
+            logger.info(f"[{req_id}] 页面上未找到模型选择器，跳过快速切换")
+            return False
+        await selector_button.click(timeout=1000)
+        option = page.locator(MODEL_OPTION_SELECTOR).filter(has=page.get_by_text(option_text)).first
+        await option.wait_for(state="visible", timeout=1000)
+        await option.click(timeout=1000)
+        await expect_async(page.locator(MODEL_NAME_SELECTOR).first).to_have_text(
+            re.compile(rf"^\s*{re.escape(model_id)}\s*$"), timeout=5000
+        )
+    except Exception as e:
+        logger.warning(f"[{req_id}] 快速切换模型到 {model_id} 未通过验证: {e}")
+        try:
+            # 关闭可能仍打开的模型选择面板
+            await page.keyboard.press("Escape")
+        except Exception:
+            pass
+        return False
+
+    # 同步 localStorage，页面之后重新加载时保持该模型
+    try:
+        prefs_str = await page.evaluate("() => localStorage.getItem('aiStudioUserPreference')")
+        prefs = json.loads(prefs_str) if prefs_str else {}
+        prefs["promptModel"] = f"models/{model_id}"
+        await page.evaluate("(prefsStr) => localStorage.setItem('aiStudioUserPreference', prefsStr)", json.dumps(prefs))
+    except Exception as e:
+        logger.warning(f"[{req_id}] 快速切换模型后更新 localStorage.promptModel 失败: {e}")
+    logger.info(f"[{req_id}] ✅ 已通过模型选择器切换到 {model_id}（未重新加载页面）")
+    return True
+
 async def switch_ai_studio_model(page: AsyncPage, model_id: str, req_id: str) -> bool:
     """切换AI Studio模型"""
     logger.info(f"[{req_id}] 开始切换模型到: {model_id}")
@@ -18,7 +18,11 @@ from config import (
     ERROR_TOAST_SELECTOR,
     CLICK_TIMEOUT_MS,
     RESPONSE_COMPLETION_TIMEOUT,
+    RESPONSE_COMPLETION_SETTLE_MS,
     INITIAL_WAIT_MS_BEFORE_POLLING,
+    PROMPT_TEXTAREA_SELECTOR,
+    SUBMIT_BUTTON_SELECTOR,
+    EDIT_MESSAGE_BUTTON_SELECTOR,
 )
 from models import ClientDisconnectedError
 
@@ -675,7 +679,7 @@ async def get_response_via_copy_button(
         await save_error_snapshot(f"copy_response_unexpected_error_{req_id}")
         return None
 
-async def _wait_for_response_completion(
+async def _poll_for_response_completion(
     page: AsyncPage,
     prompt_textarea_locator: Locator,
     submit_button_locator: Locator,
@@ -686,7 +690,7 @@ async def _wait_for_response_completion(
     timeout_ms=RESPONSE_COMPLETION_TIMEOUT,
     initial_wait_ms=INITIAL_WAIT_MS_BEFORE_POLLING
 ) -> bool:
-    """等待响应完成"""
+    """轮询等待响应完成（页面内监听不可用时的回退路径）"""
     from playwright.async_api import TimeoutError
     
     logger.info(f"[{req_id}] (WaitV3) 开始等待响应完成... (超时: {timeout_ms}ms)")
@@ -763,6 +767,161 @@ async def _wait_for_response_completion(
 
         await asyncio.sleep(0.5) # 轮询间隔
 
+# 页面内的响应完成监听脚本。
+# 返回的 Promise 在以下情况 resolve:
+#   'edit'    - 输入框空、提交按钮禁用且编辑按钮可见
+#   'settled' - 输入框空、提交按钮禁用，且 DOM 在 settleMs 内无变化（编辑按钮未出现的启发式完成）
+#   'timeout' - 超过 timeoutMs
+#   'aborted' - 通过 window.__aistudioCompletion[token]() 中止
+_COMPLETION_OBSERVER_JS = """
+([token, selectors, timeoutMs, settleMs]) => new Promise((resolve) => {
+    const registry = window.__aistudioCompletion = window.__aistudioCompletion || {};
+    let finished = false;
+    let pending = false;
+    let settleTimer = null;
+    let metSince = null;
+
+    const isVisible = (el) => {
+        if (!el || getComputedStyle(el).visibility === 'hidden') return false;
+        return el.getClientRects().length > 0;
+    };
+    const isDisabled = (el) => !!el && (el.disabled || el.getAttribute('aria-disabled') === 'true');
+    const primaryMet = () => {
+        const input = document.querySelector(selectors.input);
+        return !!input && input.value === '' && isDisabled(document.querySelector(selectors.submit));
+    };
+    const clearSettle = () => {
+        if (settleTimer !== null) {
+            clearTimeout(settleTimer);
+            settleTimer = null;
+        }
+    };
+
+    const finish = (result) => {
+        if (finished) return;
+        finished = true;
+        observer.disconnect();
+        document.removeEventListener('input', schedule, true);
+        clearInterval(safety);
+        clearTimeout(deadline);
+        clearSettle();
+        delete registry[token];
+        resolve(result);
+    };
+    const check = () => {
+        pending = false;
+        if (finished) return;
+        if (!primaryMet()) {
+            metSince = null;
+            clearSettle();
+            return;
+        }
+        if (metSince === null) metSince = performance.now();
+        if (Array.from(document.querySelectorAll(selectors.edit)).some(isVisible)) {
+            finish('edit');
+            return;
+        }
+        if (settleTimer === null) {
+            settleTimer = setTimeout(() => {
+                settleTimer = null;
+                if (primaryMet()) finish('settled');
+            }, settleMs);
+        }
+    };
+    function schedule() {
+        if (!pending) {
+            pending = true;
+            queueMicrotask(check);
+        }
+    }
+
+    const observer = new MutationObserver(() => {
+        // DOM 仍在变化时推迟启发式完成，但条件持续满足超过 3 个窗口后不再推迟
+        if (metSince !== null && performance.now() - metSince < settleMs * 3) clearSettle();
+        schedule();
+    });
+    observer.observe(document.body, {subtree: true, childList: true, attributes: true, characterData: true});
+    // 输入框 value 属性的变化不会产生 mutation，由 input 事件与低频兜底检查覆盖
+    document.addEventListener('input', schedule, true);
+    const safety = setInterval(check, 1000);
+    const deadline = setTimeout(() => finish('timeout'), timeoutMs);
+    registry[token] = () => finish('aborted');
+    check();
+})
+"""
+
+_ABORT_COMPLETION_OBSERVER_JS = """
+(token) => {
+    const registry = window.__aistudioCompletion;
+    if (registry && registry[token]) registry[token]();
+}
+"""
+
+async def _wait_for_response_completion(
+    page: AsyncPage,
+    prompt_textarea_locator: Locator,
+    submit_button_locator: Locator,
+    edit_button_locator: Locator,
+    req_id: str,
+    check_client_disconnected_func: Callable,
+    current_chat_id: Optional[str],
+    timeout_ms=RESPONSE_COMPLETION_TIMEOUT,
+    initial_wait_ms=INITIAL_WAIT_MS_BEFORE_POLLING
+) -> bool:
+    """等待响应完成
+
+    在页面内安装 MutationObserver，按钮与输入框状态变化时立即判定，无需逐项往返查询；
+    等待期间只在本地检查客户端断开。页面内监听失败（如页面导航）时回退到轮询。
+    """
+    logger.info(f"[{req_id}] (WaitV4) 开始等待响应完成... (超时: {timeout_ms}ms)")
+    await asyncio.sleep(initial_wait_ms / 1000)
+
+    start_time = time.time()
+    token = f"{req_id}-{time.monotonic_ns()}"
+    selectors = {
+        "input": PROMPT_TEXTAREA_SELECTOR,
+        "submit": SUBMIT_BUTTON_SELECTOR,
+        "edit": EDIT_MESSAGE_BUTTON_SELECTOR,
+    }
+    observer_task = asyncio.create_task(
+        page.evaluate(_COMPLETION_OBSERVER_JS, [token, selectors, timeout_ms, RESPONSE_COMPLETION_SETTLE_MS])
+    )
+    try:
+        while not observer_task.done():
+            try:
+                check_client_disconnected_func("等待响应完成 - 页面监听中")
+            except ClientDisconnectedError:
+                logger.info(f"[{req_id}] (WaitV4) 客户端断开连接，中止等待。")
+                try:
+                    await page.evaluate(_ABORT_COMPLETION_OBSERVER_JS, token)
+                except PlaywrightAsyncError:
+                    pass
+                return False
+            await asyncio.wait({observer_task}, timeout=0.5)
+        result = observer_task.result()
+    except PlaywrightAsyncError as e:
+        remaining_ms = max(0, timeout_ms - (time.time() - start_time) * 1000)
+        logger.warning(f"[{req_id}] (WaitV4) 页面内完成监听失败，回退到轮询检测: {e}")
+        return await _poll_for_response_completion(
+            page, prompt_textarea_locator, submit_button_locator, edit_button_locator, req_id,
+            check_client_disconnected_func, current_chat_id, timeout_ms=remaining_ms, initial_wait_ms=0
+        )
+    finally:
+        if not observer_task.done():
+            observer_task.cancel()
+
+    elapsed_ms = (time.time() - start_time) * 1000
+    if result == "edit":
+        logger.info(f"[{req_id}] (WaitV4) ✅ 响应完成: 输入框空，提交按钮禁用，编辑按钮可见。({elapsed_ms:.0f}ms)")
+        return True
+    if result == "settled":
+        logger.warning(f"[{req_id}] (WaitV4) 响应可能已完成 (启发式): 输入框空，提交按钮禁用，页面已稳定 {RESPONSE_COMPLETION_SETTLE_MS}ms 但编辑按钮仍未出现。假定完成。后续若内容获取失败，可能与此有关。")
+        return True
+    if result == "timeout":
+        logger.error(f"[{req_id}] (WaitV4) 等待响应完成超时 ({timeout_ms}ms)。")
+        await save_error_snapshot(f"wait_completion_v4_overall_timeout_{req_id}")
+    return False
+
 async def _get_final_response_content(
     page: AsyncPage,
     req_id: str,
@@ -4,7 +4,7 @@ PageController模块
 """
 import asyncio
 import re
-from typing import Callable, List, Dict, Any, Optional
+from typing import AsyncGenerator, Callable, List, Dict, Any, Optional, Tuple
 
 from playwright.async_api import Page as AsyncPage, expect as expect_async, TimeoutError
 
@@ -25,6 +25,44 @@ from config import (
 from models import ClientDisconnectedError
 from .operations import save_error_snapshot, _wait_for_response_completion, _get_final_response_content
 from .initialization import enable_temporary_chat_mode
+from .dom_stream import DomTextStream
+from .param_helper import apply_parameters
+from .params_cache import INVALIDATE_VERIFY_FAILED, ParamsState
+
+# 提交已被页面接收：输入框已清空，或提交按钮已禁用（与提交后的验证方法 1、2 相同）
+_SUBMISSION_STARTED_JS = """
+([textareaSelector, buttonSelector, originalContent]) => {
+    const textarea = document.querySelector(textareaSelector);
+    if (originalContent && textarea && !textarea.value.trim()) return true;
+    const button = document.querySelector(buttonSelector);
+    return !!button && (button.disabled || button.getAttribute('aria-disabled') === 'true');
+}
+"""
+# 等待提交被页面接收的最长时间（毫秒），原为固定等待 2 秒
+_SUBMISSION_STARTED_TIMEOUT_MS = 2000
+
+
+def _clamp(value: float, lower: float, upper: float) -> float:
+    return max(lower, min(upper, value))
+
+
+def _normalize_stop_sequences(stop_sequences) -> set:
+    """把字符串或字符串列表形式的停止序列规范化为去除首尾空白的集合"""
+    if isinstance(stop_sequences, str):
+        stop_sequences = [stop_sequences]
+    if not isinstance(stop_sequences, list):
+        return set()
+    return {s.strip() for s in stop_sequences if isinstance(s, str) and s.strip()}
+
+
+def _param_matches(actual: Any, expected: Any) -> bool:
+    if actual is None:
+        return False
+    if isinstance(expected, bool) or isinstance(actual, bool):
+        return actual is expected
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        return abs(actual - expected) < 1e-6
+    return actual == expected
 
 class PageController:
     """封装了与AI Studio页面交互的所有操作。"""
@@ -33,51 +71,125 @@ class PageController:
         self.page = page
         self.logger = logger
         self.req_id = req_id
+        # stream_response 完成后页面返回的原始 Markdown（流式增量为渲染文本，会丢失代码块等格式）
+        self.final_response_content: Optional[str] = None
 
     async def _check_disconnect(self, check_client_disconnected: Callable, stage: str):
         """检查客户端是否断开连接。"""
         if check_client_disconnected(stage):
             raise ClientDisconnectedError(f"[{self.req_id}] Client disconnected at stage: {stage}")
 
-    async def adjust_parameters(self, request_params: Dict[str, Any], page_params_cache: Dict[str, Any], params_cache_lock: asyncio.Lock, model_id_to_use: str, parsed_model_list: List[Dict[str, Any]], check_client_disconnected: Callable):
-        """调整所有请求参数。"""
+    async def adjust_parameters(self, request_params: Dict[str, Any], page_params_cache: ParamsState, params_cache_lock: asyncio.Lock, model_id_to_use: str, parsed_model_list: List[Dict[str, Any]], check_client_disconnected: Callable):
+        """调整所有请求参数：与参数缓存比对，变化的参数经页面内辅助脚本一次应用并读回验证；未通过验证的参数逐项调整。"""
         self.logger.info(f"[{self.req_id}] 开始调整所有请求参数...")
         await self._check_disconnect(check_client_disconnected, "Start Parameter Adjustment")
 
-        # 调整温度
-        temp_to_set = request_params.get('temperature', DEFAULT_TEMPERATURE)
-        await self._adjust_temperature(temp_to_set, page_params_cache, params_cache_lock, check_client_disconnected)
-        await self._check_disconnect(check_client_disconnected, "After Temperature Adjustment")
-
-        # 调整最大Token
-        max_tokens_to_set = request_params.get('max_output_tokens', DEFAULT_MAX_OUTPUT_TOKENS)
-        await self._adjust_max_tokens(max_tokens_to_set, page_params_cache, params_cache_lock, model_id_to_use, parsed_model_list, check_client_disconnected)
-        await self._check_disconnect(check_client_disconnected, "After Max Tokens Adjustment")
-
-        # 调整停止序列
-        stop_to_set = request_params.get('stop', DEFAULT_STOP_SEQUENCES)
-        await self._adjust_stop_sequences(stop_to_set, page_params_cache, params_cache_lock, check_client_disconnected)
-        await self._check_disconnect(check_client_disconnected, "After Stop Sequences Adjustment")
+        desired = self._desired_parameters(request_params, model_id_to_use, parsed_model_list)
+        async with params_cache_lock:
+            changes = {
+                key: value for key, value in desired.items()
+                if not _param_matches(page_params_cache.get(key), value)
+            }
+            if not changes:
+                self.logger.info(f"[{self.req_id}] 所有参数与缓存一致。跳过页面交互。")
+                return
 
-        # 调整Top P
-        top_p_to_set = request_params.get('top_p', DEFAULT_TOP_P)
-        await self._adjust_top_p(top_p_to_set, check_client_disconnected)
-        await self._check_disconnect(check_client_disconnected, "End Parameter Adjustment")
+            self.logger.info(f"[{self.req_id}] 需要更新的参数: {sorted(changes)}，通过页面辅助脚本一次应用...")
+            failed = set(changes)
+            try:
+                result = await apply_parameters(
+                    self.page,
+                    {key: sorted(value) if isinstance(value, set) else value for key, value in changes.items()},
+                )
+            except Exception as e:
+                self.logger.warning(f"[{self.req_id}] 页面辅助脚本应用参数失败: {e}")
+                result = None
+            if result:
+                values = result.get("values") or {}
+                if result.get("errors"):
+                    self.logger.warning(f"[{self.req_id}] 页面辅助脚本未找到部分参数元素: {result['errors']}")
+                failed = set()
+                for key, value in desired.items():
+                    actual = values.get(key)
+                    if key == "stop_sequences" and actual is not None:
+                        actual = set(actual)
+                    if _param_matches(actual, value):
+                        page_params_cache[key] = value
+                    else:
+                        # 读回值与期望不符（包括缓存已过期的参数）
+                        failed.add(key)
+                page_params_cache.invalidate(failed, INVALIDATE_VERIFY_FAILED)
+        await self._check_disconnect(check_client_disconnected, "After Parameter Helper")
+
+        if failed:
+            self.logger.warning(f"[{self.req_id}] 参数 {sorted(failed)} 未通过验证，逐项调整...")
+            await self._adjust_parameters_stepwise(
+                failed, request_params, page_params_cache, params_cache_lock, model_id_to_use, parsed_model_list, check_client_disconnected
+            )
+        else:
+            self.logger.info(f"[{self.req_id}] ✅ 参数已全部应用并验证。")
+
+    def _desired_parameters(self, request_params: Dict[str, Any], model_id_to_use: str, parsed_model_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """计算本次请求期望的页面参数；值为 None 的参数不由本次请求管理"""
+        thinking_enabled, thinking_budget = self._desired_thinking_budget(request_params)
+        desired = {
+            "temperature": _clamp(request_params.get('temperature', DEFAULT_TEMPERATURE), 0.0, 2.0),
+            "max_output_tokens": self._clamp_max_tokens(
+                request_params.get('max_output_tokens', DEFAULT_MAX_OUTPUT_TOKENS), model_id_to_use, parsed_model_list
+            ),
+            "stop_sequences": _normalize_stop_sequences(request_params.get('stop', DEFAULT_STOP_SEQUENCES)),
+            "top_p": _clamp(request_params.get('top_p', DEFAULT_TOP_P), 0.0, 1.0),
+            # URL Context 只会被开启，未启用该功能时不改变页面状态
+            "url_context": True if ENABLE_URL_CONTEXT else None,
+            "thinking_budget_enabled": thinking_enabled,
+            "thinking_budget": thinking_budget,
+            "google_search": self._should_enable_google_search(request_params),
+        }
+        return {key: value for key, value in desired.items() if value is not None}
+
+    def _desired_thinking_budget(self, request_params: Dict[str, Any]) -> Tuple[bool, Optional[int]]:
+        """返回 (思考预算开关是否开启, 预算值)；与 _handle_thinking_budget 的判断一致"""
+        reasoning_effort = request_params.get('reasoning_effort')
+        if isinstance(reasoning_effort, str) and reasoning_effort.lower() == 'none':
+            return False, None
+        if reasoning_effort is not None:
+            return True, self._parse_thinking_budget(reasoning_effort)
+        if ENABLE_THINKING_BUDGET:
+            return True, self._parse_thinking_budget(None)
+        return False, None
+
+    async def _adjust_parameters_stepwise(self, keys: set, request_params: Dict[str, Any], page_params_cache: Dict[str, Any], params_cache_lock: asyncio.Lock, model_id_to_use: str, parsed_model_list: List[Dict[str, Any]], check_client_disconnected: Callable):
+        """逐项调整参数（每个参数多次页面往返），用于辅助脚本未能应用的参数"""
+        if "temperature" in keys:
+            await self._adjust_temperature(request_params.get('temperature', DEFAULT_TEMPERATURE), page_params_cache, params_cache_lock, check_client_disconnected)
+            await self._check_disconnect(check_client_disconnected, "After Temperature Adjustment")
+
+        if "max_output_tokens" in keys:
+            await self._adjust_max_tokens(request_params.get('max_output_tokens', DEFAULT_MAX_OUTPUT_TOKENS), page_params_cache, params_cache_lock, model_id_to_use, parsed_model_list, check_client_disconnected)
+            await self._check_disconnect(check_client_disconnected, "After Max Tokens Adjustment")
+
+        if "stop_sequences" in keys:
+            await self._adjust_stop_sequences(request_params.get('stop', DEFAULT_STOP_SEQUENCES), page_params_cache, params_cache_lock, check_client_disconnected)
+            await self._check_disconnect(check_client_disconnected, "After Stop Sequences Adjustment")
+
+        if "top_p" in keys:
+            await self._adjust_top_p(request_params.get('top_p', DEFAULT_TOP_P), check_client_disconnected)
+            await self._check_disconnect(check_client_disconnected, "End Parameter Adjustment")
+
+        if not keys & {"url_context", "thinking_budget_enabled", "thinking_budget", "google_search"}:
+            return
 
         # 确保工具面板已展开，以便调整高级设置
         await self._ensure_tools_panel_expanded(check_client_disconnected)
 
-        # 调整URL CONTEXT
-        if ENABLE_URL_CONTEXT:
+        if "url_context" in keys:
             await self._open_url_content(check_client_disconnected)
-        else:
-            self.logger.info(f"[{self.req_id}] URL Context 功能已禁用，跳过调整。")
 
-        # 调整“思考预算”
-        await self._handle_thinking_budget(request_params, check_client_disconnected)
+        if keys & {"thinking_budget_enabled", "thinking_budget"}:
+            await self._handle_thinking_budget(request_params, check_client_disconnected)
 
-        # 调整 Google Search 开关
-        await self._adjust_google_search(request_params, check_client_disconnected)
+        if "google_search" in keys:
+            await self._adjust_google_search(request_params, check_client_disconnected)
 
     async def _handle_thinking_budget(self, request_params: Dict[str, Any], check_client_disconnected: Callable):
         """处理思考预算的调整逻辑。"""
@@ -361,28 +473,33 @@ class PageController:
                 if isinstance(pw_err, ClientDisconnectedError):
                     raise
 
+    def _clamp_max_tokens(self, max_tokens: int, model_id_to_use: str, parsed_model_list: list) -> int:
+        """按模型支持的最大输出 Token 数限制请求值"""
+        min_val_for_tokens = 1
+        max_val_for_tokens_from_model = 65536
+
+        if model_id_to_use and parsed_model_list:
+            current_model_data = next((m for m in parsed_model_list if m.get("id") == model_id_to_use), None)
+            if current_model_data and current_model_data.get("supported_max_output_tokens") is not None:
+                try:
+                    supported_tokens = int(current_model_data["supported_max_output_tokens"])
+                    if supported_tokens > 0:
+                        max_val_for_tokens_from_model = supported_tokens
+                    else:
+                        self.logger.warning(f"[{self.req_id}] 模型 {model_id_to_use} supported_max_output_tokens 无效: {supported_tokens}")
+                except (ValueError, TypeError):
+                    self.logger.warning(f"[{self.req_id}] 模型 {model_id_to_use} supported_max_output_tokens 解析失败")
+
+        clamped_max_tokens = max(min_val_for_tokens, min(max_val_for_tokens_from_model, max_tokens))
+        if clamped_max_tokens != max_tokens:
+            self.logger.warning(f"[{self.req_id}] 请求的最大输出 Tokens {max_tokens} 超出模型范围，已调整为 {clamped_max_tokens}")
+        return clamped_max_tokens
+
     async def _adjust_max_tokens(self, max_tokens: int, page_params_cache: dict, params_cache_lock: asyncio.Lock, model_id_to_use: str, parsed_model_list: list, check_client_disconnected: Callable):
         """调整最大输出Token参数。"""
         async with params_cache_lock:
             self.logger.info(f"[{self.req_id}] 检查并调整最大输出 Token 设置...")
-            min_val_for_tokens = 1
-            max_val_for_tokens_from_model = 65536
-
-            if model_id_to_use and parsed_model_list:
-                current_model_data = next((m for m in parsed_model_list if m.get("id") == model_id_to_use), None)
-                if current_model_data and current_model_data.get("supported_max_output_tokens") is not None:
-                    try:
-                        supported_tokens = int(current_model_data["supported_max_output_tokens"])
-                        if supported_tokens > 0:
-                            max_val_for_tokens_from_model = supported_tokens
-                        else:
-                            self.logger.warning(f"[{self.req_id}] 模型 {model_id_to_use} supported_max_output_tokens 无效: {supported_tokens}")
-                    except (ValueError, TypeError):
-                        self.logger.warning(f"[{self.req_id}] 模型 {model_id_to_use} supported_max_output_tokens 解析失败")
-
-            clamped_max_tokens = max(min_val_for_tokens, min(max_val_for_tokens_from_model, max_tokens))
-            if clamped_max_tokens != max_tokens:
-                self.logger.warning(f"[{self.req_id}] 请求的最大输出 Tokens {max_tokens} 超出模型范围，已调整为 {clamped_max_tokens}")
+            clamped_max_tokens = self._clamp_max_tokens(max_tokens, model_id_to_use, parsed_model_list)
 
             cached_max_tokens = page_params_cache.get("max_output_tokens")
             if cached_max_tokens is not None and cached_max_tokens == clamped_max_tokens:
@@ -435,17 +552,7 @@ class PageController:
             self.logger.info(f"[{self.req_id}] 检查并设置停止序列...")
 
             # 处理不同类型的stop_sequences输入
-            normalized_requested_stops = set()
-            if stop_sequences is not None:
-                if isinstance(stop_sequences, str):
-                    # 单个字符串
-                    if stop_sequences.strip():
-                        normalized_requested_stops.add(stop_sequences.strip())
-                elif isinstance(stop_sequences, list):
-                    # 字符串列表
-                    for s in stop_sequences:
-                        if isinstance(s, str) and s.strip():
-                            normalized_requested_stops.add(s.strip())
+            normalized_requested_stops = _normalize_stop_sequences(stop_sequences)
 
             cached_stops_set = page_params_cache.get("stop_sequences")
 
@@ -899,7 +1006,6 @@ class PageController:
                 raise
 
             await self._check_disconnect(check_client_disconnected, "After Submit Button Enabled")
-            await asyncio.sleep(0.3)
 
             # 优先回车提交，其次按钮提交，最后组合键提交
             submitted_successfully = await self._try_enter_submit(prompt_textarea_locator, check_client_disconnected)
@@ -1029,6 +1135,17 @@ class PageController:
         raise last_err or Exception("拖放未能在任何候选目标上触发")
 
 
+    async def _wait_for_submission_started(self, original_content: str) -> None:
+        """等待页面接收提交（输入框清空或提交按钮禁用），超时后交由后续验证判断"""
+        try:
+            await self.page.wait_for_function(
+                _SUBMISSION_STARTED_JS,
+                arg=[PROMPT_TEXTAREA_SELECTOR, SUBMIT_BUTTON_SELECTOR, original_content],
+                timeout=_SUBMISSION_STARTED_TIMEOUT_MS,
+            )
+        except TimeoutError:
+            pass
+
     async def _try_enter_submit(self, prompt_textarea_locator, check_client_disconnected: Callable) -> bool:
         """优先使用回车键提交。"""
         import os
@@ -1081,7 +1198,7 @@ class PageController:
                     pass
 
             await self._check_disconnect(check_client_disconnected, "After Enter Press")
-            await asyncio.sleep(2.0)
+            await self._wait_for_submission_started(original_content)
 
             # 验证提交是否成功
             submission_success = False
@@ -1181,7 +1298,7 @@ class PageController:
                     pass
 
             await self._check_disconnect(check_client_disconnected, "After Combo Press")
-            await asyncio.sleep(2.0)
+            await self._wait_for_submission_started(original_content)
 
             submission_success = False
             try:
@@ -1268,3 +1385,59 @@ class PageController:
             if not isinstance(e, ClientDisconnectedError):
                 await save_error_snapshot(f"get_response_error_{self.req_id}")
             raise
+
+    async def stream_response(self, check_client_disconnected: Callable) -> AsyncGenerator[str, None]:
+        """流式获取响应：生成过程中逐段产出页面渲染的文本增量，完成后按最终内容补齐。"""
+        self.logger.info(f"[{self.req_id}] 等待并流式获取响应...")
+
+        response_container_locator = self.page.locator(RESPONSE_CONTAINER_SELECTOR).last
+        response_element_locator = response_container_locator.locator(RESPONSE_TEXT_SELECTOR)
+        dom_stream = DomTextStream(self.page, self.req_id)
+        completion_task: Optional[asyncio.Task] = None
+        try:
+            self.logger.info(f"[{self.req_id}] 等待响应元素附加到DOM...")
+            await expect_async(response_element_locator).to_be_attached(timeout=90000)
+            await self._check_disconnect(check_client_disconnected, "流式获取响应 - 响应元素已附加")
+
+            await dom_stream.start()
+            completion_task = asyncio.create_task(_wait_for_response_completion(
+                self.page,
+                self.page.locator(PROMPT_TEXTAREA_SELECTOR),
+                self.page.locator(SUBMIT_BUTTON_SELECTOR),
+                self.page.locator(EDIT_MESSAGE_BUTTON_SELECTOR),
+                self.req_id,
+                check_client_disconnected,
+                None,
+            ))
+            async for delta in dom_stream.deltas_until(completion_task):
+                yield delta
+
+            if completion_task.result():
+                self.logger.info(f"[{self.req_id}] ✅ 响应完成检测成功")
+            else:
+                self.logger.warning(f"[{self.req_id}] 响应完成检测失败，尝试获取当前内容")
+            await self._check_disconnect(check_client_disconnected, "流式获取响应 - 响应完成后")
+
+            for delta in await dom_stream.stop():
+                yield delta
+            final_content = await _get_final_response_content(self.page, self.req_id, check_client_disconnected)
+            self.final_response_content = final_content
+            tail = dom_stream.completion_tail(final_content)
+            if tail:
+                yield tail
+
+            if not dom_stream.streamed.strip():
+                self.logger.warning(f"[{self.req_id}] ⚠️ 获取到的响应内容为空")
+                await save_error_snapshot(f"empty_response_{self.req_id}")
+            else:
+                self.logger.info(f"[{self.req_id}] ✅ 流式获取响应完成 ({len(dom_stream.streamed)} chars)")
+
+        except Exception as e:
+            self.logger.error(f"[{self.req_id}] ❌ 流式获取响应时出错: {e}")
+            if not isinstance(e, ClientDisconnectedError):
+                await save_error_snapshot(f"stream_response_error_{self.req_id}")
+            raise
+        finally:
+            if completion_task is not None and not completion_task.done():
+                completion_task.cancel()
+            await dom_stream.stop()
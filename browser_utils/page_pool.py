@@ -0,0 +1,354 @@
+# --- browser_utils/page_pool.py ---
+# 多页面池：维护 K 个 AI Studio 页面，按请求租用空闲页面
+
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+from playwright.async_api import Page as AsyncPage
+
+from config import ERROR_TOAST_SELECTOR, ACCOUNT_RATE_LIMIT_PER_MINUTE, ACCOUNT_QUOTA_COOLDOWN_SECONDS, STREAM_CHANNEL_HEADER
+
+from .params_cache import PageParamsCache
+
+logger = logging.getLogger("AIStudioProxyServer")
+
+# 页面错误提示中表示账号被限流/配额耗尽的关键字（小写匹配）
+QUOTA_ERROR_KEYWORDS = (
+    'rate limit',
+    'too many requests',
+    'resource has been exhausted',
+    '限额',
+)
+# HTTP 429 状态码，以及紧邻 quota/rate/配额 的 "exceeded/reached/exhausted" 等表述；
+# 只提到配额的提示（如配额说明）或 "maximum length exceeded" 等无关错误不匹配
+QUOTA_ERROR_PATTERN = re.compile(
+    r"\b429\b"
+    r"|\b(?:quota|rate)\b[\w\s-]{0,20}\b(?:exceeded|reached|exhausted)\b"
+    r"|\b(?:exceeded|reached|exhausted|out of)\b[\w\s]{0,20}\b(?:quota|rate)\b"
+    r"|配额[^，。,.]{0,8}(?:用尽|耗尽|不足|超出|已满|上限)|(?:超出|超过)[^，。,.]{0,8}配额"
+)
+
+
+# 需要附加辅助流通道请求头的请求
+GENERATE_CONTENT_URL_PATTERN = re.compile(r"GenerateContent")
+
+
+def is_quota_error(error_message: Optional[str]) -> bool:
+    if not error_message:
+        return False
+    lowered = error_message.lower()
+    return any(keyword in lowered for keyword in QUOTA_ERROR_KEYWORDS) or bool(QUOTA_ERROR_PATTERN.search(lowered))
+
+
+class AccountStats:
+    """单个账号（认证文件）的请求速率与配额错误统计"""
+
+    RATE_WINDOW_SECONDS = 60.0
+
+    def __init__(self, name: str):
+        self.name = name
+        self.request_times: Deque[float] = deque()
+        self.total_requests = 0
+        self.quota_errors = 0
+        self.other_errors = 0
+        self.consecutive_quota_errors = 0
+        self.cooldown_until = 0.0
+        self.last_error: Optional[str] = None
+
+    def _trim(self, now: float) -> None:
+        while self.request_times and now - self.request_times[0] > self.RATE_WINDOW_SECONDS:
+            self.request_times.popleft()
+
+    def recent_rate(self, now: Optional[float] = None) -> int:
+        """最近一分钟内的请求数"""
+        now = now or time.time()
+        self._trim(now)
+        return len(self.request_times)
+
+    def is_throttled(self, now: Optional[float] = None) -> bool:
+        now = now or time.time()
+        if now < self.cooldown_until:
+            return True
+        if ACCOUNT_RATE_LIMIT_PER_MINUTE > 0 and self.recent_rate(now) >= ACCOUNT_RATE_LIMIT_PER_MINUTE:
+            return True
+        return False
+
+    def record_request(self) -> None:
+        now = time.time()
+        self.request_times.append(now)
+        self.total_requests += 1
+        self._trim(now)
+
+    def record_success(self) -> None:
+        self.consecutive_quota_errors = 0
+
+    def record_error(self, error_message: str) -> None:
+        self.last_error = error_message
+        if is_quota_error(error_message):
+            self.quota_errors += 1
+            self.consecutive_quota_errors += 1
+            # 连续配额错误按指数退避延长冷却时间（上限 8 倍）
+            backoff = ACCOUNT_QUOTA_COOLDOWN_SECONDS * min(2 ** (self.consecutive_quota_errors - 1), 8)
+            self.cooldown_until = time.time() + backoff
+            logger.warning(f"账号 '{self.name}' 检测到配额/限流错误，冷却 {backoff}s: {error_message}")
+        else:
+            self.other_errors += 1
+
+    def to_status(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "name": self.name,
+            "requests_last_minute": self.recent_rate(now),
+            "total_requests": self.total_requests,
+            "quota_errors": self.quota_errors,
+            "other_errors": self.other_errors,
+            "throttled": self.is_throttled(now),
+            "cooldown_remaining_seconds": round(max(0.0, self.cooldown_until - now), 1),
+            "last_error": self.last_error,
+        }
+
+
+class PageSlot:
+    """页面池中的单个页面槽位，持有该页面独立的参数缓存与模型状态。
+
+    槽位 0 为主页面，与 server 中的全局页面状态保持同步（page_instance、
+    page_params_cache、current_ai_studio_model_id），以兼容单页面模式下的既有逻辑。
+    """
+
+    def __init__(
+        self,
+        index: int,
+        page: AsyncPage,
+        params_cache: Optional[PageParamsCache] = None,
+        params_cache_lock: Optional[asyncio.Lock] = None,
+        model_switching_lock: Optional[asyncio.Lock] = None,
+        current_model_id: Optional[str] = None,
+        account: Optional[AccountStats] = None,
+    ):
+        self.index = index
+        self.page = page
+        self.account = account or AccountStats(f"page-{index}")
+        self.params_cache = params_cache if params_cache is not None else PageParamsCache()
+        self.params_cache_lock = params_cache_lock or asyncio.Lock()
+        self.model_switching_lock = model_switching_lock or asyncio.Lock()
+        # 非串行模式下作为该页面的处理锁（无竞争，仅用于保持 worker 中 async with 结构）
+        self.processing_lock = asyncio.Lock()
+        self._current_model_id = current_model_id
+
+        self.busy = False
+        self.current_req_id: Optional[str] = None
+        self.lease_started_at = 0.0
+        self.served_count = 0
+        # 是否已为该页面的 GenerateContent 请求附加辅助流通道请求头
+        self.stream_channel_tagged = False
+        # 会话复用：页面聊天中已包含的对话，以及已提交提示、等待回复的对话
+        self.conversation = None
+        self.pending_conversation = None
+        # 该页面进行中的 GenerateContent 请求数，归零时设置 generate_idle
+        self.generate_inflight = 0
+        self.generate_idle = asyncio.Event()
+        self.generate_idle.set()
+
+    @property
+    def is_primary(self) -> bool:
+        return self.index == 0
+
+    @property
+    def current_model_id(self) -> Optional[str]:
+        if self.is_primary:
+            import server
+            return server.current_ai_studio_model_id
+        return self._current_model_id
+
+    @current_model_id.setter
+    def current_model_id(self, value: Optional[str]) -> None:
+        if self.is_primary:
+            import server
+            server.current_ai_studio_model_id = value
+        self._current_model_id = value
+
+    @property
+    def is_usable(self) -> bool:
+        return bool(self.page) and not self.page.is_closed()
+
+    async def enable_stream_channel_tagging(self) -> bool:
+        """为该页面发出的 GenerateContent 请求附加当前请求 ID，辅助流据此按请求分发增量数据"""
+
+        async def _tag_generate_content(route):
+            req_id = self.current_req_id
+            if not req_id:
+                await route.continue_()
+                return
+            headers = await route.request.all_headers()
+            headers[STREAM_CHANNEL_HEADER] = req_id
+            await route.continue_(headers=headers)
+
+        try:
+            await self.page.route(GENERATE_CONTENT_URL_PATTERN, _tag_generate_content)
+            self.stream_channel_tagged = True
+        except Exception as e:
+            logger.warning(f"页面池: 页面 #{self.index} 设置辅助流通道标记失败: {e}")
+            self.stream_channel_tagged = False
+        return self.stream_channel_tagged
+
+    def track_generate_requests(self) -> None:
+        """监听页面网络事件，记录进行中的 GenerateContent 请求，供请求节奏控制判断页面是否空闲"""
+
+        def _on_request(request) -> None:
+            if GENERATE_CONTENT_URL_PATTERN.search(request.url):
+                self.generate_inflight += 1
+                self.generate_idle.clear()
+
+        def _on_request_done(request) -> None:
+            if GENERATE_CONTENT_URL_PATTERN.search(request.url) and self.generate_inflight > 0:
+                self.generate_inflight -= 1
+                if not self.generate_inflight:
+                    self.generate_idle.set()
+
+        self.page.on("request", _on_request)
+        self.page.on("requestfinished", _on_request_done)
+        self.page.on("requestfailed", _on_request_done)
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "busy": self.busy,
+            "req_id": self.current_req_id,
+            "busy_seconds": round(time.time() - self.lease_started_at, 2) if self.busy else 0,
+            "model_id": self.current_model_id,
+            "served_count": self.served_count,
+            "stream_channel_tagged": self.stream_channel_tagged,
+            "conversation_messages": self.conversation.message_count if self.conversation else 0,
+            "generate_inflight": self.generate_inflight,
+            "params_cache": self.params_cache.to_status(),
+            "is_closed": not self.is_usable,
+            "account": self.account.to_status(),
+        }
+
+
+class PagePool:
+    """页面池：将空闲页面租给请求。
+
+    选择页面时优先使用未被限流且最近请求速率最低的账号；若所有空闲页面的账号都处于
+    限流/冷却状态，则选择冷却最先结束的页面，保证请求不会无限等待。
+    """
+
+    def __init__(self):
+        self.slots: List[PageSlot] = []
+        self._slot_released = asyncio.Event()
+
+    @property
+    def size(self) -> int:
+        return len(self.slots)
+
+    @property
+    def busy_count(self) -> int:
+        return sum(1 for slot in self.slots if slot.busy)
+
+    @property
+    def stream_channels_ready(self) -> bool:
+        """所有页面的辅助流数据均已按请求标记"""
+        return bool(self.slots) and all(slot.stream_channel_tagged for slot in self.slots)
+
+    def add_slot(self, slot: PageSlot) -> PageSlot:
+        self.slots.append(slot)
+        if slot.page:
+            slot.track_generate_requests()
+            slot.params_cache.attach(slot.page)
+        self._slot_released.set()
+        logger.info(f"页面池: 已加入页面 #{slot.index} (账号: {slot.account.name}, 当前容量: {self.size})")
+        return slot
+
+    def _pick_free_slot(self, prefer: Optional[Callable[[PageSlot], bool]] = None) -> Optional[PageSlot]:
+        free_slots = [slot for slot in self.slots if not slot.busy]
+        if not free_slots:
+            return None
+        if prefer is not None:
+            preferred = [slot for slot in free_slots if slot.is_usable and prefer(slot)]
+            if preferred:
+                return preferred[0]
+        usable_slots = [slot for slot in free_slots if slot.is_usable]
+        if not usable_slots:
+            # 页面均已关闭时仍返回页面，由后续页面状态校验快速返回 503
+            return free_slots[0]
+        free_slots = usable_slots
+        now = time.time()
+        healthy = [slot for slot in free_slots if not slot.account.is_throttled(now)]
+        if healthy:
+            return min(healthy, key=lambda slot: (slot.account.recent_rate(now), slot.served_count))
+        return min(free_slots, key=lambda slot: slot.account.cooldown_until)
+
+    async def acquire(self, req_id: str, prefer: Optional[Callable[[PageSlot], bool]] = None) -> PageSlot:
+        """等待并租用一个空闲页面；prefer 命中的空闲页面优先（如已保留该请求对话的页面）。"""
+        while True:
+            slot = self._pick_free_slot(prefer)
+            if slot is not None:
+                break
+            self._slot_released.clear()
+            await self._slot_released.wait()
+        if slot.account.is_throttled():
+            logger.warning(f"[{req_id}] 页面池: 所有空闲账号均处于限流状态，使用冷却最先结束的账号 '{slot.account.name}'")
+        slot.busy = True
+        slot.account.record_request()
+        slot.current_req_id = req_id
+        slot.lease_started_at = time.time()
+        logger.info(f"[{req_id}] 页面池: 租用页面 #{slot.index} (账号: {slot.account.name}, 忙碌: {self.busy_count}/{self.size})")
+        return slot
+
+    def release(self, slot: PageSlot) -> None:
+        """归还页面，供后续请求使用。"""
+        req_id = slot.current_req_id
+        slot.busy = False
+        slot.current_req_id = None
+        slot.served_count += 1
+        self._slot_released.set()
+        logger.info(f"[{req_id}] 页面池: 归还页面 #{slot.index} (忙碌: {self.busy_count}/{self.size})")
+
+    @asynccontextmanager
+    async def lease(self, req_id: str) -> AsyncIterator[PageSlot]:
+        slot = await self.acquire(req_id)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    async def inspect_page_errors(self, slot: PageSlot, req_id: str) -> Optional[str]:
+        """检查页面错误提示并记录到账号统计，返回错误消息（无错误时为 None）"""
+        from .operations import detect_and_extract_page_error
+        error_message = None
+        try:
+            # 先快速计数，避免无错误时 detect_and_extract_page_error 的等待开销
+            if await slot.page.locator(ERROR_TOAST_SELECTOR).count() > 0:
+                error_message = await detect_and_extract_page_error(slot.page, req_id)
+        except Exception as e:
+            logger.warning(f"[{req_id}] 页面池: 检查页面 #{slot.index} 错误提示时出错: {e}")
+        if error_message:
+            slot.account.record_error(error_message)
+        else:
+            slot.account.record_success()
+        return error_message
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "busy": self.busy_count,
+            "idle": self.size - self.busy_count,
+            "throttled_accounts": sum(1 for slot in self.slots if slot.account.is_throttled()),
+            "pages": [slot.to_status() for slot in self.slots],
+        }
+
+    async def close_secondary_pages(self) -> None:
+        """关闭主页面以外的页面及其浏览器上下文（主页面由 _close_page_logic 负责）。"""
+        for slot in self.slots:
+            if slot.is_primary or not slot.page:
+                continue
+            try:
+                await slot.page.context.close()
+                logger.info(f"页面池: 页面 #{slot.index} 的浏览器上下文已关闭")
+            except Exception as close_err:
+                logger.warning(f"页面池: 关闭页面 #{slot.index} 时出错: {close_err}")
@@ -0,0 +1,186 @@
+# --- browser_utils/param_helper.py ---
+# 页面内参数辅助脚本：一次 page.evaluate 应用整组运行参数并读回结果
+
+import logging
+from typing import Any, Dict, Optional
+
+from playwright.async_api import Page as AsyncPage
+
+from config import (
+    TEMPERATURE_INPUT_SELECTOR, MAX_OUTPUT_TOKENS_SELECTOR, STOP_SEQUENCE_INPUT_SELECTOR,
+    MAT_CHIP_REMOVE_BUTTON_SELECTOR, TOP_P_INPUT_SELECTOR, USE_URL_CONTEXT_SELECTOR,
+    SET_THINKING_BUDGET_TOGGLE_SELECTOR, THINKING_BUDGET_INPUT_SELECTOR,
+    GROUNDING_WITH_GOOGLE_SEARCH_TOGGLE_SELECTOR,
+)
+
+logger = logging.getLogger("AIStudioProxyServer")
+
+TOOLS_PANEL_TOGGLE_SELECTOR = 'button[aria-label="Expand or collapse tools"]'
+
+# 通过 _add_init_scripts_to_context 注册为初始化脚本，定义 window.__aistudioParams：
+#   read(selectors)           读取当前参数
+#   apply(selectors, changes) 只应用 changes 中的参数，等待页面更新后返回 {values, errors}
+# 输入框按原生 setter 写入并派发 input/change 事件；开关按 aria-checked 判断是否需要点击；
+# 依赖工具面板的开关在面板展开后等待元素出现（页面内等待，不产生额外往返）。
+PARAM_HELPER_JS = """
+(() => {
+    if (window.__aistudioParams) return;
+    const WAIT_MS = 1500;
+    const frame = () => new Promise((resolve) => requestAnimationFrame(() => setTimeout(resolve, 0)));
+    const find = (selector) => {
+        if (selector.startsWith('//')) {
+            return document.evaluate(selector, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        }
+        return document.querySelector(selector);
+    };
+    const waitFor = async (selector) => {
+        const deadline = performance.now() + WAIT_MS;
+        let element = find(selector);
+        while (!element && performance.now() < deadline) {
+            await frame();
+            element = find(selector);
+        }
+        return element;
+    };
+    const valueSetter = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set;
+    const setValue = (input, value) => {
+        input.focus();
+        valueSetter.call(input, String(value));
+        input.dispatchEvent(new Event('input', {bubbles: true}));
+        input.dispatchEvent(new Event('change', {bubbles: true}));
+        input.blur();
+    };
+    const readNumber = (selector) => {
+        const input = find(selector);
+        if (!input || input.value === '') return null;
+        const value = Number(input.value);
+        return Number.isNaN(value) ? null : value;
+    };
+    const readChecked = (selector) => {
+        const toggle = find(selector);
+        return toggle ? toggle.getAttribute('aria-checked') === 'true' : null;
+    };
+    const chipRows = (s) => Array.from(document.querySelectorAll(s.stopChipRemove))
+        .map((button) => ({button, row: button.closest('mat-chip-row') || button.parentElement}));
+    const readStops = (s) => chipRows(s).map(({row}) => {
+        const clone = row.cloneNode(true);
+        clone.querySelectorAll('button').forEach((button) => button.remove());
+        return clone.textContent.trim();
+    });
+
+    const read = (s) => ({
+        temperature: readNumber(s.temperature),
+        max_output_tokens: readNumber(s.maxOutputTokens),
+        top_p: readNumber(s.topP),
+        stop_sequences: readStops(s),
+        url_context: readChecked(s.urlContext),
+        thinking_budget_enabled: readChecked(s.thinkingBudgetToggle),
+        thinking_budget: readNumber(s.thinkingBudgetInput),
+        google_search: readChecked(s.googleSearch),
+    });
+
+    const apply = async (s, changes) => {
+        const errors = {};
+        const setNumber = (key, selector) => {
+            if (!(key in changes)) return;
+            const input = find(selector);
+            if (input) setValue(input, changes[key]);
+            else errors[key] = 'not found';
+        };
+        setNumber('temperature', s.temperature);
+        setNumber('max_output_tokens', s.maxOutputTokens);
+        setNumber('top_p', s.topP);
+
+        if ('stop_sequences' in changes) {
+            for (const {button} of chipRows(s)) {
+                button.click();
+                await frame();
+            }
+            const input = changes.stop_sequences.length ? find(s.stopInput) : null;
+            if (changes.stop_sequences.length && !input) errors.stop_sequences = 'not found';
+            for (const sequence of input ? changes.stop_sequences : []) {
+                setValue(input, sequence);
+                input.focus();
+                input.dispatchEvent(new KeyboardEvent('keydown', {key: 'Enter', code: 'Enter', keyCode: 13, which: 13, bubbles: true}));
+                await frame();
+            }
+        }
+
+        const toolKeys = ['url_context', 'thinking_budget_enabled', 'thinking_budget', 'google_search'];
+        if (toolKeys.some((key) => key in changes)) {
+            const panelToggle = find(s.toolsPanelToggle);
+            const panel = panelToggle && panelToggle.parentElement && panelToggle.parentElement.parentElement;
+            if (panel && !panel.classList.contains('expanded')) {
+                panelToggle.click();
+                await frame();
+            }
+        }
+        const setToggle = async (key, selector) => {
+            if (!(key in changes)) return;
+            const toggle = await waitFor(selector);
+            if (!toggle) {
+                errors[key] = 'not found';
+                return;
+            }
+            if ((toggle.getAttribute('aria-checked') === 'true') !== changes[key]) {
+                toggle.click();
+                await frame();
+            }
+        };
+        await setToggle('url_context', s.urlContext);
+        await setToggle('thinking_budget_enabled', s.thinkingBudgetToggle);
+        if ('thinking_budget' in changes) {
+            const input = await waitFor(s.thinkingBudgetInput);
+            if (input) setValue(input, changes.thinking_budget);
+            else errors.thinking_budget = 'not found';
+        }
+        await setToggle('google_search', s.googleSearch);
+
+        await frame();
+        return {values: read(s), errors};
+    };
+
+    window.__aistudioParams = {read, apply};
+})()
+"""
+
+_APPLY_JS = """
+([selectors, changes]) => window.__aistudioParams ? window.__aistudioParams.apply(selectors, changes) : null
+"""
+
+_READ_JS = """
+([selectors]) => window.__aistudioParams ? window.__aistudioParams.read(selectors) : null
+"""
+
+HELPER_SELECTORS = {
+    "temperature": TEMPERATURE_INPUT_SELECTOR,
+    "maxOutputTokens": MAX_OUTPUT_TOKENS_SELECTOR,
+    "topP": TOP_P_INPUT_SELECTOR,
+    "stopInput": STOP_SEQUENCE_INPUT_SELECTOR,
+    "stopChipRemove": MAT_CHIP_REMOVE_BUTTON_SELECTOR,
+    "toolsPanelToggle": TOOLS_PANEL_TOGGLE_SELECTOR,
+    "urlContext": USE_URL_CONTEXT_SELECTOR,
+    "thinkingBudgetToggle": SET_THINKING_BUDGET_TOGGLE_SELECTOR,
+    "thinkingBudgetInput": THINKING_BUDGET_INPUT_SELECTOR,
+    "googleSearch": GROUNDING_WITH_GOOGLE_SEARCH_TOGGLE_SELECTOR,
+}
+
+
+async def _evaluate_helper(page: AsyncPage, script: str, arg: list) -> Any:
+    """调用页面辅助脚本；页面中缺少辅助脚本（如注入被禁用）时先注入再调用"""
+    result = await page.evaluate(script, arg)
+    if result is None:
+        logger.info("页面中未找到参数辅助脚本，现场注入。")
+        await page.evaluate(PARAM_HELPER_JS)
+        result = await page.evaluate(script, arg)
+    return result
+
+
+async def apply_parameters(page: AsyncPage, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """在页面内一次性应用参数并返回 {values, errors}"""
+    return await _evaluate_helper(page, _APPLY_JS, [HELPER_SELECTORS, changes])
+
+
+async def read_parameters(page: AsyncPage) -> Optional[Dict[str, Any]]:
+    """一次读取页面当前的全部参数（找不到的控件值为 None）"""
+    return await _evaluate_helper(page, _READ_JS, [HELPER_SELECTORS])
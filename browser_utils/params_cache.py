@@ -0,0 +1,109 @@
+# --- browser_utils/params_cache.py ---
+# 页面参数状态缓存：按页面、按模型记录已在页面上应用并验证过的运行参数
+
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+from playwright.async_api import Page as AsyncPage
+
+from .param_helper import read_parameters
+
+logger = logging.getLogger("AIStudioProxyServer")
+
+# 失效事件
+INVALIDATE_NAVIGATION = "navigation"
+INVALIDATE_MODEL_CHANGE = "model_change"
+INVALIDATE_VERIFY_FAILED = "verify_failed"
+
+
+class ParamsState(dict):
+    """单个模型在页面上的参数状态，键与 PageController._desired_parameters 相同"""
+
+    def __init__(self, owner: "PageParamsCache", model_id: Optional[str]):
+        super().__init__()
+        self.owner = owner
+        self.model_id = model_id
+
+    def invalidate(self, keys: Iterable[str], reason: str) -> None:
+        """只移除指定参数"""
+        dropped = [key for key in keys if self.pop(key, None) is not None]
+        if dropped:
+            self.owner.record_invalidation(reason, len(dropped))
+
+    def update_from_page(self, values: Dict[str, Any]) -> None:
+        """用页面读回的值替换状态（读不到的控件不记录）"""
+        self.clear()
+        for key, value in values.items():
+            if value is None:
+                continue
+            self[key] = set(value) if key == "stop_sequences" else value
+
+
+class PageParamsCache:
+    """一个页面的参数状态缓存，每个模型一份，按具体事件失效而不是整体清空：
+      - 页面重新加载（导航切换模型、错误恢复等）：页面控件恢复初始值，所有模型的状态失效；
+      - 模型切换：目标模型的状态需与页面核对，由辅助脚本一次读取刷新，不逐项操作控件；
+      - 验证失败：只移除读回值与期望不符的参数。
+    新聊天、会话复用等不重新加载页面的操作不影响缓存。
+    """
+
+    def __init__(self):
+        self._states: Dict[Optional[str], ParamsState] = {}
+        self.model_id: Optional[str] = None
+        self.needs_refresh = False
+        self.refreshes = 0
+        self.invalidations: Dict[str, int] = {}
+
+    def state(self, model_id: Optional[str]) -> ParamsState:
+        state = self._states.get(model_id)
+        if state is None:
+            state = self._states[model_id] = ParamsState(self, model_id)
+        return state
+
+    def record_invalidation(self, reason: str, count: int = 1) -> None:
+        self.invalidations[reason] = self.invalidations.get(reason, 0) + count
+
+    def attach(self, page: AsyncPage) -> None:
+        """监听页面重新加载（同文档内的路由变化不会触发）"""
+        page.on("domcontentloaded", lambda _: self.on_navigation())
+
+    def on_navigation(self) -> None:
+        dropped = sum(len(state) for state in self._states.values())
+        self._states.clear()
+        self.needs_refresh = False
+        if dropped:
+            self.record_invalidation(INVALIDATE_NAVIGATION, dropped)
+            logger.info(f"参数缓存: 页面已重新加载，清除 {dropped} 项参数状态")
+
+    def activate(self, model_id: Optional[str], model_switched: bool = False) -> ParamsState:
+        """返回页面当前模型的参数状态；模型发生变化时标记需要与页面核对"""
+        if model_switched or model_id != self.model_id:
+            self.model_id = model_id
+            if self.state(model_id):
+                self.needs_refresh = True
+                self.record_invalidation(INVALIDATE_MODEL_CHANGE)
+        return self.state(model_id)
+
+    async def refresh(self, page: AsyncPage, req_id: str) -> None:
+        """一次读取页面当前参数作为当前模型的状态；读取失败时清空该模型的状态"""
+        state = self.state(self.model_id)
+        self.needs_refresh = False
+        self.refreshes += 1
+        try:
+            values = await read_parameters(page)
+        except Exception as e:
+            logger.warning(f"[{req_id}] 参数缓存: 读取页面参数失败，清除模型 {self.model_id} 的参数状态: {e}")
+            values = None
+        if values is None:
+            state.clear()
+            return
+        state.update_from_page(values)
+        logger.info(f"[{req_id}] 参数缓存: 已按页面当前值刷新模型 {self.model_id} 的参数状态 ({len(state)} 项)")
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "model_id": self.model_id,
+            "models": {str(model_id): len(state) for model_id, state in self._states.items()},
+            "refreshes": self.refreshes,
+            "invalidations": dict(self.invalidations),
+        }
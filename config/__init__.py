@@ -21,6 +21,7 @@ __all__ = [
     'DEFAULT_STOP_SEQUENCES',
     'AI_STUDIO_URL_PATTERN',
     'MODELS_ENDPOINT_URL_CONTAINS',
+    'STREAM_CHANNEL_HEADER',
     'USER_INPUT_START_MARKER_SERVER',
     'USER_INPUT_END_MARKER_SERVER',
     'EXCLUDED_MODELS_FILENAME',
@@ -29,6 +30,7 @@ __all__ = [
     # 超时配置
     'RESPONSE_COMPLETION_TIMEOUT',
     'INITIAL_WAIT_MS_BEFORE_POLLING',
+    'RESPONSE_COMPLETION_SETTLE_MS',
     'POLLING_INTERVAL',
     'POLLING_INTERVAL_STREAM',
     'SILENCE_TIMEOUT_MS',
@@ -41,6 +43,7 @@ __all__ = [
     'CLIPBOARD_READ_TIMEOUT_MS',
     'WAIT_FOR_ELEMENT_TIMEOUT_MS',
     'PSEUDO_STREAM_DELAY',
+    'STREAM_IDLE_TIMEOUT_SECONDS',
     
     # 选择器配置
     'PROMPT_TEXTAREA_SELECTOR',
@@ -67,6 +70,9 @@ __all__ = [
     'TEMPERATURE_INPUT_SELECTOR',
     'USE_URL_CONTEXT_SELECTOR',
     'UPLOAD_BUTTON_SELECTOR',
+    'MODEL_NAME_SELECTOR',
+    'MODEL_SELECTOR_BUTTON_SELECTOR',
+    'MODEL_OPTION_SELECTOR',
     
     # 设置配置
     'DEBUG_LOGS_ENABLED',
@@ -80,8 +86,35 @@ __all__ = [
     'LOG_DIR',
     'APP_LOG_FILE_PATH',
     'NO_PROXY_ENV',
+    'STREAM_TRANSPORT',
+    'STREAM_SHM_RING_SIZE',
+    'STREAM_WILDCARD_CERT',
+    'PLAYWRIGHT_DOM_STREAMING',
+    'SSE_COALESCE_WINDOW_MS',
+    'SSE_COALESCE_MAX_BYTES',
     'ENABLE_SCRIPT_INJECTION',
     'USERSCRIPT_PATH',
+    'PAGE_POOL_SIZE',
+    'CONVERSATION_REUSE_ENABLED',
+    'SINGLEFLIGHT_ENABLED',
+    'QUEUE_MAX_DEPTH_PER_KEY',
+    'QUEUE_TENANT_WEIGHTS',
+    'MODEL_AFFINITY_WINDOW',
+    'MODEL_AFFINITY_MAX_SKIPS',
+    'MODEL_FAST_SWITCH_ENABLED',
+    'ACCOUNT_SHARDING_ENABLED',
+    'ACCOUNT_RATE_LIMIT_PER_MINUTE',
+    'ACCOUNT_QUOTA_COOLDOWN_SECONDS',
+    'PACING_MIN_GAP_SECONDS',
+    'PACING_MAX_GAP_SECONDS',
+    'PACING_READY_TIMEOUT_SECONDS',
+    'RESPONSE_CACHE_ENABLED',
+    'RESPONSE_CACHE_TTL_SECONDS',
+    'RESPONSE_CACHE_MAX_ENTRIES',
+    'RESPONSE_CACHE_MAX_DISK_MB',
+    'RESPONSE_CACHE_DIR',
+    'ATTACHMENT_STORE_MAX_MB',
+    'ATTACHMENT_STORE_MAX_FILES',
 
     # 工具函数
     'get_environment_variable',
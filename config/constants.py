@@ -35,6 +35,10 @@ except (json.JSONDecodeError, TypeError):
 AI_STUDIO_URL_PATTERN = os.environ.get('AI_STUDIO_URL_PATTERN', 'aistudio.google.com/')
 MODELS_ENDPOINT_URL_CONTAINS = os.environ.get('MODELS_ENDPOINT_URL_CONTAINS', "MakerSuiteService/ListModels")
 
+# --- 辅助流通道 ---
+# 页面为 GenerateContent 请求附加的请求头，辅助流据此将增量数据路由到对应请求（需与 stream/interceptors.py 保持一致）
+STREAM_CHANNEL_HEADER = 'x-aistudio-proxy-channel'
+
 # --- 输入标记符 ---
 USER_INPUT_START_MARKER_SERVER = os.environ.get('USER_INPUT_START_MARKER_SERVER', "__USER_INPUT_START__")
 USER_INPUT_END_MARKER_SERVER = os.environ.get('USER_INPUT_END_MARKER_SERVER', "__USER_INPUT_END__")
@@ -48,3 +48,8 @@ SET_THINKING_BUDGET_TOGGLE_SELECTOR = 'button[aria-label="Toggle thinking budget
 THINKING_BUDGET_INPUT_SELECTOR = '//div[contains(@class, "settings-item") and .//p[normalize-space()="Set thinking budget"]]/following-sibling::div//input[@type="number"]'
 # --- Google Search Grounding ---
 GROUNDING_WITH_GOOGLE_SEARCH_TOGGLE_SELECTOR = 'div[data-test-id="searchAsAToolTooltip"] mat-slide-toggle button'
+
+# --- 模型选择器 ---
+MODEL_NAME_SELECTOR = '[data-test-id="model-name"]'
+MODEL_SELECTOR_BUTTON_SELECTOR = 'ms-model-selector button'
+MODEL_OPTION_SELECTOR = 'ms-model-carousel-row button, mat-option'
@@ -49,8 +49,93 @@ def get_int_env(key: str, default: int = 0) -> int:
 # 注意：代理配置现在在 api_utils/app.py 中动态设置，根据 STREAM_PORT 环境变量决定
 NO_PROXY_ENV = os.environ.get('NO_PROXY')
 
+# --- 辅助流传输配置 ---
+# 辅助流代理进程向主进程传递数据的方式：queue (multiprocessing.Queue) 或 shm (共享内存环形缓冲区)
+STREAM_TRANSPORT = get_environment_variable('STREAM_TRANSPORT', 'queue').strip().lower()
+# 共享内存环形缓冲区大小（字节），仅 STREAM_TRANSPORT=shm 时生效
+STREAM_SHM_RING_SIZE = max(64 * 1024, get_int_env('STREAM_SHM_RING_SIZE', 4 * 1024 * 1024))
+# 启动时预签发一张覆盖所有拦截域名的 ECDSA 通配符证书，新连接无需现场生成密钥
+STREAM_WILDCARD_CERT = get_boolean_env('STREAM_WILDCARD_CERT', False)
+
+# --- Playwright 流式输出配置 ---
+# 未启用辅助流时，在页面内监听响应文本并在生成过程中推送增量；关闭后等待完整响应再切片输出（伪流式）。
+# 增量取自渲染文本，代码块等 Markdown 格式会丢失，默认关闭
+PLAYWRIGHT_DOM_STREAMING = get_boolean_env('PLAYWRIGHT_DOM_STREAMING', False)
+
+# --- SSE 输出合并配置 ---
+# 相邻增量在该时间窗口（毫秒）内合并为一个 chunk 发送，0 表示逐个增量发送
+SSE_COALESCE_WINDOW_MS = max(0, get_int_env('SSE_COALESCE_WINDOW_MS', 20))
+# 缓存的增量达到该字节数时立即发送，不等待窗口到期
+SSE_COALESCE_MAX_BYTES = max(1, get_int_env('SSE_COALESCE_MAX_BYTES', 512))
+
 # --- 脚本注入配置 ---
 ENABLE_SCRIPT_INJECTION = get_boolean_env('ENABLE_SCRIPT_INJECTION', True)
 ONLY_COLLECT_CURRENT_USER_ATTACHMENTS = get_boolean_env('ONLY_COLLECT_CURRENT_USER_ATTACHMENTS', False)
 USERSCRIPT_PATH = get_environment_variable('USERSCRIPT_PATH', 'browser_utils/more_modles.js')
 # 注意：MODEL_CONFIG_PATH 已废弃，现在直接从油猴脚本解析模型数据
+
+# --- 并发配置 ---
+# 页面池大小：同时打开的 AI Studio 页面数量，每个页面可并行处理一个请求
+PAGE_POOL_SIZE = max(1, get_int_env('PAGE_POOL_SIZE', 1))
+# 会话复用：请求消息以页面中保留的对话为前缀时只提交新增消息，不再清空聊天并重发完整历史
+CONVERSATION_REUSE_ENABLED = get_boolean_env('CONVERSATION_REUSE_ENABLED', False)
+# 相同请求合并执行：规范化内容相同的并发请求只入队一次，结果（含流式输出）分发给所有等待者
+SINGLEFLIGHT_ENABLED = get_boolean_env('SINGLEFLIGHT_ENABLED', False)
+
+# 请求队列公平调度：每个 API 密钥排队中的最大请求数（0 表示不限制），超过时直接返回 429
+QUEUE_MAX_DEPTH_PER_KEY = get_int_env('QUEUE_MAX_DEPTH_PER_KEY', 0)
+
+
+def _parse_tenant_weights(value: str) -> dict:
+    """解析 "密钥:权重,密钥:权重" 格式的租户权重"""
+    weights = {}
+    for part in value.split(','):
+        key, sep, weight = part.strip().rpartition(':')
+        if not sep or not key:
+            continue
+        try:
+            weights[key] = max(0.1, float(weight))
+        except ValueError:
+            continue
+    return weights
+
+
+# 各 API 密钥的调度权重（默认 1），权重越大每轮可出队的请求越多
+QUEUE_TENANT_WEIGHTS = _parse_tenant_weights(os.environ.get('QUEUE_TENANT_WEIGHTS', ''))
+# 模型亲和调度：出队时在最早入队的 N 个请求中优先选择页面已加载模型的请求（0 表示关闭）
+MODEL_AFFINITY_WINDOW = get_int_env('MODEL_AFFINITY_WINDOW', 8)
+# 单个请求因模型亲和最多被后来的请求越过的次数
+MODEL_AFFINITY_MAX_SKIPS = get_int_env('MODEL_AFFINITY_MAX_SKIPS', 3)
+# 快速切换模型：通过页面内的模型选择器切换，不重新加载页面；验证失败时回退到导航切换。
+# 模型选择器相关选择器尚未在 AI Studio 页面上验证，默认关闭
+MODEL_FAST_SWITCH_ENABLED = get_boolean_env('MODEL_FAST_SWITCH_ENABLED', False)
+
+# 多账号分片：为 auth_profiles/saved 中的每个认证文件创建独立的浏览器上下文与页面
+ACCOUNT_SHARDING_ENABLED = get_boolean_env('ACCOUNT_SHARDING_ENABLED', False)
+# 单个账号每分钟最大请求数（0 表示不限制），超过后调度器优先使用其他账号
+ACCOUNT_RATE_LIMIT_PER_MINUTE = get_int_env('ACCOUNT_RATE_LIMIT_PER_MINUTE', 0)
+# 账号检测到配额/限流错误后的冷却时间（秒），连续错误时按指数延长
+ACCOUNT_QUOTA_COOLDOWN_SECONDS = get_int_env('ACCOUNT_QUOTA_COOLDOWN_SECONDS', 300)
+
+# --- 请求节奏配置 ---
+# 同一页面相邻请求的最小间隔下限与上限（秒）；实际间隔按近期错误自适应，无错误时回落到下限
+PACING_MIN_GAP_SECONDS = max(0.0, float(os.environ.get('PACING_MIN_GAP_SECONDS', '0')))
+PACING_MAX_GAP_SECONDS = max(PACING_MIN_GAP_SECONDS, float(os.environ.get('PACING_MAX_GAP_SECONDS', '10')))
+# 等待页面就绪（上一请求的 GenerateContent 结束）的最长时间（秒），超时后继续处理
+PACING_READY_TIMEOUT_SECONDS = max(0.0, float(os.environ.get('PACING_READY_TIMEOUT_SECONDS', '10')))
+
+# --- 响应缓存配置 ---
+# 缓存确定性请求（temperature 为 0 或指定 seed）的完整回复，命中时不经过页面直接返回
+RESPONSE_CACHE_ENABLED = get_boolean_env('RESPONSE_CACHE_ENABLED', False)
+# 缓存有效期（秒，0 表示不过期）
+RESPONSE_CACHE_TTL_SECONDS = get_int_env('RESPONSE_CACHE_TTL_SECONDS', 86400)
+# 内存层最大条目数（LRU 淘汰）
+RESPONSE_CACHE_MAX_ENTRIES = get_int_env('RESPONSE_CACHE_MAX_ENTRIES', 256)
+# 磁盘层总大小上限（MB，0 表示不使用磁盘层），超过后按访问时间淘汰
+RESPONSE_CACHE_MAX_DISK_MB = get_int_env('RESPONSE_CACHE_MAX_DISK_MB', 256)
+RESPONSE_CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR') or os.path.join(os.path.dirname(__file__), '..', 'response_cache')
+
+# --- 附件存储配置 ---
+# 请求附件按内容摘要保存在 upload_files/store 并跨请求复用；未被引用的文件超过以下上限时按 LRU 淘汰
+ATTACHMENT_STORE_MAX_MB = get_int_env('ATTACHMENT_STORE_MAX_MB', 256)
+ATTACHMENT_STORE_MAX_FILES = get_int_env('ATTACHMENT_STORE_MAX_FILES', 512)
@@ -12,6 +12,7 @@ load_dotenv()
 # --- 响应等待配置 ---
 RESPONSE_COMPLETION_TIMEOUT = int(os.environ.get('RESPONSE_COMPLETION_TIMEOUT', '300000'))  # 5 minutes total timeout (in ms)
 INITIAL_WAIT_MS_BEFORE_POLLING = int(os.environ.get('INITIAL_WAIT_MS_BEFORE_POLLING', '500'))  # ms, initial wait before polling for response completion
+RESPONSE_COMPLETION_SETTLE_MS = int(os.environ.get('RESPONSE_COMPLETION_SETTLE_MS', '500'))  # ms, DOM quiet window for heuristic completion when the edit button never shows
 
 # --- 轮询间隔配置 ---
 POLLING_INTERVAL = int(os.environ.get('POLLING_INTERVAL', '300'))  # ms
@@ -37,4 +38,5 @@ CLIPBOARD_READ_TIMEOUT_MS = int(os.environ.get('CLIPBOARD_READ_TIMEOUT_MS', '300
 WAIT_FOR_ELEMENT_TIMEOUT_MS = int(os.environ.get('WAIT_FOR_ELEMENT_TIMEOUT_MS', '10000'))  # Timeout for waiting for elements like overlays
 
 # --- 流相关配置 ---
-PSEUDO_STREAM_DELAY = float(os.environ.get('PSEUDO_STREAM_DELAY', '0.01'))
\ No newline at end of file
+PSEUDO_STREAM_DELAY = float(os.environ.get('PSEUDO_STREAM_DELAY', '0.01'))
+STREAM_IDLE_TIMEOUT_SECONDS = float(os.environ.get('STREAM_IDLE_TIMEOUT_SECONDS', '30'))  # 辅助流无数据超过该时长视为内部超时
\ No newline at end of file
@@ -78,3 +78,5 @@ class ChatCompletionRequest(BaseModel):
     attachments: Optional[List[Any]] = None
     # MCP per-request endpoint（可选），用于工具调用回退到 MCP 服务
     mcp_endpoint: Optional[str] = None
+    # 队列调度优先级（非标准字段），数值越大越先处理；未提供时读取 X-Priority 请求头
+    priority: Optional[int] = None
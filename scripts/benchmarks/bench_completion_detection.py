@@ -0,0 +1,186 @@
+"""
+响应完成检测延迟基准测试
+
+使用本地静态 HTML 模拟 AI Studio 页面（DOM 结构由 config/selectors.py 中的选择器生成），
+在页面内模拟一次流式生成，对比生成结束到检测返回之间的延迟：
+  - polling:  旧实现，每 0.5 秒往返查询输入框、提交按钮与编辑按钮状态
+  - observer: 页面内 MutationObserver 监听，状态变化时立即判定
+
+场景:
+  - edit:    生成结束后编辑按钮出现（常规完成路径）
+  - no-edit: 编辑按钮始终不出现（启发式完成路径）
+
+用法 (在项目根目录，需要 Playwright 可用的 Chromium):
+    python scripts/benchmarks/bench_completion_detection.py --runs 20
+    python scripts/benchmarks/bench_completion_detection.py --executable-path /path/to/chrome
+"""
+
+import argparse
+import asyncio
+import html
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from playwright.async_api import async_playwright  # noqa: E402
+
+from browser_utils.operations import _poll_for_response_completion, _wait_for_response_completion  # noqa: E402
+from config import (  # noqa: E402
+    EDIT_MESSAGE_BUTTON_SELECTOR,
+    PROMPT_TEXTAREA_SELECTOR,
+    RESPONSE_CONTAINER_SELECTOR,
+    RESPONSE_TEXT_SELECTOR,
+    SUBMIT_BUTTON_SELECTOR,
+)
+
+_COMPOUND_RE = re.compile(r'^([a-zA-Z][\w-]*)?((?:\.[\w-]+|\[[^\]]+\]|:[\w-]+(?:\([^)]*\))?)*)$')
+_ATTR_RE = re.compile(r'\[([\w-]+)(?:="([^"]*)")?\]')
+
+# 页面内模拟一次生成: 提交后输入框清空、提交按钮变为停止按钮，逐块追加正文，
+# 结束时提交按钮禁用并记录时间，随后（可选）显示编辑按钮
+_SIMULATION_JS = """
+window.simulateRun = (selectors, durationMs, chunkMs, editDelayMs) => {
+    const input = document.querySelector(selectors.input);
+    const submit = document.querySelector(selectors.submit);
+    const edit = document.querySelector(selectors.edit);
+    const text = document.querySelector(selectors.response);
+    window.__completedAt = null;
+    input.value = '';
+    submit.disabled = false;
+    edit.style.display = 'none';
+    text.textContent = '';
+    const started = performance.now();
+    const timer = setInterval(() => {
+        text.appendChild(document.createTextNode('token '));
+        if (performance.now() - started >= durationMs) {
+            clearInterval(timer);
+            submit.disabled = true;
+            window.__completedAt = performance.now();
+            if (editDelayMs >= 0) setTimeout(() => { edit.style.display = ''; }, editDelayMs);
+        }
+    }, chunkMs);
+};
+"""
+
+
+def _parse_compound(compound: str) -> tuple:
+    match = _COMPOUND_RE.match(compound)
+    if not match:
+        raise ValueError(f"无法从选择器片段生成元素: {compound}")
+    tag = match.group(1) or "div"
+    rest = match.group(2)
+    classes = re.findall(r'\.([\w-]+)', re.sub(r'\[[^\]]+\]', '', rest))
+    attrs = {name: value or "" for name, value in _ATTR_RE.findall(rest)}
+    if classes:
+        attrs["class"] = " ".join(classes)
+    # 伪类（如 :last-child）不影响节点本身，按去掉伪类后的片段合并相同祖先
+    key = re.sub(r':[\w-]+(?:\([^)]*\))?', '', compound)
+    return key, tag, attrs
+
+
+def build_stand_in_html(selectors: list) -> str:
+    """把后代选择器合并成一棵 DOM 树：相同的祖先片段共用一个节点"""
+    tree: dict = {}
+    for selector in selectors:
+        # 逗号分隔的备选选择器取最长的一个
+        chain = max((alt.strip() for alt in selector.split(",")), key=len).split()
+        node = tree
+        for compound in chain:
+            key, tag, attrs = _parse_compound(compound)
+            node = node.setdefault(key, {"tag": tag, "attrs": attrs, "children": {}})["children"]
+
+    def render(children: dict) -> str:
+        parts = []
+        for child in children.values():
+            attrs = "".join(f' {name}="{html.escape(value)}"' for name, value in child["attrs"].items())
+            parts.append(f"<{child['tag']}{attrs}>{render(child['children'])}</{child['tag']}>")
+        return "".join(parts)
+
+    # 脚本放在 head 中，避免影响 ms-chat-turn:last-child 之类的结构伪类
+    return f"<!DOCTYPE html><html><head><script>{_SIMULATION_JS}</script></head><body>{render(tree)}</body></html>"
+
+
+def _noop_disconnect_check(stage: str) -> bool:
+    return False
+
+
+async def run_once(page, detector, duration_ms: int, chunk_ms: int, edit_delay_ms: int) -> float:
+    selectors = {
+        "input": PROMPT_TEXTAREA_SELECTOR,
+        "submit": SUBMIT_BUTTON_SELECTOR,
+        "edit": EDIT_MESSAGE_BUTTON_SELECTOR,
+        "response": f"{RESPONSE_CONTAINER_SELECTOR} {RESPONSE_TEXT_SELECTOR}",
+    }
+    await page.fill(PROMPT_TEXTAREA_SELECTOR, "hello")
+    await page.evaluate("([s, d, c, e]) => window.simulateRun(s, d, c, e)",
+                        [selectors, duration_ms, chunk_ms, edit_delay_ms])
+    completed = await detector(
+        page,
+        page.locator(PROMPT_TEXTAREA_SELECTOR),
+        page.locator(SUBMIT_BUTTON_SELECTOR),
+        page.locator(EDIT_MESSAGE_BUTTON_SELECTOR),
+        "bench",
+        _noop_disconnect_check,
+        None,
+        timeout_ms=duration_ms + 10000,
+        initial_wait_ms=0,
+    )
+    lag_ms = await page.evaluate("() => window.__completedAt === null ? null : performance.now() - window.__completedAt")
+    if not completed or lag_ms is None:
+        raise SystemExit("检测在模拟生成结束前返回或超时")
+    return lag_ms
+
+
+async def main_async(args) -> None:
+    stand_in = build_stand_in_html([
+        PROMPT_TEXTAREA_SELECTOR,
+        SUBMIT_BUTTON_SELECTOR,
+        f"{RESPONSE_CONTAINER_SELECTOR} {RESPONSE_TEXT_SELECTOR}",
+        EDIT_MESSAGE_BUTTON_SELECTOR,
+    ])
+    detectors = {"polling": _poll_for_response_completion, "observer": _wait_for_response_completion}
+    scenarios = {"edit": args.edit_delay_ms, "no-edit": -1}
+
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True, executable_path=args.executable_path)
+        page = await browser.new_page()
+        await page.set_content(stand_in)
+        for selector in (PROMPT_TEXTAREA_SELECTOR, SUBMIT_BUTTON_SELECTOR, EDIT_MESSAGE_BUTTON_SELECTOR,
+                         RESPONSE_CONTAINER_SELECTOR):
+            if await page.locator(selector).count() != 1:
+                raise SystemExit(f"静态页面中选择器未唯一匹配: {selector}")
+
+        print(f"{'scenario':<10}{'mode':<10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'wall s':>10}")
+        for scenario, edit_delay_ms in scenarios.items():
+            for mode, detector in detectors.items():
+                lags = []
+                started = time.perf_counter()
+                for _ in range(args.runs):
+                    lags.append(await run_once(page, detector, args.duration_ms, args.chunk_ms, edit_delay_ms))
+                wall = time.perf_counter() - started
+                lags.sort()
+                print(f"{scenario:<10}{mode:<10}{statistics.median(lags):>10.1f}"
+                      f"{lags[max(0, int(len(lags) * 0.95) - 1)]:>10.1f}{lags[-1]:>10.1f}{wall:>10.1f}")
+        await browser.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--duration-ms", type=int, default=1500, help="模拟生成时长")
+    parser.add_argument("--chunk-ms", type=int, default=30, help="模拟流式追加正文的间隔")
+    parser.add_argument("--edit-delay-ms", type=int, default=50, help="生成结束后编辑按钮出现的延迟")
+    parser.add_argument("--executable-path", default=None, help="Chromium 可执行文件路径（默认使用 Playwright 自带浏览器）")
+    args = parser.parse_args()
+    # 检测函数的日志输出会淹没结果表
+    logging.getLogger("AIStudioProxyServer").setLevel(logging.ERROR)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
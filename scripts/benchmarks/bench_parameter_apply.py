@@ -0,0 +1,139 @@
+"""
+请求参数调整耗时基准测试
+
+使用本地静态 HTML 模拟 AI Studio 的运行设置面板（温度、最大输出 Token、Top P、停止序列、
+工具面板中的 URL Context / 思考预算 / Google Search 开关），对比每个请求调整参数的耗时：
+  - stepwise: 旧实现，逐项 expect/input_value/fill/sleep/再读取验证，每项多次页面往返
+  - helper:   页面内辅助脚本，一次 page.evaluate 应用变化的参数并读回验证
+
+场景:
+  - changed: 相邻请求交替使用两组参数，每个请求都需要修改全部参数
+  - cached:  每个请求使用相同参数（参数缓存命中）
+
+用法 (在项目根目录，需要 Playwright 可用的 Chromium):
+    python scripts/benchmarks/bench_parameter_apply.py --runs 10
+    python scripts/benchmarks/bench_parameter_apply.py --executable-path /path/to/chrome
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from playwright.async_api import async_playwright  # noqa: E402
+
+from browser_utils.page_controller import PageController  # noqa: E402
+from browser_utils.param_helper import PARAM_HELPER_JS  # noqa: E402
+from browser_utils.params_cache import PageParamsCache, ParamsState  # noqa: E402
+
+# 模拟页面：开关点击后切换 aria-checked，工具面板按钮切换祖父节点的 expanded 类，
+# 停止序列输入框回车后生成带删除按钮的 chip
+_STAND_IN_HTML = """<!DOCTYPE html><html><head><script>
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('button[aria-checked]').forEach((toggle) => {
+        toggle.addEventListener('click', () => {
+            toggle.setAttribute('aria-checked', toggle.getAttribute('aria-checked') === 'true' ? 'false' : 'true');
+        });
+    });
+    const panelToggle = document.querySelector('button[aria-label="Expand or collapse tools"]');
+    panelToggle.addEventListener('click', () => panelToggle.parentElement.parentElement.classList.toggle('expanded'));
+    const chipSet = document.querySelector('mat-chip-set');
+    const stopInput = document.querySelector('input[aria-label="Add stop token"]');
+    stopInput.addEventListener('keydown', (event) => {
+        if (event.key !== 'Enter' || !stopInput.value.trim()) return;
+        const row = document.createElement('mat-chip-row');
+        row.appendChild(document.createTextNode(stopInput.value.trim()));
+        const remove = document.createElement('button');
+        remove.setAttribute('aria-label', 'Remove ' + stopInput.value.trim());
+        remove.textContent = 'cancel';
+        remove.addEventListener('click', () => row.remove());
+        row.appendChild(remove);
+        chipSet.appendChild(row);
+        stopInput.value = '';
+    });
+});
+</script></head><body>
+<ms-slider><input type="number" max="2" value="1"></ms-slider>
+<ms-slider><input type="number" max="1" value="0.95"></ms-slider>
+<input aria-label="Maximum output tokens" type="number" value="8192">
+<mat-chip-set></mat-chip-set>
+<input aria-label="Add stop token">
+<div class="tools"><div><button aria-label="Expand or collapse tools">tools</button></div>
+  <button aria-label="Browse the url context" aria-checked="false">url</button>
+  <button aria-label="Toggle thinking budget between auto and manual" aria-checked="false">budget</button>
+  <div class="settings-item"><p>Set thinking budget</p></div>
+  <div><input type="number" value="0"></div>
+  <div data-test-id="searchAsAToolTooltip"><mat-slide-toggle><button aria-checked="false">search</button></mat-slide-toggle></div>
+</div>
+</body></html>"""
+
+_PARAMETER_SETS = [
+    {"temperature": 0.2, "max_output_tokens": 1024, "top_p": 0.5, "stop": ["END", "STOP"],
+     "reasoning_effort": "low", "tools": [{"google_search_retrieval": {}}]},
+    {"temperature": 1.3, "max_output_tokens": 4096, "top_p": 0.9, "stop": ["###"],
+     "reasoning_effort": "none", "tools": []},
+]
+_ALL_KEYS = {"temperature", "max_output_tokens", "stop_sequences", "top_p",
+             "url_context", "thinking_budget_enabled", "thinking_budget", "google_search"}
+
+
+def _noop_disconnect_check(stage: str) -> bool:
+    return False
+
+
+async def _stepwise(controller: PageController, params: dict, cache: ParamsState, lock: asyncio.Lock) -> None:
+    await controller._adjust_parameters_stepwise(_ALL_KEYS, params, cache, lock, "bench-model", [], _noop_disconnect_check)
+
+
+async def _helper(controller: PageController, params: dict, cache: ParamsState, lock: asyncio.Lock) -> None:
+    await controller.adjust_parameters(params, cache, lock, "bench-model", [], _noop_disconnect_check)
+
+
+async def main_async(args) -> None:
+    modes = {"stepwise": _stepwise, "helper": _helper}
+    scenarios = {"changed": True, "cached": False}
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True, executable_path=args.executable_path)
+        context = await browser.new_context()
+        await context.add_init_script(PARAM_HELPER_JS)
+        page = await context.new_page()
+        await page.set_content(_STAND_IN_HTML)
+        logger = logging.getLogger("AIStudioProxyServer")
+
+        print(f"{'scenario':<10}{'mode':<10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for scenario, alternate in scenarios.items():
+            for mode, adjust in modes.items():
+                cache = PageParamsCache().state("bench-model")
+                lock = asyncio.Lock()
+                # 预热一次，使 cached 场景从已应用的状态开始
+                await adjust(PageController(page, logger, "bench-warmup"), _PARAMETER_SETS[0], cache, lock)
+                durations = []
+                for run in range(args.runs):
+                    params = _PARAMETER_SETS[(run + 1) % 2 if alternate else 0]
+                    controller = PageController(page, logger, f"bench-{run}")
+                    started = time.perf_counter()
+                    await adjust(controller, params, cache, lock)
+                    durations.append((time.perf_counter() - started) * 1000)
+                durations.sort()
+                print(f"{scenario:<10}{mode:<10}{statistics.median(durations):>10.1f}"
+                      f"{durations[max(0, int(len(durations) * 0.95) - 1)]:>10.1f}{durations[-1]:>10.1f}")
+        await browser.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--executable-path", default=None, help="Chromium 可执行文件路径（默认使用 Playwright 自带浏览器）")
+    args = parser.parse_args()
+    # 参数调整的日志输出会淹没结果表
+    logging.getLogger("AIStudioProxyServer").setLevel(logging.ERROR)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+辅助流响应解码基准测试
+
+对比 GenerateContent 响应在不同大小下的解码 + 解析耗时：
+  - legacy:      旧实现，每次读取都对累积的整个响应重新去分块、新建 zlib 解压器并用正则全量解析
+  - incremental: StreamingBodyDecoder + GenerateContentTokenizer，按连接保持解码与扫描状态，
+                 仅处理新到达的字节
+
+默认使用合成的 GenerateContent 响应（gzip + chunked，每个流事件一个分块）；
+也可以通过 --capture 传入抓包得到的原始 HTTP 响应（含响应头）。
+
+用法 (在项目根目录):
+    python scripts/benchmarks/bench_response_decoder.py --sizes 16 64 256 1024
+    python scripts/benchmarks/bench_response_decoder.py --capture logs/capture_1.bin
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from stream.interceptors import HttpInterceptor  # noqa: E402
+
+# 每次 server_reader.read() 返回的字节数，可通过 --read-size 调整
+READ_SIZE = 8192
+
+
+def _build_synthetic_capture(target_kb: int) -> tuple:
+    """构造约 target_kb KB（解压后）的 gzip + chunked GenerateContent 响应，返回 (headers, body, 期望正文)"""
+    compressor = zlib.compressobj(wbits=31)
+    raw = bytearray()
+    expected = []
+    decoded_size = 0
+    index = 0
+    while decoded_size < target_kb * 1024:
+        text = f"token {index} " * 8
+        if index % 5 == 0:
+            payload = [[[[[[None, text, None, None, None, None, None, None, None, None, None, 1]], "model"]]]]
+        else:
+            payload = [[[[[[None, text]], "model"]]]]
+            expected.append(text)
+        event = ("[" if index == 0 else ",") + json.dumps(payload, separators=(",", ":")) + "\n"
+        piece = compressor.compress(event.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        raw += f"{len(piece):x}\r\n".encode() + piece + b"\r\n"
+        decoded_size += len(event)
+        index += 1
+    tail = compressor.compress(b"]") + compressor.flush()
+    raw += f"{len(tail):x}\r\n".encode() + tail + b"\r\n0\r\n\r\n"
+    headers = {"Transfer-Encoding": "chunked", "Content-Encoding": "gzip"}
+    return headers, bytes(raw), "".join(expected)
+
+
+def _load_capture(path: str) -> tuple:
+    with open(path, "rb") as f:
+        data = f.read()
+    headers_end = data.find(b"\r\n\r\n")
+    if headers_end == -1:
+        raise SystemExit(f"{path}: 未找到 HTTP 响应头")
+    headers = {}
+    for line in data[:headers_end].split(b"\r\n")[1:]:
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip()] = value.strip()
+    return headers, data[headers_end + 4:], None
+
+
+def _legacy_decode_chunked(response_body: bytes) -> tuple:
+    chunked_data = bytearray()
+    while True:
+        length_crlf_idx = response_body.find(b"\r\n")
+        if length_crlf_idx == -1:
+            break
+        length = int(response_body[:length_crlf_idx], 16)
+        if length == 0:
+            if response_body.find(b"0\r\n\r\n") != -1:
+                return chunked_data, True
+        if length + 2 > len(response_body):
+            break
+        chunked_data.extend(response_body[length_crlf_idx + 2:length_crlf_idx + 2 + length])
+        if length_crlf_idx + 2 + length + 2 > len(response_body):
+            break
+        response_body = response_body[length_crlf_idx + 2 + length + 2:]
+    return chunked_data, False
+
+
+def _legacy_decompress(compressed_chunk: bytes) -> bytes:
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 32)
+    return decompressor.decompress(compressed_chunk)
+
+
+def _legacy_parse(response_data: bytes) -> dict:
+    resp = {"reason": "", "body": ""}
+    for match in re.findall(rb'\[\[\[null,.*?]],"model"]', response_data):
+        payload = json.loads(match)[0][0]
+        if len(payload) == 2:
+            resp["body"] += payload[1]
+        elif len(payload) > 2:
+            resp["reason"] += payload[1]
+    return resp
+
+
+def run_legacy(body: bytes, read_size: int) -> str:
+    buffer = bytearray()
+    result = {"body": ""}
+    for offset in range(0, len(body), read_size):
+        buffer.extend(body[offset:offset + read_size])
+        decoded, _ = _legacy_decode_chunked(bytes(buffer))
+        result = _legacy_parse(_legacy_decompress(decoded))
+    return result["body"]
+
+
+def run_incremental(interceptor: HttpInterceptor, headers: dict, body: bytes, read_size: int) -> str:
+    state = interceptor.new_response_state(headers)
+    parts = []
+
+    async def feed():
+        for offset in range(0, len(body), read_size):
+            delta = await interceptor.process_response(body[offset:offset + read_size], "", "", state)
+            if delta:
+                parts.append(delta["body"])
+
+    asyncio.run(feed())
+    return "".join(parts)
+
+
+def _time(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256, 1024], help="合成响应解压后大小 (KB)")
+    parser.add_argument("--capture", nargs="*", default=[], help="原始 HTTP 响应抓包文件")
+    parser.add_argument("--read-size", type=int, default=READ_SIZE, help="模拟的单次读取字节数")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    interceptor = HttpInterceptor()
+    cases = [(os.path.basename(path), *_load_capture(path)) for path in args.capture]
+    if not cases:
+        cases = [(f"synthetic {size}KB", *_build_synthetic_capture(size)) for size in args.sizes]
+
+    print(f"{'case':<20}{'wire KB':>10}{'reads':>8}{'legacy ms':>12}{'incr ms':>10}{'speedup':>10}")
+    for name, headers, body, expected in cases:
+        incremental_body = run_incremental(interceptor, headers, body, args.read_size)
+        if expected is not None and incremental_body != expected:
+            raise SystemExit(f"{name}: 增量解码结果与预期不一致")
+        legacy_ms = _time(lambda: run_legacy(body, args.read_size), args.repeat) * 1000
+        incremental_ms = _time(lambda: run_incremental(interceptor, headers, body, args.read_size), args.repeat) * 1000
+        reads = (len(body) + args.read_size - 1) // args.read_size
+        print(f"{name:<20}{len(body) / 1024:>10.1f}{reads:>8}{legacy_ms:>12.1f}{incremental_ms:>10.1f}"
+              f"{legacy_ms / max(incremental_ms, 1e-6):>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+辅助流队列消费者延迟基准测试
+
+对比两种 STREAM_QUEUE 消费方式的首包延迟 (TTFT) 与包间投递延迟：
+  - poll:   旧实现，get_nowait + asyncio.sleep(0.1) 轮询
+  - bridge: StreamQueueBridge，后台线程阻塞读取并投递到 asyncio.Queue
+
+生产者在独立进程中模拟辅助流代理，按固定间隔写入带发送时间戳的 JSON 数据。
+
+用法 (在项目根目录):
+    python scripts/benchmarks/bench_stream_consumer.py --chunks 200 --interval-ms 20
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from api_utils.utils_ext.stream import StreamQueueBridge, _iter_polled_items  # noqa: E402
+
+
+class _QuietLogger:
+    def info(self, *args, **kwargs):
+        pass
+
+
+def _producer(stream_queue, start_delay: float, chunks: int, interval: float) -> None:
+    time.sleep(start_delay)
+    for index in range(chunks):
+        stream_queue.put(json.dumps({"seq": index, "sent_at": time.time(), "done": index == chunks - 1}))
+        time.sleep(interval)
+
+
+async def _consume(mode: str, stream_queue) -> list:
+    latencies = []
+    if mode == "bridge":
+        bridge = StreamQueueBridge(stream_queue, asyncio.get_running_loop())
+        bridge.start()
+
+        async def items():
+            while True:
+                yield await bridge.queue.get()
+    else:
+        bridge = None
+
+        def items():
+            return _iter_polled_items("bench", stream_queue, _QuietLogger())
+
+    try:
+        async for raw in items():
+            data = raw if isinstance(raw, dict) else json.loads(raw)
+            latencies.append((time.time(), time.time() - data["sent_at"]))
+            if data["done"]:
+                break
+    finally:
+        if bridge:
+            bridge.stop()
+    return latencies
+
+
+def _run_once(mode: str, chunks: int, interval_ms: float, start_delay_ms: float) -> dict:
+    stream_queue = multiprocessing.Queue()
+    started_at = time.time()
+    producer = multiprocessing.Process(
+        target=_producer, args=(stream_queue, start_delay_ms / 1000, chunks, interval_ms / 1000)
+    )
+    producer.start()
+    latencies = asyncio.run(_consume(mode, stream_queue))
+    producer.join()
+
+    delays_ms = sorted(latency * 1000 for _, latency in latencies)
+    return {
+        "mode": mode,
+        "ttft_ms": (latencies[0][0] - started_at) * 1000,
+        "mean_ms": statistics.mean(delays_ms),
+        "p50_ms": delays_ms[len(delays_ms) // 2],
+        "p95_ms": delays_ms[int(len(delays_ms) * 0.95) - 1],
+        "max_ms": delays_ms[-1],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="STREAM_QUEUE 消费者延迟基准测试")
+    parser.add_argument("--chunks", type=int, default=200, help="每轮发送的数据条数")
+    parser.add_argument("--interval-ms", type=float, default=20.0, help="生产者发送间隔 (毫秒)")
+    parser.add_argument("--start-delay-ms", type=float, default=250.0, help="生产者首包前的延迟 (毫秒)")
+    args = parser.parse_args()
+
+    print(f"chunks={args.chunks} interval={args.interval_ms}ms start_delay={args.start_delay_ms}ms")
+    print(f"{'mode':<8}{'ttft':>10}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}   (ms)")
+    for mode in ("poll", "bridge"):
+        result = _run_once(mode, args.chunks, args.interval_ms, args.start_delay_ms)
+        print(
+            f"{result['mode']:<8}{result['ttft_ms']:>10.1f}{result['mean_ms']:>10.2f}"
+            f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['max_ms']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+辅助流进程间传输基准测试
+
+对比辅助流代理进程向主进程传递增量数据的两种方式：
+  - queue: multiprocessing.Queue (pickle + feeder 线程 + 管道)
+  - shm:   stream.shm_ring.ShmRingQueue (共享内存环形缓冲区 + 管道门铃)
+
+生产者在独立进程中写入与辅助流增量消息格式一致的 JSON 字符串，消费者阻塞读取并统计
+吞吐量与单条消息的投递延迟。--interval-ms 为 0 时测试突发吞吐，否则模拟按间隔到达的增量。
+
+用法 (在项目根目录):
+    python scripts/benchmarks/bench_stream_transport.py --messages 20000
+    python scripts/benchmarks/bench_stream_transport.py --messages 500 --interval-ms 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from stream.shm_ring import ShmRingQueue  # noqa: E402
+
+
+def _producer(transport, messages: int, body_size: int, interval: float) -> None:
+    body = "x" * body_size
+    for seq in range(messages):
+        transport.put(json.dumps({
+            "seq": seq, "reason": "", "body": body, "function": [],
+            "done": seq == messages - 1, "sent_at": time.perf_counter(),
+        }))
+        if interval:
+            time.sleep(interval)
+
+
+def run(mode: str, messages: int, body_size: int, interval: float) -> dict:
+    transport = ShmRingQueue() if mode == "shm" else multiprocessing.Queue()
+    process = multiprocessing.Process(target=_producer, args=(transport, messages, body_size, interval))
+    latencies = []
+    started = time.perf_counter()
+    process.start()
+    try:
+        while True:
+            data = json.loads(transport.get(timeout=10))
+            latencies.append(time.perf_counter() - data["sent_at"])
+            if data["done"]:
+                break
+        elapsed = time.perf_counter() - started
+    finally:
+        process.join()
+        if mode == "shm":
+            transport.close()
+    latencies.sort()
+    return {
+        "msgs_per_s": messages / elapsed,
+        "p50_us": statistics.median(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--body-size", type=int, default=64, help="每条增量的正文字节数")
+    parser.add_argument("--interval-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'msgs/s':>12}{'p50 us':>12}{'p99 us':>12}")
+    for mode in ("queue", "shm"):
+        result = run(mode, args.messages, args.body_size, args.interval_ms / 1000)
+        print(f"{mode:<8}{result['msgs_per_s']:>12.0f}{result['p50_us']:>12.1f}{result['p99_us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+辅助流代理 TLS 建连基准测试
+
+在本地启动一个模拟 MITM 代理客户端侧的 TLS 服务（替代真实浏览器连接），对比每个新连接
+从准备服务端 SSLContext 到完成 TLS 握手的耗时：
+  - legacy: 旧实现，每次连接都读取并解析 PEM 证书、新建 SSLContext 并从文件加载证书链
+  - cached: CertificateManager.get_server_context，按域名复用内存中的 SSLContext
+
+另外对比首次访问新域名（冷启动）时事件循环的最长阻塞时间：
+  - sync-rsa:  旧实现，在事件循环中同步生成 RSA 2048 证书
+  - async-rsa: get_server_context_async，在线程池中生成证书
+  - wildcard:  启动时预签发的 ECDSA 通配符证书，新域名无需生成密钥
+
+证书与 CA 生成在临时目录中，不会影响项目的 certs 目录。
+
+用法 (在项目根目录):
+    python scripts/benchmarks/bench_tls_handshake.py --connections 200
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import ssl
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from stream.cert_manager import CertificateManager  # noqa: E402
+
+DOMAIN = "alkalimakersuite-pa.clients6.google.com"
+
+
+def legacy_context(cert_manager: CertificateManager, host: str) -> ssl.SSLContext:
+    cert_manager.get_domain_cert(host)
+    ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ssl_context.load_cert_chain(
+        certfile=cert_manager.cert_dir / f"{host}.crt",
+        keyfile=cert_manager.cert_dir / f"{host}.key"
+    )
+    return ssl_context
+
+
+async def run(mode: str, cert_manager: CertificateManager, connections: int) -> list:
+    loop = asyncio.get_running_loop()
+    server_timings = []
+
+    async def handle(reader, writer):
+        started = time.perf_counter()
+        if mode == "legacy":
+            ssl_context = legacy_context(cert_manager, DOMAIN)
+        else:
+            ssl_context = cert_manager.get_server_context(DOMAIN)
+        transport = writer.transport
+        new_transport = await loop.start_tls(transport, transport.get_protocol(), ssl_context, server_side=True)
+        server_timings.append(time.perf_counter() - started)
+        new_transport.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    client_context = ssl.create_default_context(cafile=str(cert_manager.ca_cert_path))
+
+    async with server:
+        for _ in range(connections):
+            _, writer = await asyncio.open_connection("127.0.0.1", port, ssl=client_context, server_hostname=DOMAIN)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ssl.SSLError, ConnectionError):
+                pass
+        # 等待最后一个连接的服务端处理完成
+        while len(server_timings) < connections:
+            await asyncio.sleep(0.01)
+    return server_timings
+
+
+async def measure_cold_stall(mode: str, cert_manager: CertificateManager, hosts: list) -> tuple:
+    """依次为新域名准备 SSLContext，返回 (事件循环最长阻塞 ms, 平均每域名耗时 ms)"""
+    max_lag = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal max_lag
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_lag = max(max_lag, time.perf_counter() - started - 0.001)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    for host in hosts:
+        if mode == "sync-rsa":
+            legacy_context(cert_manager, host)
+            await asyncio.sleep(0)
+        else:
+            await cert_manager.get_server_context_async(host)
+    elapsed = time.perf_counter() - started
+    running = False
+    await ticker_task
+    return max_lag * 1000, elapsed / len(hosts) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--cold-hosts", type=int, default=10, help="冷启动测试的新域名数量")
+    args = parser.parse_args()
+    # 服务端 StreamReaderProtocol 在 TLS 连接关闭时会输出无关的 eof_received 警告
+    logging.getLogger("asyncio").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as cert_dir:
+        cert_manager = CertificateManager(cert_dir)
+        cert_manager.get_domain_cert(DOMAIN)
+
+        print(f"{'mode':<8}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+        for mode in ("legacy", "cached"):
+            timings = sorted(asyncio.run(run(mode, cert_manager, args.connections)))
+            print(f"{mode:<8}{statistics.median(timings) * 1000:>10.2f}"
+                  f"{timings[int(len(timings) * 0.95) - 1] * 1000:>10.2f}"
+                  f"{statistics.mean(timings) * 1000:>10.2f}")
+
+        print()
+        print(f"{'cold':<10}{'max loop stall ms':>20}{'per host ms':>14}")
+        for mode in ("sync-rsa", "async-rsa", "wildcard"):
+            if mode == "wildcard":
+                cert_manager.mint_wildcard_cert(["*.bench.test"])
+            hosts = [f"{mode}-{index}.bench.test" for index in range(args.cold_hosts)]
+            stall_ms, per_host_ms = asyncio.run(measure_cold_stall(mode, cert_manager, hosts))
+            print(f"{mode:<10}{stall_ms:>20.2f}{per_host_ms:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
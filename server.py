@@ -70,7 +70,8 @@ from browser_utils import (
     switch_ai_studio_model,
     load_excluded_models,
     _handle_initial_model_state_and_storage,
-    _set_model_from_page_display
+    _set_model_from_page_display,
+    PageParamsCache,
 )
 
 # --- api_utils模块导入 ---
@@ -91,11 +92,13 @@ from api_utils import (
 # --- stream queue ---
 STREAM_QUEUE:Optional[multiprocessing.Queue] = None
 STREAM_PROCESS = None
+STREAM_BRIDGE = None  # api_utils.utils_ext.stream.StreamQueueBridge，将 STREAM_QUEUE 转发到事件循环
 
 # --- Global State ---
 playwright_manager: Optional[AsyncPlaywright] = None
 browser_instance: Optional[AsyncBrowser] = None
 page_instance: Optional[AsyncPage] = None
+page_pool = None  # browser_utils.PagePool，页面池（槽位 0 即 page_instance）
 is_playwright_ready = False
 is_browser_connected = False
 is_page_ready = False
@@ -117,7 +120,7 @@ request_queue: Optional[Queue] = None
 processing_lock: Optional[Lock] = None
 worker_task: Optional[Task] = None
 
-page_params_cache: Dict[str, Any] = {}
+page_params_cache = PageParamsCache()  # 主页面的参数状态缓存（页面池槽位 0 共用）
 params_cache_lock: Optional[Lock] = None
 
 logger = logging.getLogger("AIStudioProxyServer")
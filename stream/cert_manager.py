@@ -1,19 +1,40 @@
+import asyncio
 import os
 import datetime
+import ssl
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
 from cryptography.hazmat.backends import default_backend
 
 class CertificateManager:
-    def __init__(self, cert_dir='certs'):
+    # Number of ready server-side SSLContexts kept in memory (LRU)
+    CONTEXT_CACHE_SIZE = 128
+    # Domain certificates are re-issued this long before they expire
+    RENEW_BEFORE = datetime.timedelta(days=7)
+    WILDCARD_CERT_NAME = '_wildcard'
+
+    def __init__(self, cert_dir='certs', use_ecdsa=False):
         self.cert_dir = Path(cert_dir)
         self.cert_dir.mkdir(exist_ok=True)
         
         self.ca_key_path = self.cert_dir / 'ca.key'
         self.ca_cert_path = self.cert_dir / 'ca.crt'
+
+        # Issue per-domain certificates with ECDSA keys instead of RSA 2048
+        self.use_ecdsa = use_ecdsa
+
+        # domain -> (SSLContext, certificate expiry); accessed from executor threads
+        self._context_cache = OrderedDict()
+        self._lock = threading.Lock()
+        # (SSLContext, certificate expiry, SAN patterns) of the pre-minted wildcard certificate
+        self._wildcard = None
+        # domain -> future of an in-flight get_server_context job
+        self._pending_contexts = {}
         
         # Generate or load CA certificate
         if not self.ca_cert_path.exists() or not self.ca_key_path.exists():
@@ -94,6 +115,16 @@ class CertificateManager:
                 default_backend()
             )
     
+    @staticmethod
+    def _not_valid_after(cert):
+        not_after = getattr(cert, 'not_valid_after_utc', None)
+        if not_after is None:
+            not_after = cert.not_valid_after.replace(tzinfo=datetime.timezone.utc)
+        return not_after
+
+    def _needs_renewal(self, cert):
+        return self._not_valid_after(cert) - self.RENEW_BEFORE <= datetime.datetime.now(datetime.timezone.utc)
+
     def get_domain_cert(self, domain):
         """Get or generate a certificate for the specified domain"""
         cert_path = self.cert_dir / f"{domain}.crt"
@@ -114,22 +145,134 @@ class CertificateManager:
                     default_backend()
                 )
             
-            return private_key, cert
+            if not self._needs_renewal(cert):
+                return private_key, cert
         
         # Generate new certificate
         return self._generate_domain_cert(domain)
-    
+
+    def get_server_context(self, domain):
+        """
+        Return a ready server-side SSLContext for the domain.
+
+        Contexts are kept in an in-memory LRU, so PEM files are only read and
+        parsed again when the domain was evicted or its certificate is close
+        to expiry. A pre-minted wildcard certificate is used for every domain
+        it covers. May generate a certificate, so call it off the event loop
+        (see get_server_context_async).
+        """
+        context = self._lookup_context(domain)
+        if context is not None:
+            return context
+
+        _, cert = self.get_domain_cert(domain)
+        context = self._load_context(domain)
+        with self._lock:
+            self._context_cache[domain] = (context, self._not_valid_after(cert))
+            self._context_cache.move_to_end(domain)
+            while len(self._context_cache) > self.CONTEXT_CACHE_SIZE:
+                self._context_cache.popitem(last=False)
+        return context
+
+    async def get_server_context_async(self, domain):
+        """
+        Like get_server_context, but loads or generates certificates in an executor
+        so a cold host never blocks other tunnels; concurrent misses share one job
+        """
+        context = self._lookup_context(domain)
+        if context is not None:
+            return context
+
+        pending = self._pending_contexts.get(domain)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = asyncio.ensure_future(loop.run_in_executor(None, self.get_server_context, domain))
+            self._pending_contexts[domain] = pending
+            pending.add_done_callback(lambda _: self._pending_contexts.pop(domain, None))
+        return await asyncio.shield(pending)
+
+    def _lookup_context(self, domain):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            if self._wildcard is not None:
+                context, not_after, patterns = self._wildcard
+                if not_after - self.RENEW_BEFORE > now and self._matches_san(domain, patterns):
+                    return context
+
+            entry = self._context_cache.get(domain)
+            if entry is not None:
+                context, not_after = entry
+                if not_after - self.RENEW_BEFORE > now:
+                    self._context_cache.move_to_end(domain)
+                    return context
+        return None
+
+    def _load_context(self, name):
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(
+            certfile=self.cert_dir / f"{name}.crt",
+            keyfile=self.cert_dir / f"{name}.key"
+        )
+        return context
+
+    @staticmethod
+    def _matches_san(domain, patterns):
+        for pattern in patterns:
+            if pattern.startswith('*.'):
+                # A wildcard covers exactly one label
+                label, _, parent = domain.partition('.')
+                if label and parent == pattern[2:]:
+                    return True
+            elif domain == pattern:
+                return True
+        return False
+
+    @staticmethod
+    def wildcard_sans(intercept_domains, extra_hosts=()):
+        """
+        SAN entries covering the intercept patterns (e.g. '*.google.com' adds
+        '*.google.com' and 'google.com') plus explicitly listed hosts
+        """
+        sans = []
+        for pattern in list(intercept_domains) + list(extra_hosts):
+            candidates = [pattern, pattern[2:]] if pattern.startswith('*.') else [pattern]
+            for candidate in candidates:
+                if candidate and candidate not in sans:
+                    sans.append(candidate)
+        return sans
+
+    def mint_wildcard_cert(self, intercept_domains, extra_hosts=()):
+        """
+        Issue one ECDSA certificate whose SANs cover all intercept patterns and
+        extra hosts, and serve it for every covered domain
+        """
+        sans = self.wildcard_sans(intercept_domains, extra_hosts)
+        if not sans:
+            return None
+        _, cert = self._issue_cert(self.WILDCARD_CERT_NAME, sans, ecdsa=True)
+        context = self._load_context(self.WILDCARD_CERT_NAME)
+        with self._lock:
+            self._wildcard = (context, self._not_valid_after(cert), sans)
+        return sans
+
     def _generate_domain_cert(self, domain):
         """Generate a certificate for the specified domain signed by the CA"""
-        # Generate private key
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
-        )
+        return self._issue_cert(domain, [domain], ecdsa=self.use_ecdsa)
+
+    def _issue_cert(self, name, dns_names, ecdsa=False):
+        """Generate a CA-signed certificate for the DNS names, stored as {name}.crt/.key"""
+        # Generate private key (ECDSA P-256 takes well under a millisecond, RSA 2048 tens of milliseconds)
+        if ecdsa:
+            private_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+        else:
+            private_key = rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=2048,
+                backend=default_backend()
+            )
         
         # Write private key to file
-        key_path = self.cert_dir / f"{domain}.key"
+        key_path = self.cert_dir / f"{name}.key"
         with open(key_path, 'wb') as f:
             f.write(private_key.private_bytes(
                 encoding=serialization.Encoding.PEM,
@@ -143,7 +286,7 @@ class CertificateManager:
             x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "California"),
             x509.NameAttribute(NameOID.LOCALITY_NAME, "San Francisco"),
             x509.NameAttribute(NameOID.ORGANIZATION_NAME, "Proxy Server"),
-            x509.NameAttribute(NameOID.COMMON_NAME, domain),
+            x509.NameAttribute(NameOID.COMMON_NAME, dns_names[0]),
         ])
         
         cert = x509.CertificateBuilder().subject_name(
@@ -159,12 +302,12 @@ class CertificateManager:
         ).not_valid_after(
             datetime.datetime.utcnow() + datetime.timedelta(days=365)
         ).add_extension(
-            x509.SubjectAlternativeName([x509.DNSName(domain)]),
+            x509.SubjectAlternativeName([x509.DNSName(dns_name) for dns_name in dns_names]),
             critical=False
         ).sign(self.ca_key, hashes.SHA256(), default_backend())
         
         # Write certificate to file
-        cert_path = self.cert_dir / f"{domain}.crt"
+        cert_path = self.cert_dir / f"{name}.crt"
         with open(cert_path, 'wb') as f:
             f.write(cert.public_bytes(serialization.Encoding.PEM))
         
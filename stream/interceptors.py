@@ -2,6 +2,213 @@ import json
 import logging
 import re
 import zlib
+from typing import Optional
+
+# Request header the browser pages use to tag GenerateContent calls with the
+# originating request id; must match config.STREAM_CHANNEL_HEADER
+CHANNEL_HEADER = 'x-aistudio-proxy-channel'
+
+
+class StreamingBodyDecoder:
+    """
+    Stateful transfer/content decoder for one HTTP response body.
+
+    Chunked framing is parsed with a memoryview and offsets: chunk data is
+    emitted as soon as it arrives and only an incomplete chunk-size line is
+    carried over to the next read. The zlib decompressor lives for the whole
+    response, so every call returns only the newly decompressed bytes.
+    """
+    def __init__(self, is_chunked: bool = False, content_length: Optional[int] = None, compressed: bool = False):
+        self.is_chunked = is_chunked
+        self.content_length = content_length
+        self.decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 32) if compressed else None
+        self.received = 0  # raw body bytes received
+        self.done = False
+
+        self._carry = b""  # incomplete chunk-size line from the previous read
+        self._chunk_remaining = 0  # data bytes of the current chunk still expected
+        self._crlf_remaining = 0  # bytes of the CRLF after the current chunk still expected
+
+    @classmethod
+    def from_headers(cls, headers: Optional[dict] = None) -> 'StreamingBodyDecoder':
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        try:
+            content_length = int(headers['content-length']) if 'content-length' in headers else None
+        except ValueError:
+            content_length = None
+        return cls(
+            is_chunked='chunked' in headers.get('transfer-encoding', '').lower(),
+            content_length=content_length,
+            compressed=bool(headers.get('content-encoding')),
+        )
+
+    def feed(self, data) -> bytes:
+        """
+        Feed newly received raw bytes and return the newly decoded body bytes
+        """
+        if self.done or not data:
+            return b""
+        self.received += len(data)
+
+        if self.is_chunked:
+            body = self._dechunk(data)
+        else:
+            body = bytes(data)
+            if self.content_length is not None and self.received >= self.content_length:
+                self.done = True
+
+        if self.decompressor is not None:
+            body = self.decompressor.decompress(body)
+            if self.done:
+                body += self.decompressor.flush()
+        return body
+
+    def _dechunk(self, data) -> bytes:
+        source = self._carry + data if self._carry else data
+        self._carry = b""
+        view = memoryview(source)
+        size = len(view)
+        pos = 0
+        out = bytearray()
+        try:
+            while pos < size:
+                if self._chunk_remaining:
+                    take = min(self._chunk_remaining, size - pos)
+                    out += view[pos:pos + take]
+                    pos += take
+                    self._chunk_remaining -= take
+                    if not self._chunk_remaining:
+                        self._crlf_remaining = 2
+                    continue
+
+                if self._crlf_remaining:
+                    take = min(self._crlf_remaining, size - pos)
+                    pos += take
+                    self._crlf_remaining -= take
+                    continue
+
+                line_end = source.find(b"\r\n", pos)
+                if line_end == -1:
+                    self._carry = bytes(view[pos:])
+                    break
+
+                hex_length = bytes(view[pos:line_end]).split(b";", 1)[0].strip()
+                try:
+                    length = int(hex_length, 16)
+                except ValueError as e:
+                    self.done = True
+                    raise ValueError(f"Parsing chunked length failed: {e}") from e
+                pos = line_end + 2
+
+                if length == 0:
+                    # Trailers after the last chunk are ignored
+                    self.done = True
+                    break
+                self._chunk_remaining = length
+        finally:
+            view.release()
+        return bytes(out)
+
+
+class GenerateContentTokenizer:
+    """
+    Incremental tokenizer for the GenerateContent streaming JSON array.
+
+    Tracks the scan position and the start offsets of open brackets across
+    feeds, so every byte is scanned once no matter how the
+    payload is split across reads. Each completed content array
+    (`[[[null,...]],"model"]`) is decoded and returned exactly once.
+    """
+    CONTENT_PREFIX = b'[[[null,'
+    CONTENT_SUFFIX = b',"model"]'
+    # Scanned bytes are dropped from the buffer once they pass this size
+    COMPACT_THRESHOLD = 64 * 1024
+
+    # A string literal (group 1 is empty while it is still unterminated), the
+    # opening of a content array (group 2) or any other bracket
+    _TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*("?)|(\[\[\[null,)|[\[\]{}]', re.DOTALL)
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pos = 0  # next offset in `buffer` to scan
+        # Start offset of each open content array, -1 for every other open bracket
+        self.stack = []
+
+    def feed(self, data) -> list:
+        """
+        Feed newly decoded bytes and return the newly completed content arrays
+        """
+        if data:
+            self.buffer += data
+        buffer = self.buffer
+        size = len(buffer)
+        stack = self.stack
+        completed = []
+        pos = size
+
+        for match in self._TOKEN.finditer(buffer, self.pos):
+            start = match.start()
+            char = buffer[start]
+            if char == 0x22:  # "
+                if not match.group(1):
+                    # Unterminated string split across reads: rescan it on the next feed
+                    pos = start
+                    break
+            elif match.group(2):
+                stack.extend((start, -1, -1))
+            elif char == 0x5B or char == 0x7B:  # [ {
+                if char == 0x5B and size - start < len(self.CONTENT_PREFIX):
+                    # Possibly the beginning of a content array split across reads
+                    pos = start
+                    break
+                stack.append(-1)
+            elif stack:
+                open_start = stack.pop()
+                if open_start >= 0:
+                    end = match.end()
+                    if buffer.endswith(self.CONTENT_SUFFIX, 0, end) and buffer[end - len(self.CONTENT_SUFFIX) - 1] == 0x5D:
+                        try:
+                            completed.append(json.loads(bytes(buffer[open_start:end])))
+                        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                            logging.error(f"Decoding GenerateContent payload failed: {e}")
+
+        self.pos = pos
+        self._compact()
+        return completed
+
+    def _compact(self) -> None:
+        if self.pos < self.COMPACT_THRESHOLD:
+            return
+        # Keep the bytes of open content arrays
+        keep = min((start for start in self.stack if start >= 0), default=self.pos)
+        if keep == 0:
+            return
+        self.stack = [start - keep if start >= 0 else -1 for start in self.stack]
+        del self.buffer[:keep]
+        self.pos -= keep
+
+
+class ResponseStreamState:
+    """
+    Incremental state for one intercepted GenerateContent response.
+
+    Holds the body decoder, the payload tokenizer and the sequence number of
+    the next delta so each read only processes newly arrived bytes.
+    """
+    def __init__(self, headers: Optional[dict] = None, channel: Optional[str] = None):
+        self.decoder = StreamingBodyDecoder.from_headers(headers)
+        self.tokenizer = GenerateContentTokenizer()
+        self.channel = channel  # correlation key taken from the request's CHANNEL_HEADER
+        self.seq = 0  # sequence number of the next emitted delta
+
+    @property
+    def done(self) -> bool:
+        return self.decoder.done
+
+    @done.setter
+    def done(self, value: bool) -> None:
+        self.decoder.done = value
+
 
 class HttpInterceptor:
     """
@@ -51,52 +258,72 @@ class HttpInterceptor:
             # Not JSON or not UTF-8, just pass through
             return request_data
     
-    async def process_response(self, response_data, host, path, headers):
+    @staticmethod
+    def new_response_state(headers: Optional[dict] = None, channel: Optional[str] = None) -> ResponseStreamState:
         """
-        Process the response data before sending to the client
+        Create the incremental decoding state for a new response
         """
-        try:
-            # Handle chunked encoding
-            decoded_data, is_done = self._decode_chunked(bytes(response_data))
-            # Handle gzip encoding
-            decoded_data = self._decompress_zlib_stream(decoded_data)
-            result  = self.parse_response(decoded_data)
-            result["done"] = is_done
-            return result
-        except Exception as e:
-            raise e
+        return ResponseStreamState(headers, channel)
 
-    def parse_response(self, response_data):
-        pattern = rb'\[\[\[null,.*?]],"model"]'
-        matches = []
-        for match_obj in re.finditer(pattern, response_data):
-            matches.append(match_obj.group(0))
+    @staticmethod
+    def pop_channel_header(headers_data: bytes):
+        """
+        Remove CHANNEL_HEADER from raw request headers, returning (headers, channel or None)
+        """
+        marker = b'\r\n' + CHANNEL_HEADER.encode() + b':'
+        start = headers_data.lower().find(marker)
+        if start == -1:
+            return headers_data, None
+        end = headers_data.find(b'\r\n', start + len(marker))
+        channel = bytes(headers_data[start + len(marker):end]).decode('utf-8', 'replace').strip()
+        return headers_data[:start] + headers_data[end:], channel or None
+
+    async def process_response(self, response_data, host, path, state: ResponseStreamState):
+        """
+        Process newly received response bytes and return only the new deltas.
 
+        Returns a dict with `seq`, the new `reason`/`body` text, newly completed
+        `function` calls and `done`, or None if the read produced nothing new.
+        """
+        contents = state.tokenizer.feed(state.decoder.feed(response_data))
+        result = self._build_result(contents)
+        if not (result["reason"] or result["body"] or result["function"] or state.done):
+            return None
+
+        result["seq"] = state.seq
+        result["done"] = state.done
+        if state.channel:
+            result["channel"] = state.channel
+        state.seq += 1
+        return result
+
+    def parse_response(self, response_data):
+        return self._build_result(GenerateContentTokenizer().feed(response_data))
 
+    def _build_result(self, contents: list) -> dict:
+        """
+        Merge decoded content arrays into body, reasoning and function call deltas
+        """
         resp = {
             "reason": "",
             "body": "",
             "function": [],
         }
 
-        # Print each full match
-        for match in matches:
-            json_data = json.loads(match)
-
-            try:
-                payload = json_data[0][0]
-            except Exception as e:
-                continue
-
-            if len(payload)==2: # body
-                resp["body"] = resp["body"] + payload[1]
-            elif len(payload) == 11 and payload[1] is None and type(payload[10]) == list:  # function
-                array_tool_calls = payload[10]
-                func_name = array_tool_calls[0]
-                params = self.parse_toolcall_params(array_tool_calls[1])
-                resp["function"].append({"name":func_name, "params":params})
-            elif len(payload) > 2: # reason
-                resp["reason"] = resp["reason"] + payload[1]
+        for content in contents:
+            for payload in content[0]:
+                if not isinstance(payload, list):
+                    continue
+
+                if len(payload) == 2:  # body
+                    resp["body"] += payload[1]
+                elif len(payload) == 11 and payload[1] is None and type(payload[10]) == list:  # function
+                    array_tool_calls = payload[10]
+                    func_name = array_tool_calls[0]
+                    params = self.parse_toolcall_params(array_tool_calls[1])
+                    resp["function"].append({"name": func_name, "params": params})
+                elif len(payload) > 2:  # reason
+                    resp["reason"] += payload[1]
 
         return resp
 
@@ -122,41 +349,3 @@ class HttpInterceptor:
             return func_params
         except Exception as e:
             raise e
-
-    @staticmethod
-    def _decompress_zlib_stream(compressed_stream):
-        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 32)  # zlib header
-        decompressed = decompressor.decompress(compressed_stream)
-        return decompressed
-
-    @staticmethod
-    def _decode_chunked(response_body: bytes) -> tuple[bytes, bool]:
-        chunked_data = bytearray()
-        while True:
-            # print(' '.join(format(x, '02x') for x in response_body))
-
-            length_crlf_idx = response_body.find(b"\r\n")
-            if length_crlf_idx == -1:
-                break
-
-            hex_length = response_body[:length_crlf_idx]
-            try:
-                length = int(hex_length, 16)
-            except ValueError as e:
-                logging.error(f"Parsing chunked length failed: {e}")
-                break
-
-            if length == 0:
-                length_crlf_idx = response_body.find(b"0\r\n\r\n")
-                if length_crlf_idx != -1:
-                    return chunked_data, True
-
-            if length + 2 > len(response_body):
-                break
-
-            chunked_data.extend(response_body[length_crlf_idx + 2:length_crlf_idx + 2 + length])
-            if length_crlf_idx + 2 + length + 2 > len(response_body):
-                break
-
-            response_body = response_body[length_crlf_idx + 2 + length + 2:]
-        return chunked_data, False
@@ -13,6 +13,8 @@ class ProxyConnector:
     def __init__(self, proxy_url=None):
         self.proxy_url = proxy_url
         self.connector = None
+        # TLS client context for upstream connections through the proxy, built once and reused
+        self._proxy_ssl_context = None
 
         if proxy_url:
             self._setup_connector()
@@ -51,18 +53,23 @@ class ProxyConnector:
             )
             return reader, writer
         else:
-            ssl_context = ssl_module.SSLContext(ssl_module.PROTOCOL_TLS_CLIENT)
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl_module.CERT_NONE
-            ssl_context.minimum_version = ssl_module.TLSVersion.TLSv1_2  # Force TLS 1.2 or higher
-            ssl_context.maximum_version = ssl_module.TLSVersion.TLSv1_3  # Allow TLS 1.3 if supported
-            ssl_context.set_ciphers('DEFAULT@SECLEVEL=2')  # Use secure ciphers
-
             reader, writer = await asyncio.open_connection(
                 host=None,
                 port=None,
                 sock=sock,
-                ssl=ssl_context,
+                ssl=self._get_proxy_ssl_context(),
                 server_hostname=host,
             )
             return reader, writer
+
+    def _get_proxy_ssl_context(self):
+        """Build the upstream TLS client context on first use"""
+        if self._proxy_ssl_context is None:
+            ssl_context = ssl_module.SSLContext(ssl_module.PROTOCOL_TLS_CLIENT)
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl_module.CERT_NONE
+            ssl_context.minimum_version = ssl_module.TLSVersion.TLSv1_2  # Force TLS 1.2 or higher
+            ssl_context.maximum_version = ssl_module.TLSVersion.TLSv1_3  # Allow TLS 1.3 if supported
+            ssl_context.set_ciphers('DEFAULT@SECLEVEL=2')  # Use secure ciphers
+            self._proxy_ssl_context = ssl_context
+        return self._proxy_ssl_context
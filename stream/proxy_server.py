@@ -4,6 +4,8 @@ import json
 import logging
 import ssl
 import multiprocessing
+import queue
+import time
 from pathlib import Path
 
 from stream.cert_manager import CertificateManager
@@ -14,16 +16,26 @@ class ProxyServer:
     """
     Asynchronous HTTPS proxy server with SSL inspection capabilities
     """
-    def __init__(self, host='0.0.0.0', port=3120, intercept_domains=None, upstream_proxy=None, queue: Optional[multiprocessing.Queue]=None):
+    # Longest wait for free queue space before a message is given up
+    ENQUEUE_TIMEOUT_SECONDS = 5.0
+    # Hosts added to the wildcard certificate that the intercept patterns do not
+    # cover (a wildcard only spans one label); this one serves GenerateContent
+    WILDCARD_EXTRA_HOSTS = ('alkalimakersuite-pa.clients6.google.com',)
+
+    def __init__(self, host='0.0.0.0', port=3120, intercept_domains=None, upstream_proxy=None, queue: Optional[multiprocessing.Queue]=None,
+                 wildcard_cert=False):
         self.host = host
         self.port = port
         self.intercept_domains = intercept_domains or []
         self.upstream_proxy = upstream_proxy
         self.queue = queue
+        self.wildcard_cert = wildcard_cert
         
         # Initialize components
-        self.cert_manager = CertificateManager()
+        self.cert_manager = CertificateManager(use_ecdsa=wildcard_cert)
         self.proxy_connector = ProxyConnector(upstream_proxy)
+        # Upstream TLS client context, shared by all intercepted connections
+        self.upstream_ssl_context = ssl.create_default_context()
         
         # Create logs directory
         log_dir = Path('logs')
@@ -32,6 +44,33 @@ class ProxyServer:
         
         # Set up logging
         self.logger = logging.getLogger('proxy_server')
+        # Messages given up because the queue to the API process stayed full or could not hold them
+        self.dropped_messages = 0
+        # The shared memory ring has a single producer: puts are serialized and keep their order
+        self._enqueue_lock = asyncio.Lock()
+
+    async def _enqueue(self, message: dict) -> None:
+        """
+        Hand a message to the API process without blocking the event loop.
+
+        When the queue is full the put waits in an executor for up to
+        ENQUEUE_TIMEOUT_SECONDS. A message that is still not accepted is
+        counted as dropped; the consumer sees the gap in the delta seq.
+        """
+        payload = json.dumps(message)
+        async with self._enqueue_lock:
+            try:
+                try:
+                    self.queue.put(payload, block=False)
+                except queue.Full:
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(
+                        None, lambda: self.queue.put(payload, True, self.ENQUEUE_TIMEOUT_SECONDS)
+                    )
+            except (queue.Full, ValueError) as e:
+                self.dropped_messages += 1
+                reason = "queue full" if isinstance(e, queue.Full) else e
+                self.logger.error(f"Stream message dropped ({reason}), {self.dropped_messages} total")
     
     def should_intercept(self, host):
         """
@@ -87,8 +126,6 @@ class ProxyServer:
         if intercept:
             self.logger.info(f"Sniff HTTPS requests to : {target}")
 
-            self.cert_manager.get_domain_cert(host)
-
             # Send 200 Connection Established to the client
             writer.write(b'HTTP/1.1 200 Connection Established\r\n\r\n')
             await writer.drain()
@@ -103,11 +140,9 @@ class ProxyServer:
                 self.logger.warning(f"Client writer transport is None for {host}:{port} before TLS upgrade. Closing.")
                 return
 
-            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
-            ssl_context.load_cert_chain(
-                certfile=self.cert_manager.cert_dir / f"{host}.crt",
-                keyfile=self.cert_manager.cert_dir / f"{host}.key"
-            )
+            handshake_started = time.perf_counter()
+            # Cached per host; on a miss the certificate is loaded or generated in an executor
+            ssl_context = await self.cert_manager.get_server_context_async(host)
 
             client_protocol = transport.get_protocol()
 
@@ -117,6 +152,7 @@ class ProxyServer:
                 sslcontext=ssl_context,
                 server_side=True
             )
+            self.logger.debug(f"Client TLS setup for {host} took {(time.perf_counter() - handshake_started) * 1000:.1f} ms")
 
             if new_transport is None:
                 self.logger.error(f"loop.start_tls returned None for {host}:{port}, which is unexpected. Closing connection.")
@@ -135,7 +171,7 @@ class ProxyServer:
             # Connect to the target server
             try:
                 server_reader, server_writer = await self.proxy_connector.create_connection(
-                    host, port, ssl=ssl.create_default_context()
+                    host, port, ssl=self.upstream_ssl_context
                 )
                 
                 # Start bidirectional forwarding with interception
@@ -206,10 +242,12 @@ class ProxyServer:
         client_buffer = bytearray()
         server_buffer = bytearray()
         should_sniff = False
+        # Correlation key of the GenerateContent request in flight on this connection
+        request_channel = None
 
         # Parse HTTP headers from client
         async def _process_client_data():
-            nonlocal client_buffer, should_sniff
+            nonlocal client_buffer, should_sniff, request_channel
             
             try:
                 while True:
@@ -241,6 +279,8 @@ class ProxyServer:
                         # Check if we should intercept this request
                         if 'GenerateContent' in path:
                             should_sniff = True
+                            # The channel header only routes deltas inside this process, never forward it
+                            headers_data, request_channel = self.interceptor.pop_channel_header(headers_data)
                             # Process the request body
                             processed_body = await self.interceptor.process_request(
                                 body_data, host, path
@@ -269,6 +309,8 @@ class ProxyServer:
         # Parse HTTP headers from server
         async def _process_server_data():
             nonlocal server_buffer, should_sniff
+            # Incremental decoding state of the GenerateContent response in flight
+            response_state = None
             
             try:
                 while True:
@@ -276,44 +318,65 @@ class ProxyServer:
                     if not data:
                         break
 
-                    server_buffer.extend(data)
-                    if b'\r\n\r\n' in server_buffer:
-                        # Split headers and body
-                        headers_end = server_buffer.find(b'\r\n\r\n') + 4
-                        headers_data = server_buffer[:headers_end]
-                        body_data = server_buffer[headers_end:]
-
-                        # Parse status line and headers
-                        lines = headers_data.split(b'\r\n')
-
-                        # Parse headers
-                        headers = {}
-                        for i in range(1, len(lines)):
-                            if not lines[i]:
-                                continue
-                            try:
-                                key, value = lines[i].decode('utf-8').split(':', 1)
-                                headers[key.strip()] = value.strip()
-                            except ValueError:
-                                continue
+                    # Check if this is a response to a GenerateContent request
+                    if should_sniff or response_state is not None:
+                        body_data = b""
+                        if response_state is None:
+                            server_buffer.extend(data)
+                            if b'\r\n\r\n' in server_buffer:
+                                # Split headers and body
+                                headers_end = server_buffer.find(b'\r\n\r\n') + 4
+                                headers_data = server_buffer[:headers_end]
+                                body_data = bytes(server_buffer[headers_end:])
+                                server_buffer.clear()
+
+                                # Parse status line and headers
+                                lines = headers_data.split(b'\r\n')
+
+                                # Parse headers
+                                headers = {}
+                                for i in range(1, len(lines)):
+                                    if not lines[i]:
+                                        continue
+                                    try:
+                                        key, value = lines[i].decode('utf-8').split(':', 1)
+                                        headers[key.strip()] = value.strip()
+                                    except ValueError:
+                                        continue
+
+                                response_state = self.interceptor.new_response_state(headers, request_channel)
+                        else:
+                            body_data = data
 
-                        # Check if this is a response to a GenerateContent request
-                        if should_sniff:
+                        if response_state is not None and body_data:
                             try:
+                                # Only the newly arrived bytes are decoded; deltas are sent with a sequence number
                                 resp = await self.interceptor.process_response(
-                                    body_data, host, "", headers
+                                    body_data, host, "", response_state
                                 )
 
-                                if self.queue is not None:
-                                    self.queue.put(json.dumps(resp))
+                                if resp is not None and self.queue is not None:
+                                    await self._enqueue(resp)
                             except Exception as e:
                                 # --- FIX: Log the unused exception variable ---
                                 self.logger.error(f"Error during response interception: {e}")
+                                # Terminate the delta stream so the consumer does not wait for its idle timeout
+                                response_state.done = True
+                                if self.queue is not None:
+                                    done_message = {
+                                        "seq": response_state.seq, "reason": "", "body": "", "function": [], "done": True,
+                                    }
+                                    if response_state.channel:
+                                        done_message["channel"] = response_state.channel
+                                    try:
+                                        await self._enqueue(done_message)
+                                    except Exception as put_error:
+                                        self.logger.error(f"Error sending stream done message: {put_error}")
+
+                            if response_state.done:
+                                response_state = None
 
-                    # Not enough data to parse headers, forward as is
                     client_writer.write(data)
-                    if b"0\r\n\r\n" in server_buffer:
-                        server_buffer.clear()
             except Exception as e:
                 self.logger.error(f"Error processing server data: {e}")
             finally:
@@ -332,6 +395,14 @@ class ProxyServer:
         """
         Start the proxy server
         """
+        if self.wildcard_cert:
+            # Pre-mint before accepting connections so no tunnel pays for key generation
+            loop = asyncio.get_running_loop()
+            sans = await loop.run_in_executor(
+                None, self.cert_manager.mint_wildcard_cert, self.intercept_domains, self.WILDCARD_EXTRA_HOSTS
+            )
+            self.logger.info(f"Pre-minted ECDSA wildcard certificate for: {sans}")
+
         server = await asyncio.start_server(
             self.handle_client, self.host, self.port
         )
@@ -0,0 +1,179 @@
+import multiprocessing
+import queue
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+
+class ShmRingQueue:
+    """
+    Single-producer/single-consumer ring buffer in shared memory.
+
+    A drop-in replacement for the multiprocessing.Queue between the stream
+    proxy process and the API process: `put`/`get`/`get_nowait` accept and
+    return str (or bytes) items. Items are written as length-prefixed frames
+    into a shared memory ring, so there is no pickling and no feeder thread.
+    A pipe doorbell wakes the consumer, and is only rung while the consumer
+    has flagged itself as waiting.
+
+    The ring is lock-free: only the producer advances the write index and
+    only the consumer advances the read index. Both are monotonically
+    increasing byte counters stored in the header.
+    """
+    HEADER_SIZE = 64
+    _WRITE_OFFSET = 0
+    _READ_OFFSET = 32  # separate cache line from the write index
+    _WAITING_OFFSET = 40  # set by the consumer before it blocks on the doorbell
+    _DROPPED_OFFSET = 48  # frames rejected by a full ring, written by the producer only
+    # Upper bound of a single doorbell wait, covers a doorbell missed by the waiting flag race
+    _MAX_DOORBELL_WAIT = 0.05
+    _INDEX = struct.Struct('<Q')
+    _FRAME = struct.Struct('<IB')  # payload length, payload type
+    _TYPE_BYTES = 0
+    _TYPE_STR = 1
+
+    def __init__(self, capacity: int = 4 * 1024 * 1024):
+        self.capacity = capacity
+        self._shm = shared_memory.SharedMemory(create=True, size=self.HEADER_SIZE + capacity)
+        self._buf = self._shm.buf
+        self._INDEX.pack_into(self._buf, self._WRITE_OFFSET, 0)
+        self._INDEX.pack_into(self._buf, self._READ_OFFSET, 0)
+        self._INDEX.pack_into(self._buf, self._WAITING_OFFSET, 0)
+        self._INDEX.pack_into(self._buf, self._DROPPED_OFFSET, 0)
+        self._doorbell_reader, self._doorbell_writer = multiprocessing.Pipe(duplex=False)
+        self._owner = True
+
+    def __getstate__(self):
+        return {
+            'capacity': self.capacity,
+            'name': self._shm.name,
+            'doorbell_reader': self._doorbell_reader,
+            'doorbell_writer': self._doorbell_writer,
+        }
+
+    def __setstate__(self, state):
+        self.capacity = state['capacity']
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._buf = self._shm.buf
+        self._doorbell_reader = state['doorbell_reader']
+        self._doorbell_writer = state['doorbell_writer']
+        self._owner = False
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def _load(self, offset: int) -> int:
+        return self._INDEX.unpack_from(self._buf, offset)[0]
+
+    def _copy_in(self, index: int, data) -> None:
+        start = self.HEADER_SIZE + index % self.capacity
+        first = min(len(data), self.HEADER_SIZE + self.capacity - start)
+        self._buf[start:start + first] = data[:first]
+        if first < len(data):
+            self._buf[self.HEADER_SIZE:self.HEADER_SIZE + len(data) - first] = data[first:]
+
+    def _copy_out(self, index: int, size: int) -> bytes:
+        start = self.HEADER_SIZE + index % self.capacity
+        first = min(size, self.HEADER_SIZE + self.capacity - start)
+        data = bytes(self._buf[start:start + first])
+        if first < size:
+            data += bytes(self._buf[self.HEADER_SIZE:self.HEADER_SIZE + size - first])
+        return data
+
+    def qsize(self) -> int:
+        return self._load(self._WRITE_OFFSET) - self._load(self._READ_OFFSET)
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    @property
+    def dropped(self) -> int:
+        """Number of frames rejected because the ring was full"""
+        return self._load(self._DROPPED_OFFSET)
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = 1.0) -> None:
+        """
+        Append one frame; waits up to `timeout` seconds for free space.
+
+        The wait sleeps the calling thread, so producers running on an event
+        loop must pass block=False. A frame that does not fit raises
+        queue.Full and is counted in `dropped`.
+        """
+        if isinstance(item, str):
+            payload, item_type = item.encode('utf-8'), self._TYPE_STR
+        else:
+            payload, item_type = bytes(item), self._TYPE_BYTES
+        frame = self._FRAME.pack(len(payload), item_type) + payload
+        if len(frame) > self.capacity:
+            raise ValueError(f"Frame of {len(frame)} bytes exceeds ring capacity {self.capacity}")
+
+        write_index = self._load(self._WRITE_OFFSET)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.capacity - (write_index - self._load(self._READ_OFFSET)) < len(frame):
+            if not block or (deadline is not None and time.monotonic() >= deadline):
+                self._INDEX.pack_into(self._buf, self._DROPPED_OFFSET, self.dropped + 1)
+                raise queue.Full
+            time.sleep(0.001)
+
+        self._copy_in(write_index, frame)
+        # Publish the frame only after its bytes are in place
+        self._INDEX.pack_into(self._buf, self._WRITE_OFFSET, write_index + len(frame))
+        if self._load(self._WAITING_OFFSET):
+            try:
+                self._doorbell_writer.send_bytes(b'')
+            except (OSError, ValueError):
+                pass
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        """
+        Pop one frame; blocks on the doorbell until a frame arrives or `timeout` expires
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            read_index = self._load(self._READ_OFFSET)
+            if self._load(self._WRITE_OFFSET) != read_index:
+                break
+            if not block:
+                raise queue.Empty
+            wait = self._MAX_DOORBELL_WAIT
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Empty
+                wait = min(wait, remaining)
+            self._INDEX.pack_into(self._buf, self._WAITING_OFFSET, 1)
+            try:
+                # Re-check after raising the flag so a frame published in between is not missed
+                if self._load(self._WRITE_OFFSET) == read_index and self._doorbell_reader.poll(wait):
+                    self._drain_doorbell()
+            finally:
+                self._INDEX.pack_into(self._buf, self._WAITING_OFFSET, 0)
+
+        size, item_type = self._FRAME.unpack(self._copy_out(read_index, self._FRAME.size))
+        payload = self._copy_out(read_index + self._FRAME.size, size)
+        self._INDEX.pack_into(self._buf, self._READ_OFFSET, read_index + self._FRAME.size + size)
+        return payload.decode('utf-8') if item_type == self._TYPE_STR else payload
+
+    def get_nowait(self) -> Any:
+        return self.get(block=False)
+
+    def _drain_doorbell(self) -> None:
+        try:
+            while self._doorbell_reader.poll(0):
+                self._doorbell_reader.recv_bytes()
+        except (EOFError, OSError):
+            pass
+
+    def close(self) -> None:
+        """
+        Detach from the shared memory; the creating process also unlinks it
+        """
+        self._buf = None
+        try:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+        except (FileNotFoundError, BufferError):
+            pass